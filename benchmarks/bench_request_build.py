@@ -0,0 +1,69 @@
+"""Measure request body build time per round on a long session.
+
+Usage: python3 -m benchmarks.bench_request_build [--messages 200] [--tool-bytes 4000]
+
+Replays a session that grows by one tool call and its result per round and
+times building the request body, once with a full `json.dumps` of the payload
+every round (as before) and once with `RequestBuilder`, which only encodes the
+messages added since the previous round.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import src.agent  # noqa: F401 - registers the agent's own tools
+from src.request_builder import RequestBuilder
+from src.tools import tool_specs
+
+
+def make_session(count: int, tool_bytes: int) -> list[dict]:
+    output = ("line of file content, 中文内容 " * (tool_bytes // 32 + 1))[:tool_bytes]
+    history: list[dict] = [{"role": "user", "content": "Refactor the parser module."}]
+    for i in range(count // 2):
+        call = {
+            "id": f"call_{i}",
+            "type": "function",
+            "function": {"name": "read_file", "arguments": json.dumps({"path": f"src/module_{i}.py"})},
+        }
+        history.append({"role": "assistant", "content": "", "tool_calls": [call]})
+        history.append({"role": "tool", "tool_call_id": call["id"], "content": output})
+    return history
+
+
+def run(history: list[dict], tools: list[dict], encode) -> list[float]:
+    system = {"role": "system", "content": "You are a helpful assistant."}
+    timings = []
+    for rounds in range(1, len(history) + 1):
+        body = {"model": "bench/model", "messages": [system, *history[:rounds]], "temperature": 0.2, "tools": tools}
+        start = time.perf_counter()
+        encode(body)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--tool-bytes", type=int, default=4000)
+    args = parser.parse_args()
+
+    history = make_session(args.messages, args.tool_bytes)
+    tools = tool_specs()
+    builder = RequestBuilder()
+    full = run(history, tools, lambda body: json.dumps(body).encode("utf-8"))
+    incremental = run(history, tools, builder.build)
+
+    print(f"messages: {len(history)}, tool output: {args.tool_bytes} bytes")
+    for label, timings in (("full json.dumps", full), ("RequestBuilder", incremental)):
+        print(
+            f"  {label:16s} last round {timings[-1] * 1000:7.3f} ms"
+            f"  mean {sum(timings) / len(timings) * 1000:7.3f} ms"
+            f"  session total {sum(timings) * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Measure indexed workspace search against a full rescan of every file.
+
+Usage: python3 -m benchmarks.bench_search [--files 5000] [--lines 200]
+
+Builds a synthetic source tree, then times: a grep-style scan that reads
+every file per query (what `run_shell` grep costs), the first indexed query
+(builds the trigram index), a query from a fresh process served by the
+on-disk index, and repeated queries in a warm session.
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from src.workspace_index import WorkspaceIndex
+
+QUERIES = ["handler_4242", "def process_", "TODO(perf)", "import json"]
+
+
+def make_tree(root: Path, files: int, lines: int) -> None:
+    for i in range(files):
+        path = root / f"pkg{i % 50:02d}" / f"mod{i:05d}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        body = [f"# module {i}\n", "import os\n"]
+        body += [f"def process_{i}_{j}(value):\n    return value * {j}  # handler_{i * 10 + j % 10}\n" for j in range(lines // 2)]
+        if i % 97 == 0:
+            body.append("# TODO(perf): cache this\n")
+        path.write_text("".join(body), encoding="utf-8")
+
+
+def full_scan(root: Path, pattern: str) -> int:
+    compiled = re.compile(re.escape(pattern), re.IGNORECASE)
+    hits = 0
+    for path in root.rglob("*.py"):
+        hits += sum(1 for line in path.read_text(encoding="utf-8").splitlines() if compiled.search(line))
+    return hits
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "ws"
+        index_path = Path(tmp) / "index.json"
+        make_tree(root, args.files, args.lines)
+
+        scan = sum(timed(lambda q=q: full_scan(root, q)) for q in QUERIES) / len(QUERIES)
+        index = WorkspaceIndex(root, index_path)
+        cold = timed(lambda: index.search(QUERIES[0]))
+        index.save()
+        start = time.perf_counter()
+        fresh = WorkspaceIndex(root, index_path)
+        fresh.search(QUERIES[0])
+        reload = time.perf_counter() - start
+        warm = sum(timed(lambda q=q: fresh.search(q)) for q in QUERIES) / len(QUERIES)
+
+    print(f"files: {args.files} x {args.lines} lines")
+    for label, seconds in (
+        ("full scan per query", scan),
+        ("first query (build index)", cold),
+        ("new session (index on disk)", reload),
+        ("warm query (mean)", warm),
+    ):
+        print(f"  {label + ':':29s}{seconds * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
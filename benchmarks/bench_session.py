@@ -0,0 +1,81 @@
+"""Measure session logging, resume and fork on a long synthetic session.
+
+Usage: python3 -m benchmarks.bench_session [--turns 5000] [--tool-chars 2000] [--budget 100000]
+
+Writes a session of `--turns` turns (user prompt, tool call, tool result,
+answer) through `SessionLog`, then times: parsing the whole log (what a
+resume without the index would cost), an indexed resume limited to the
+context budget, resuming everything through the index, forking at the
+middle turn, and listing the session.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from src.session_log import RESUME_BYTES_PER_TOKEN, SessionLog, fork_session, list_sessions, load_session
+
+
+def write_session(directory: Path, turns: int, tool_chars: int) -> tuple[Path, float]:
+    log = SessionLog.create(directory)
+    start = time.perf_counter()
+    for i in range(turns):
+        log.begin_turn()
+        log.append({"role": "user", "content": f"turn {i}: read module {i} and sum its numbers"})
+        call = {"id": f"call_{i}", "type": "function", "function": {"name": "read_file", "arguments": json.dumps({"path": f"m{i}.py"})}}
+        log.append({"role": "assistant", "content": "", "tool_calls": [call]})
+        log.append({"role": "tool", "tool_call_id": f"call_{i}", "content": f"x = {i}\n" * (tool_chars // 8)})
+        log.append({"role": "assistant", "content": f"The sum for module {i} is {i * 3}."})
+        log.sync()  # the agent syncs at the end of every turn
+    elapsed = time.perf_counter() - start
+    log.close()
+    return log.path, elapsed
+
+
+def timed(fn, repeat: int = 5) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--tool-chars", type=int, default=2000)
+    parser.add_argument("--budget", type=int, default=100_000, help="context budget in tokens")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        path, write_s = write_session(directory, args.turns, args.tool_chars)
+        size = path.stat().st_size
+        print(f"session: {args.turns} turns, {size / 1e6:.1f} MB; logged in {write_s * 1000:.0f} ms "
+              f"({write_s / args.turns * 1e6:.0f} us/turn incl. fsync)")
+
+        def full_parse() -> int:
+            with path.open("rb") as handle:
+                return sum(1 for line in handle if line.strip() and json.loads(line))
+
+        rows = [
+            ("parse whole log", timed(full_parse)),
+            ("resume (context budget)", timed(lambda: load_session(path, args.budget * RESUME_BYTES_PER_TOKEN))),
+            ("resume (everything)", timed(lambda: load_session(path))),
+            ("fork at middle turn", timed(lambda: fork_session(path, args.turns // 2, directory / "forks"), repeat=1)),
+            ("list sessions", timed(lambda: list_sessions(directory))),
+        ]
+        for name, (seconds, result) in rows:
+            detail = ""
+            if isinstance(result, tuple):
+                detail = f"  ({len(result[0])} messages, {result[1]} turns left on disk)"
+            print(f"  {name:26s} {seconds * 1000:9.2f} ms{detail}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Measure skill discovery time with many synthetic skills.
+
+Usage: python3 -m benchmarks.bench_skills [--count 10000] [--body-bytes 4000]
+
+Compares a full parse of every SKILL.md (no index, as before the index was
+added) with a warm start served from the on-disk index, and an incremental
+rescan after touching a single skill.
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from src.skill_loader import SkillLoader
+
+
+def make_skills(root: Path, count: int, body_bytes: int) -> None:
+    body = ("Follow these synthetic instructions carefully. " * (body_bytes // 48 + 1))[:body_bytes]
+    for i in range(count):
+        skill_dir = root / f"group-{i % 100:02d}" / f"skill-{i:05d}"
+        skill_dir.mkdir(parents=True)
+        (skill_dir / "SKILL.md").write_text(
+            f"---\nname: skill-{i:05d}\ndescription: Synthetic skill number {i} for startup benchmarks.\n---\n{body}\n",
+            encoding="utf-8",
+        )
+
+
+def timed_discover(skills_dir: Path, index_path: Path) -> tuple[float, int]:
+    start = time.perf_counter()
+    loader = SkillLoader(str(skills_dir), index_path=index_path)
+    skills = loader.discover_skills()
+    return time.perf_counter() - start, len(skills)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=10_000)
+    parser.add_argument("--body-bytes", type=int, default=4000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        skills_dir = root / "skills"
+        index_path = root / "index.json"
+        make_skills(skills_dir, args.count, args.body_bytes)
+
+        cold, found = timed_discover(skills_dir, index_path)
+        warm, _found = timed_discover(skills_dir, index_path)
+        (skills_dir / "group-00" / "skill-00000" / "SKILL.md").write_text(
+            "---\nname: skill-00000\ndescription: Edited.\n---\nnew body\n", encoding="utf-8"
+        )
+        incremental, _found = timed_discover(skills_dir, index_path)
+
+    print(f"skills: {found}")
+    print(f"  cold (parse every file): {cold * 1000:8.1f} ms")
+    print(f"  warm (index hit):        {warm * 1000:8.1f} ms")
+    print(f"  one file changed:        {incremental * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Check that `python -m src.main` reaches its first turn within a time budget.
+
+Usage: python3 -m benchmarks.bench_startup [--runs 10] [--budget-ms 250] [-- CLI ARGS...]
+
+Each run is a fresh interpreter that stops right before the first model call
+(`AGENT_PROFILE_STARTUP=1`), so the time covers interpreter start, imports,
+config, client, skills and agent construction. The median is compared with
+the budget and the exit status is 1 when it is over, for use in CI. A bare
+`python -c pass` is timed as well to show the interpreter's own share.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from src.startup import PHASES_PREFIX, PROFILE_ENV
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def run_once(command: list[str], env: dict[str, str]) -> tuple[float, list[dict]]:
+    start = time.perf_counter()
+    child = subprocess.run(command, cwd=ROOT, env=env, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if child.returncode != 0:
+        raise SystemExit(f"{' '.join(command)} failed:\n{child.stderr}")
+    phases = [json.loads(line[len(PHASES_PREFIX) :]) for line in child.stderr.splitlines() if line.startswith(PHASES_PREFIX)]
+    return elapsed, phases[0] if phases else []
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=250.0)
+    parser.add_argument("cli_args", nargs="*", help="arguments passed to src.main (after --)")
+    args = parser.parse_args()
+
+    env = {**os.environ, PROFILE_ENV: "1"}
+    env.setdefault("OPENROUTER_API_KEY", "bench-startup")
+    command = [sys.executable, "-m", "src.main", *args.cli_args]
+    run_once(command, env)  # warm the OS page cache and .pyc files
+
+    samples = []
+    phase_ms: dict[str, list[float]] = {}
+    for _ in range(max(1, args.runs)):
+        elapsed, phases = run_once(command, env)
+        samples.append(elapsed)
+        for phase in phases:
+            phase_ms.setdefault(phase["phase"], []).append(phase["ms"])
+    bare = statistics.median(run_once([sys.executable, "-c", "pass"], env)[0] for _ in range(max(1, args.runs)))
+
+    median = statistics.median(samples) * 1000
+    print(f"cold start to first turn: median {median:.1f} ms, max {max(samples) * 1000:.1f} ms ({len(samples)} runs)")
+    print(f"  bare interpreter:       {bare * 1000:.1f} ms")
+    for name, values in phase_ms.items():
+        print(f"  {name:22s}  {statistics.median(values):.1f} ms")
+    if median > args.budget_ms:
+        print(f"FAIL: over the {args.budget_ms:.0f} ms budget")
+        raise SystemExit(1)
+    print(f"ok: within the {args.budget_ms:.0f} ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compare model rounds per second with and without connection pooling.
+
+Usage: python3 -m benchmarks.bench_transport [--rounds 200] [--delay-ms 0]
+
+A local stub `/chat/completions` server returns a canned reply. The stub
+speaks plain HTTP, so the numbers only show the TCP connect/teardown cost;
+against a real HTTPS endpoint the TLS handshake makes the gap much larger.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.openrouter_client import OpenRouterClient
+
+CANNED_REPLY = json.dumps(
+    {"choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+).encode("utf-8")
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay = 0.0
+
+    def do_POST(self) -> None:  # noqa: N802 - http.server naming
+        length = int(self.headers.get("Content-Length", "0"))
+        self.rfile.read(length)
+        if self.delay:
+            time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(CANNED_REPLY)))
+        self.end_headers()
+        self.wfile.write(CANNED_REPLY)
+
+    def log_message(self, format: str, *args: object) -> None:
+        return
+
+
+def start_stub_server(delay: float = 0.0) -> ThreadingHTTPServer:
+    handler = type("StubHandler", (_StubHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_rounds(client: OpenRouterClient, rounds: int) -> float:
+    messages = [{"role": "user", "content": "ping"}]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        client.chat(model="stub", messages=messages)
+    return rounds / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="server-side latency per request")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.delay_ms / 1000)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        results = {}
+        for label, pooled in (("unpooled", False), ("pooled", True)):
+            with OpenRouterClient(api_key="bench", base_url=base_url, pooled=pooled) as client:
+                client.chat(model="stub", messages=[{"role": "user", "content": "warmup"}])
+                results[label] = run_rounds(client, args.rounds)
+        for label, rps in results.items():
+            print(f"{label:>9}: {rps:8.1f} rounds/s")
+        print(f"  speedup: {results['pooled'] / results['unpooled']:8.2f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Scriptable local stand-in for the OpenRouter `/chat/completions` endpoint.
+
+Usage: python3 -m benchmarks.mock_openrouter [--port 8765] [--script steps.json] [--latency-ms 0]
+
+Each request takes the next step of the script (a JSON list when run from the
+command line); when the script runs out, an optional `responder(payload)`
+decides, and otherwise the reply is "ok". Steps are dicts built with
+`answer()`, `tool_call()` and `error()`, and may add `"delay"` seconds of
+extra latency. Requests with `"stream": true` get an SSE reply with text
+split into words and tool call arguments split into fragments.
+
+Point the CLI at it with `OPENROUTER_BASE_URL=http://127.0.0.1:8765`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+Step = dict[str, Any]
+
+
+def answer(text: str, **extra: Any) -> Step:
+    return {"content": text, **extra}
+
+
+def tool_call(name: str, arguments: dict[str, Any], *more: tuple[str, dict[str, Any]], **extra: Any) -> Step:
+    """One model reply that calls `name` (and any `(name, arguments)` pairs in `more`)."""
+    calls = [{"name": name, "arguments": arguments}, *({"name": n, "arguments": a} for n, a in more)]
+    return {"tool_calls": calls, **extra}
+
+
+def error(status: int, message: str = "", retry_after: float | None = None, **extra: Any) -> Step:
+    step: Step = {"status": status, "error": message or f"mock error {status}", **extra}
+    if retry_after is not None:
+        step["retry_after"] = retry_after
+    return step
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: _Server
+
+    def do_POST(self) -> None:  # noqa: N802 - http.server naming
+        raw = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        if self.headers.get("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        payload = json.loads(raw)
+        mock = self.server.mock
+        step = mock._next_step(payload, len(raw))
+        delay = mock.latency + float(step.get("delay", 0.0))
+        if delay:
+            time.sleep(delay)
+        if "status" in step:
+            self._send_error(step)
+        elif payload.get("stream"):
+            self._send_stream(step, payload)
+        else:
+            self._send_json(200, mock._completion(step, payload))
+
+    def _send_json(self, status: int, body: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, step: Step) -> None:
+        headers = {"Retry-After": str(step["retry_after"])} if "retry_after" in step else {}
+        body = {"error": {"code": step["status"], "message": step["error"]}}
+        self._send_json(int(step["status"]), body, headers)
+
+    def _send_stream(self, step: Step, payload: dict[str, Any]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data: bytes) -> None:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+        write(b": OPENROUTER PROCESSING\n\n")
+        for chunk in self.server.mock._chunks(step, payload):
+            write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+            if self.server.mock.chunk_delay:
+                time.sleep(self.server.mock.chunk_delay)
+        write(b"data: [DONE]\n\n")
+        write(b"")
+
+    def log_message(self, format: str, *args: object) -> None:
+        return
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    mock: MockOpenRouter
+
+
+class MockOpenRouter:
+    """Local HTTP server that answers chat completions from a script.
+
+    `requests` counts the requests served and `request_bytes` their total
+    (uncompressed) size; `last_payload` is the most recent decoded request.
+    """
+
+    def __init__(
+        self,
+        script: Iterable[Step] = (),
+        *,
+        responder: Callable[[dict[str, Any]], Step] | None = None,
+        latency: float = 0.0,
+        chunk_delay: float = 0.0,
+        port: int = 0,
+    ) -> None:
+        self.script: deque[Step] = deque(script)
+        self.responder = responder
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.port = port
+        self.requests = 0
+        self.request_bytes = 0
+        self.last_payload: dict[str, Any] | None = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server: _Server | None = None
+
+    @property
+    def base_url(self) -> str:
+        if self._server is None:
+            raise RuntimeError("mock server is not running")
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> MockOpenRouter:
+        self._server = _Server(("127.0.0.1", self.port), _Handler)
+        self._server.mock = self
+        threading.Thread(target=self._server.serve_forever, name="mock-openrouter", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> MockOpenRouter:
+        return self.start()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    def reset(self, script: Iterable[Step] = ()) -> None:
+        with self._lock:
+            self.script = deque(script)
+            self.requests = 0
+            self.request_bytes = 0
+
+    def _next_step(self, payload: dict[str, Any], size: int) -> Step:
+        with self._lock:
+            self.requests += 1
+            self.request_bytes += size
+            self.last_payload = payload
+            if self.script:
+                return self.script.popleft()
+        if self.responder:
+            return self.responder(payload)
+        return answer("ok")
+
+    def _tool_calls(self, step: Step) -> list[dict[str, Any]]:
+        return [
+            {
+                "id": f"call_{next(self._ids)}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])},
+            }
+            for call in step.get("tool_calls", [])
+        ]
+
+    @staticmethod
+    def _usage(step: Step, payload: dict[str, Any]) -> dict[str, int]:
+        if "usage" in step:
+            return step["usage"]
+        prompt = sum(len(str(m.get("content") or "")) for m in payload.get("messages", [])) // 4
+        completion = len(str(step.get("content") or "")) // 4 + 1
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    def _completion(self, step: Step, payload: dict[str, Any]) -> dict[str, Any]:
+        message: dict[str, Any] = {"role": "assistant", "content": step.get("content", "")}
+        calls = self._tool_calls(step)
+        if calls:
+            message["tool_calls"] = calls
+        return {
+            "id": "mock-completion",
+            "model": payload.get("model", "mock"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if calls else "stop"}],
+            "usage": self._usage(step, payload),
+        }
+
+    def _chunks(self, step: Step, payload: dict[str, Any]) -> Iterable[dict[str, Any]]:
+        text = step.get("content", "")
+        for i, word in enumerate(text.split(" ") if text else []):
+            yield {"choices": [{"index": 0, "delta": {"content": (" " if i else "") + word}}]}
+        calls = self._tool_calls(step)
+        for index, call in enumerate(calls):
+            arguments = call["function"]["arguments"]
+            half = len(arguments) // 2
+            yield {
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {
+                            "tool_calls": [
+                                {
+                                    "index": index,
+                                    "id": call["id"],
+                                    "type": "function",
+                                    "function": {"name": call["function"]["name"], "arguments": arguments[:half]},
+                                }
+                            ]
+                        },
+                    }
+                ]
+            }
+            yield {
+                "choices": [
+                    {"index": 0, "delta": {"tool_calls": [{"index": index, "function": {"arguments": arguments[half:]}}]}}
+                ]
+            }
+        yield {
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls" if calls else "stop"}],
+            "usage": self._usage(step, payload),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", type=Path, help="JSON list of steps, served in order")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every request")
+    parser.add_argument("--chunk-delay-ms", type=float, default=0.0, help="pause between streamed chunks")
+    args = parser.parse_args()
+
+    script = json.loads(args.script.read_text(encoding="utf-8")) if args.script else []
+    mock = MockOpenRouter(
+        script, latency=args.latency_ms / 1000, chunk_delay=args.chunk_delay_ms / 1000, port=args.port
+    ).start()
+    print(f"mock OpenRouter listening on {mock.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
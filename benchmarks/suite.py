@@ -0,0 +1,291 @@
+"""End-to-end benchmarks of the agent loop against the local mock server.
+
+Usage: python3 -m benchmarks.suite [--out bench-results.json] [--compare old.json]
+                                   [--scenario NAME ...] [--repeat 5] [--quick]
+
+Every scenario drives the real `Agent.run_turn` or `call_model` over HTTP
+against `benchmarks.mock_openrouter` with no added latency, so the numbers
+are the overhead of our own loop: request building, transport, parsing,
+scheduling and tools. Results are saved as JSON; `--compare` prints each
+scenario's p50 against an earlier results file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from benchmarks.bench_skills import make_skills
+from benchmarks.mock_openrouter import MockOpenRouter, answer, tool_call
+from src.agent import MAX_TOOL_ROUNDS, Agent
+from src.openrouter_client import OpenRouterClient, call_model
+from src.skill_loader import SkillLoader
+from src.tracing import percentile
+
+
+def summarize(samples: list[float], **extra: Any) -> dict[str, Any]:
+    return {
+        "runs": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        **extra,
+    }
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def tool_rounds_so_far(payload: dict[str, Any]) -> int:
+    """Assistant tool-call messages since the latest user message."""
+    rounds = 0
+    for message in reversed(payload["messages"]):
+        if message["role"] == "user":
+            break
+        if message["role"] == "assistant" and message.get("tool_calls"):
+            rounds += 1
+    return rounds
+
+
+class Bench:
+    def __init__(self, mock: MockOpenRouter, workdir: Path, repeat: int, quick: bool) -> None:
+        self.mock = mock
+        self.workdir = workdir
+        self.repeat = repeat
+        self.quick = quick
+        self.skills = SkillLoader(str(workdir / "no-skills"), index_path=workdir / "no-skills.json")
+        self.skills.discover_skills()
+
+    def agent(self, client: OpenRouterClient, **config: str) -> Agent:
+        return Agent({"model": "mock/model", **config}, client, self.skills, confirm=lambda diff: True, echo=False)
+
+    def turns(self, responder: Callable[[dict], dict], prompt: str, **config: str) -> dict[str, Any]:
+        self.mock.reset()
+        self.mock.responder = responder
+        with OpenRouterClient(api_key="bench", base_url=self.mock.base_url) as client:
+            results = []
+
+            def one_turn() -> None:
+                agent = self.agent(client, **config)
+                results.append(agent.run_turn(prompt))
+                agent.close()
+
+            samples = timed(one_turn, self.repeat)
+        return summarize(
+            samples,
+            model_requests=self.mock.requests,
+            request_bytes=self.mock.request_bytes,
+            rounds=results[-1].rounds,
+        )
+
+    def single_answer(self) -> dict[str, Any]:
+        return self.turns(lambda payload: answer("The answer is 42."), "What is the answer?")
+
+    def single_answer_stream(self) -> dict[str, Any]:
+        return self.turns(lambda payload: answer("The answer is 42."), "What is the answer?", stream="1")
+
+    def _chain(self, payload: dict[str, Any]) -> dict[str, Any]:
+        if tool_rounds_so_far(payload) < MAX_TOOL_ROUNDS - 1:
+            return tool_call("calculator", {"expression": "(1 + 2) * 3"})
+        return answer("done")
+
+    def tool_chain(self) -> dict[str, Any]:
+        return self.turns(self._chain, "Compute step by step.")
+
+    def tool_chain_stream(self) -> dict[str, Any]:
+        return self.turns(self._chain, "Compute step by step.", stream="1")
+
+    def large_read_file(self) -> dict[str, Any]:
+        lines = 20_000 if self.quick else 100_000
+        path = self.workdir / "large.txt"
+        with path.open("w", encoding="utf-8") as handle:
+            for i in range(lines):
+                handle.write(f"{i:06d} lorem ipsum dolor sit amet, consectetur adipiscing elit\n")
+        chunk = 2000
+
+        def responder(payload: dict[str, Any]) -> dict[str, Any]:
+            done = tool_rounds_so_far(payload)
+            if done < 5:
+                return tool_call("read_file", {"path": "large.txt", "offset": done * chunk, "limit": chunk})
+            return answer("read it")
+
+        cwd = os.getcwd()
+        os.chdir(self.workdir)  # read_file is sandboxed to the working directory
+        try:
+            result = self.turns(responder, "Read large.txt in chunks.")
+        finally:
+            os.chdir(cwd)
+        result["file_bytes"] = path.stat().st_size
+        return result
+
+    def edit_heavy_session(self) -> dict[str, Any]:
+        """Read, edit and re-read one file several times, with and without read dedupe."""
+        path = self.workdir / "module.py"
+        source = "".join(f"def function_{i}(value):\n    return value + {i}\n\n" for i in range(300))
+        edits = 6
+
+        def responder(payload: dict[str, Any]) -> dict[str, Any]:
+            done = tool_rounds_so_far(payload)
+            if done >= 2 * edits + 1:
+                return answer("all edits applied")
+            if done % 2 == 0:
+                return tool_call("read_file", {"path": "module.py"})
+            i = done // 2
+            return tool_call("edit_file", {"path": "module.py", "target": f"+ {i}\n", "replacement": f"+ {i} * 2\n"})
+
+        cwd = os.getcwd()
+        os.chdir(self.workdir)
+        try:
+            results = {}
+            for label, dedupe in (("dedupe", "1"), ("no_dedupe", "0")):
+                path.write_text(source, encoding="utf-8")
+                results[label] = self.turns(responder, "Apply the edits.", dedupe_reads=dedupe)
+        finally:
+            os.chdir(cwd)
+        result = results["dedupe"]
+        result["no_dedupe_request_bytes"] = results["no_dedupe"]["request_bytes"]
+        return result
+
+    def subagent_fanout(self) -> dict[str, Any]:
+        """Summarise 8 files: one serial read per round vs. `spawn_subagents`, with 20ms model latency."""
+        files = [f"part{i}.txt" for i in range(8)]
+        for name in files:
+            (self.workdir / name).write_text(f"{name}: " + "lorem ipsum " * 500, encoding="utf-8")
+
+        def serial(payload: dict[str, Any]) -> dict[str, Any]:
+            done = tool_rounds_so_far(payload)
+            if done < len(files):
+                return tool_call("read_file", {"path": files[done]})
+            return answer("summaries: ...")
+
+        def fanout(payload: dict[str, Any]) -> dict[str, Any]:
+            first_user = next(m["content"] for m in payload["messages"] if m["role"] == "user")
+            done = tool_rounds_so_far(payload)
+            if "Task: summarise " in first_user:  # a sub-agent
+                if done == 0:
+                    return tool_call("read_file", {"path": first_user.rsplit(" ", 1)[-1]})
+                return answer("a short summary")
+            if done == 0:
+                return tool_call("spawn_subagents", {"tasks": [f"summarise {name}" for name in files]})
+            return answer("summaries: ...")
+
+        cwd = os.getcwd()
+        os.chdir(self.workdir)
+        self.mock.latency = 0.02
+        try:
+            result = self.turns(fanout, "Summarise every part file.")
+            baseline = self.turns(serial, "Summarise every part file.")
+        finally:
+            self.mock.latency = 0.0
+            os.chdir(cwd)
+        result["serial_p50_ms"] = baseline["p50_ms"]
+        result["serial_request_bytes"] = baseline["request_bytes"]
+        return result
+
+    def call_model(self) -> dict[str, Any]:
+        self.mock.reset()
+        self.mock.responder = lambda payload: answer("pong")
+        messages = [{"role": "user", "content": "ping"}]
+        call = lambda: call_model(api_key="bench", base_url=self.mock.base_url, model="mock/model", messages=messages)
+        call()  # open the pooled connection
+        return summarize(timed(call, self.repeat * 20))
+
+    def many_skills_startup(self) -> dict[str, Any]:
+        count = 1000 if self.quick else 5000
+        skills_dir = self.workdir / "skills"
+        index_path = self.workdir / "skills-index.json"
+        if not skills_dir.exists():
+            make_skills(skills_dir, count, 2000)
+
+        def startup() -> None:
+            loader = SkillLoader(str(skills_dir), index_path=index_path)
+            loader.discover_skills()
+            Agent({"model": "mock/model", "skills_top_k": "20"}, None, loader, echo=False).close()
+
+        cold = timed(startup, 1)  # no index yet: parses every SKILL.md
+        return summarize(timed(startup, self.repeat), skills=count, cold_ms=round(cold[0] * 1000, 3))
+
+
+SCENARIOS = [
+    "single_answer",
+    "single_answer_stream",
+    "tool_chain",
+    "tool_chain_stream",
+    "large_read_file",
+    "edit_heavy_session",
+    "subagent_fanout",
+    "call_model",
+    "many_skills_startup",
+]
+
+
+def git_revision() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return out.stdout.strip()
+
+
+def compare(results: dict[str, Any], baseline_path: Path) -> None:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["scenarios"]
+    print(f"\ncompared with {baseline_path}:")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        ratio = result["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+        print(f"  {name:22s} p50 {old['p50_ms']:9.2f} -> {result['p50_ms']:9.2f} ms  ({ratio:5.2f}x)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", type=Path, default=Path("bench-results.json"))
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare against")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="smaller inputs for a fast smoke run")
+    args = parser.parse_args()
+
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp, MockOpenRouter() as mock:
+        bench = Bench(mock, Path(tmp), max(1, args.repeat), args.quick)
+        for name in args.scenario or SCENARIOS:
+            results[name] = getattr(bench, name)()
+            print(f"{name:22s} p50 {results[name]['p50_ms']:9.2f} ms  p95 {results[name]['p95_ms']:9.2f} ms", flush=True)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "quick": args.quick,
+        },
+        "scenarios": results,
+    }
+    args.out.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"results written to {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""Agent loop: one conversation history plus the model/tool round trips."""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable
+
+from .context import ContextManager, estimate_tokens
+from .file_cache import FILE_CACHE
+from .patch import PatchError, apply_changes, preview_patch
+from .request_builder import RequestBuilder
+from .scheduler import ToolScheduler
+from .skill_loader import SkillLoader
+from .subagents import (
+    CHILD_CONTEXT_TOKENS,
+    CHILD_MAX_ROUNDS,
+    MAX_TASKS,
+    SPAWN_SUBAGENTS_TOOL,
+    SUBAGENT_TOOLS,
+    TOKEN_BUDGET,
+    TokenBudget,
+    format_results,
+    run_subagents,
+)
+from .tool_registry import REGISTRY, ToolSpec
+from .tools import apply_edit, plan_patch_arguments, preview_edit, tool_specs, use_workspace
+from .tracing import TRACER
+
+if TYPE_CHECKING:
+    from .session_log import SessionLog
+
+# Longest tool output copied into a `tool_result` event.
+EVENT_PREVIEW_CHARS = 2000
+
+# Tools with these access kinds have no side effects and may start while the model is still streaming.
+EARLY_DISPATCH_ACCESS = {"pure", "read"}
+MAX_TOOL_ROUNDS = 15
+
+BASE_SYSTEM_PROMPT = (
+    "You are a helpful assistant. "
+    "When using tools, do not precompute or transform math expressions into numbers. "
+    "Only call tools with the original expression. "
+    "When a tool is needed, you must use tool_calls and never output JSON in plain text. "
+    "Before editing a file, you must read it. After editing, read it again to verify changes."
+)
+
+# Handled by each `Agent` (they need its skill loader), so registered without a handler.
+GET_SKILL_TOOL = REGISTRY.register(
+    ToolSpec(
+        name="get_skill",
+        description="Load full content for a specific skill by skill name.",
+        parameters={
+            "type": "object",
+            "properties": {"skill_name": {"type": "string"}},
+            "required": ["skill_name"],
+        },
+        access="pure",
+    )
+)
+
+SEARCH_SKILLS_TOOL = REGISTRY.register(
+    ToolSpec(
+        name="search_skills",
+        description="Search the skill catalog by topic; returns matching skill names and descriptions.",
+        parameters={
+            "type": "object",
+            "properties": {
+                "query": {"type": "string"},
+                "limit": {"type": "integer", "description": "Maximum number of results (default 10)."},
+            },
+            "required": ["query"],
+        },
+        access="pure",
+    )
+)
+
+
+def _debug_enabled() -> bool:
+    return os.getenv("DEBUG", "").lower() in {"1", "true", "yes"}
+
+
+def _parse_json_tool_call(text: str) -> tuple[str, dict] | None:
+    match = re.search(r"```json\\s*(\\{.*?\\})\\s*```", text, flags=re.S)
+    if not match:
+        return None
+    try:
+        payload = json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return None
+    if payload.get("method") != "calculator":
+        return None
+    params = payload.get("params", {})
+    return "calculator", params
+
+
+def _parse_inline_tool_call(content: object) -> tuple[str, dict] | None:
+    if isinstance(content, list) and content:
+        first = content[0]
+        if isinstance(first, dict) and "name" in first and "arguments" in first:
+            return first["name"], first["arguments"]
+    if isinstance(content, str) and content.strip().startswith(("{", "[")):
+        try:
+            payload = json.loads(content)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(payload, list) and payload and "name" in payload[0]:
+            return payload[0]["name"], payload[0].get("arguments", {})
+        if isinstance(payload, dict) and "name" in payload:
+            return payload["name"], payload.get("arguments", {})
+    return None
+
+
+def ask_user(diff: str) -> bool:
+    """Interactive confirmation used by the REPL for `edit_file` and `apply_patch`."""
+    print("EDIT PREVIEW:\n" + diff)
+    return input("Apply this change? (yes/no) ").strip().lower() in {"y", "yes"}
+
+
+@dataclass(frozen=True)
+class TurnResult:
+    """Final answer of one user turn."""
+
+    text: str
+    rounds: int
+
+
+class Agent:
+    """One conversation: its history, and the loop that answers each user turn."""
+
+    def __init__(
+        self,
+        config: dict[str, str],
+        client: Any,
+        skill_loader: SkillLoader,
+        *,
+        confirm: Callable[[str], bool] = ask_user,
+        echo: bool = True,
+        workspace: Path | None = None,
+        on_event: Callable[[dict[str, Any]], None] | None = None,
+        allowed_tools: frozenset[str] | None = None,
+        token_budget: TokenBudget | None = None,
+        max_rounds: int = MAX_TOOL_ROUNDS,
+        session_log: SessionLog | None = None,
+    ) -> None:
+        self.config = config
+        self.client = client
+        self.skill_loader = skill_loader
+        self.confirm = confirm
+        self.echo = echo
+        self.workspace = workspace
+        self.on_event = on_event
+        # Set for sub-agents: the tools they may call, and the budget their model calls draw from.
+        self.allowed_tools = allowed_tools
+        self.token_budget = token_budget
+        self.max_rounds = max_rounds
+        # Every message that enters the history is also appended here, so the session can be resumed.
+        self.session_log = session_log
+        self.stream = config.get("stream", "").lower() in {"1", "true", "yes"}
+        self.skills_top_k = int(config.get("skills_top_k", "0"))
+        self.system_message: dict[str, str] = {}
+        self.metadata_prompt = ""
+        self._skills_version: int | None = None
+        self._refresh_system_message()
+        self.history: list[dict[str, Any]] = []
+        self.scheduler = ToolScheduler(self.run_tool, max_workers=int(config.get("tool_concurrency", "4")))
+        self.context = ContextManager(
+            budget_tokens=int(config.get("context_budget", "100000")),
+            dedupe_reads=config.get("dedupe_reads", "1").lower() not in {"0", "false", "no"},
+            blob_min_chars=int(config.get("blob_min_chars", "8000")),
+        )
+        # Built once so the tool list keeps its identity (and its cached encoding) across rounds.
+        self.tools = tool_specs()
+        if allowed_tools is not None:
+            self.tools = [tool for tool in self.tools if tool["function"]["name"] in allowed_tools]
+        # Tools this agent runs itself, in place of the registered handler.
+        self.handlers: dict[str, Callable[[dict], str]] = {
+            GET_SKILL_TOOL.name: self.get_skill,
+            SEARCH_SKILLS_TOOL.name: self.search_skills,
+            SPAWN_SUBAGENTS_TOOL.name: self.spawn_subagents,
+            "edit_file": self.edit_file,
+            "apply_patch": self.apply_patch,
+        }
+        self.request_builder = RequestBuilder()
+        self._confirm_lock = threading.Lock()
+
+    def _refresh_system_message(self) -> None:
+        # Skills can be hot-reloaded by `SkillLoader.watch()`; rebuild the prompt only then, so
+        # it stays a stable, cacheable prefix (per-turn skill ranking goes in the user message).
+        if self._skills_version == self.skill_loader.version:
+            return
+        self._skills_version = self.skill_loader.version
+        self.metadata_prompt = self.skill_loader.get_skills_metadata_prompt(self.skills_top_k)
+        content = BASE_SYSTEM_PROMPT
+        if self.metadata_prompt:
+            content = f"{content}\n\n{self.metadata_prompt}"
+        self.system_message = {"role": "system", "content": content}
+
+    def _print(self, *args: object, **kwargs: Any) -> None:
+        if self.echo:
+            print(*args, **kwargs)
+
+    def _emit(self, event: dict[str, Any]) -> None:
+        if self.on_event:
+            self.on_event(event)
+
+    def active_tool_specs(self) -> list[dict]:
+        return self.tools
+
+    def get_skill(self, args: dict) -> str:
+        skill_name = str(args.get("skill_name", "")).strip()
+        skill = self.skill_loader.get_skill(skill_name)
+        if not skill:
+            return f"error: skill not found: {skill_name}"
+        return skill.full_prompt()
+
+    def search_skills(self, args: dict) -> str:
+        query = str(args.get("query", "")).strip()
+        try:
+            limit = max(1, min(int(args.get("limit") or 10), 50))
+        except (TypeError, ValueError):
+            limit = 10
+        results = self.skill_loader.search(query, limit)
+        if not results:
+            return f"no skills match: {query}"
+        return "\n".join(f"{skill.metadata_line()} (score {score:.2f})" for skill, score in results)
+
+    def spawn_subagents(self, args: dict) -> str:
+        tasks = args.get("tasks")
+        if not isinstance(tasks, list) or not tasks or not all(isinstance(t, str) and t.strip() for t in tasks):
+            return "error: tasks must be a non-empty list of prompts"
+        if len(tasks) > MAX_TASKS:
+            return f"error: at most {MAX_TASKS} tasks per call"
+        tools = SUBAGENT_TOOLS
+        if args.get("tools"):
+            tools = SUBAGENT_TOOLS & set(map(str, args["tools"]))
+        try:
+            limit = min(int(args.get("max_tokens") or TOKEN_BUDGET), TOKEN_BUDGET)
+        except (TypeError, ValueError):
+            return "error: max_tokens must be an integer"
+        budget = TokenBudget(limit)
+        config = {**self.config, "context_budget": str(CHILD_CONTEXT_TOKENS), "stream": "0"}
+
+        def make_child() -> Agent:
+            return Agent(
+                config,
+                self.client,
+                self.skill_loader,
+                confirm=lambda diff: False,
+                echo=False,
+                workspace=self.workspace,
+                allowed_tools=frozenset(tools),
+                token_budget=budget,
+                max_rounds=CHILD_MAX_ROUNDS,
+            )
+
+        start = time.perf_counter()
+        results = run_subagents([t.strip() for t in tasks], make_child, budget)
+        return format_results(results, budget, time.perf_counter() - start)
+
+    def edit_file(self, args: dict) -> str:
+        path = str(args.get("path", ""))
+        target = str(args.get("target", ""))
+        replacement = str(args.get("replacement", ""))
+        # One prompt at a time, even when edits to different files run concurrently.
+        with self._confirm_lock:
+            preview = preview_edit(path, target, replacement)
+            if not preview:
+                return "error: edit preview failed"
+            diff, updated = preview
+            with TRACER.span("confirm", path=path) as span:
+                approved = self.confirm(diff)
+                span.set(approved=approved)
+            if approved:
+                return apply_edit(path, updated)
+            return "canceled"
+
+    def apply_patch(self, args: dict) -> str:
+        with self._confirm_lock:
+            try:
+                changes = plan_patch_arguments(args)
+            except PatchError as exc:
+                return f"error: {exc}"
+            if not changes:
+                return "ok: patch leaves every file unchanged"
+            with TRACER.span("confirm", path=",".join(c.display for c in changes)) as span:
+                approved = self.confirm(preview_patch(changes))
+                span.set(approved=approved)
+            if approved:
+                return apply_changes(changes)
+            return "canceled"
+
+    def run_tool(self, name: str, args: dict) -> str:
+        if self.allowed_tools is not None and name not in self.allowed_tools:
+            return f"error: tool not available here: {name}"
+        with use_workspace(self.workspace):
+            return REGISTRY.call(name, args, self.handlers.get(name))
+
+    def close(self) -> None:
+        self.scheduler.shutdown()
+
+    def _call_model(self, prefetched: dict[str, tuple[Future[str], float]]) -> dict[str, Any]:
+        self._refresh_system_message()
+        tools = self.active_tool_specs()
+        messages = self.context.fit(self.system_message, self.history, tools)
+        if not self.stream:
+            response_json = self.client.chat(
+                model=self.config["model"], messages=messages, tools=tools, builder=self.request_builder
+            )
+            self._charge(response_json, messages, tools)
+            return response_json
+
+        streamed: list[str] = []
+        side_effect_seen = False
+
+        def on_text(text: str) -> None:
+            streamed.append(text)
+            self._print(text, end="", flush=True)
+            self._emit({"type": "text", "text": text})
+
+        def on_tool_call(call: dict) -> None:
+            # Start read-only calls early, but never past a call that may change files.
+            nonlocal side_effect_seen
+            name = call["function"]["name"]
+            if REGISTRY.access(name) not in EARLY_DISPATCH_ACCESS:
+                side_effect_seen = True
+            if side_effect_seen or not call.get("id"):
+                return
+            try:
+                args = json.loads(call["function"]["arguments"] or "{}")
+            except json.JSONDecodeError:
+                return
+            future = self.scheduler.executor.submit(self.scheduler.call, name, args)
+            prefetched[call["id"]] = (future, time.perf_counter())
+
+        response_json = self.client.chat_stream(
+            model=self.config["model"],
+            messages=messages,
+            tools=tools,
+            on_text=on_text,
+            on_tool_call=on_tool_call,
+            builder=self.request_builder,
+        )
+        if streamed:
+            self._print()
+        self._charge(response_json, messages, tools)
+        return response_json
+
+    def _charge(self, response_json: dict[str, Any], messages: list[dict], tools: list[dict]) -> None:
+        if self.token_budget is None:
+            return
+        usage = response_json.get("usage") or {}
+        tokens = usage.get("total_tokens")
+        if tokens is None:  # provider sent no usage: estimate it
+            reply = json.dumps(response_json["choices"][0]["message"], ensure_ascii=False)
+            tokens = self.context.count(messages, tools) + estimate_tokens(reply)
+        self.token_budget.charge(int(tokens))
+
+    def run_turn(self, user_text: str) -> TurnResult:
+        with TRACER.span("turn", prompt_chars=len(user_text)) as span, use_workspace(self.workspace):
+            try:
+                result = self._run_turn(user_text)
+            finally:
+                if self.session_log is not None:
+                    self.session_log.sync()
+            span.set(rounds=result.rounds, answer_chars=len(result.text), history_messages=len(self.history))
+        return result
+
+    def restore(self, messages: list[dict[str, Any]], omitted_turns: int = 0) -> None:
+        """Continue from a logged session: `messages` become the history without being logged again."""
+        if omitted_turns:
+            note = f"[resumed session: the {omitted_turns} earliest turns were not reloaded]"
+            self.history.append({"role": "assistant", "content": note})
+        self.history.extend(messages)
+
+    def _record(self, *messages: dict[str, Any]) -> None:
+        self.history.extend(messages)
+        if self.session_log is not None:
+            for message in messages:
+                self.session_log.append(message)
+
+    def _run_turn(self, user_text: str) -> TurnResult:
+        if self.session_log is not None:
+            self.session_log.begin_turn()
+        # The skills ranked for this prompt travel with it, and stay in the history with it,
+        # so neither the system prompt nor any earlier message changes between turns.
+        relevant = self.skill_loader.get_relevant_skills_prompt(user_text, self.skills_top_k)
+        user_message = {"role": "user", "content": f"{user_text}\n\n{relevant}" if relevant else user_text}
+        self._record(user_message)
+        if _debug_enabled():
+            print("DEBUG loaded_skills:", list(self.skill_loader.loaded_skills))
+            if self.metadata_prompt:
+                print("DEBUG skills_metadata_prompt:", self.metadata_prompt)
+            print("DEBUG new_messages:", [self.system_message, user_message])
+            print("DEBUG tools:", self.active_tool_specs())
+
+        rounds = 0
+        while True:
+            prefetched: dict[str, tuple[Future[str], float]] = {}
+            response_json = self._call_model(prefetched)
+            choice = response_json["choices"][0]["message"]
+            tool_calls = choice.get("tool_calls") or []
+
+            if tool_calls:
+                self._record({"role": "assistant", "content": choice.get("content", ""), "tool_calls": tool_calls})
+                for call in tool_calls:
+                    self._emit({"type": "tool_call", "id": call.get("id"), **(call.get("function") or {})})
+                results = self.scheduler.run(tool_calls, prefetched)
+                current_tool_results = [result.message() for result in results]
+                self._record(*current_tool_results)
+                for result in results:
+                    self._emit(
+                        {
+                            "type": "tool_result",
+                            "id": result.call_id,
+                            "name": result.name,
+                            "content": result.content[:EVENT_PREVIEW_CHARS],
+                            "elapsed_ms": round(result.elapsed * 1000, 1),
+                        }
+                    )
+                if _debug_enabled():
+                    print("DEBUG tool_calls:", tool_calls)
+                    print("DEBUG tool_results:", current_tool_results)
+                    print("DEBUG file_cache:", FILE_CACHE.stats())
+                    print("DEBUG tool_timings:", {r.call_id: f"{r.name} {r.elapsed * 1000:.1f}ms" for r in results})
+                    print(
+                        "DEBUG new_messages:",
+                        [
+                            {"role": "assistant", "content": choice.get("content", ""), "tool_calls": tool_calls},
+                            *current_tool_results,
+                        ],
+                    )
+                rounds += 1
+                if rounds >= self.max_rounds:
+                    self._print("error: too many tool calls")
+                    return TurnResult("error: too many tool calls", rounds)
+                if self.token_budget is not None and self.token_budget.exhausted:
+                    return TurnResult("error: sub-agent token budget exhausted", rounds)
+                continue
+
+            response_content = choice.get("content", "")
+            if isinstance(response_content, str):
+                response_text = response_content.strip()
+            else:
+                response_text = ""
+            tool_call = None
+            if isinstance(response_content, str) and response_text.startswith("```") and "calculator" in response_text:
+                tool_call = _parse_json_tool_call(response_text)
+            if not tool_call:
+                tool_call = _parse_inline_tool_call(response_content)
+            if tool_call:
+                name, args = tool_call
+                result = self.run_tool(name, args)
+                self._print(result)
+                self._record({"role": "assistant", "content": response_content}, {"role": "tool", "content": result})
+                return TurnResult(result, rounds)
+            response = response_text
+            if not self.stream:
+                self._print(response)
+            self._record({"role": "assistant", "content": response})
+            return TurnResult(response, rounds)
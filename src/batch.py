@@ -0,0 +1,163 @@
+"""Headless batch mode: run JSONL tasks through the agent loop on a worker pool."""
+
+from __future__ import annotations
+
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from .agent import Agent
+from .skill_loader import SkillLoader
+from .tracing import percentile
+
+
+class RateLimiter:
+    """Global cap on model requests per second and on requests in flight."""
+
+    def __init__(self, requests_per_second: float = 0.0, max_concurrent: int = 0) -> None:
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._semaphore = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def __enter__(self) -> RateLimiter:
+        if self._semaphore:
+            self._semaphore.acquire()
+        if self.interval:
+            with self._lock:
+                now = time.monotonic()
+                slot = max(now, self._next_slot)
+                self._next_slot = slot + self.interval
+            if slot > now:
+                time.sleep(slot - now)
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if self._semaphore:
+            self._semaphore.release()
+
+
+class LimitedClient:
+    """Wrap a model client so every call goes through a shared `RateLimiter`."""
+
+    def __init__(self, client: Any, limiter: RateLimiter) -> None:
+        self.client = client
+        self.limiter = limiter
+
+    def chat(self, **kwargs: Any) -> dict[str, Any]:
+        with self.limiter:
+            return self.client.chat(**kwargs)
+
+    def chat_stream(self, **kwargs: Any) -> dict[str, Any]:
+        with self.limiter:
+            return self.client.chat_stream(**kwargs)
+
+
+def task_id(task: dict[str, Any], line_no: int) -> str:
+    for key in ("id", "request_id", "task_id"):
+        if task.get(key) is not None:
+            return str(task[key])
+    return f"line-{line_no}"
+
+
+def task_prompt(task: dict[str, Any]) -> str:
+    if task.get("prompt"):
+        return str(task["prompt"])
+    parts = [str(task[key]) for key in ("title", "body") if task.get(key)]
+    return "\n\n".join(parts)
+
+
+def _recorded_statuses(out_path: Path) -> dict[str, str]:
+    """The latest status written for each task id in `out_path`."""
+    statuses: dict[str, str] = {}
+    if not out_path.exists():
+        return statuses
+    for line in out_path.read_text(encoding="utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue  # a torn last line from an interrupted run is simply redone
+        statuses[str(record.get("id"))] = str(record.get("status"))
+    return statuses
+
+
+def run_batch(
+    config: dict[str, str],
+    client: Any,
+    in_path: Path,
+    out_path: Path,
+    *,
+    workers: int = 4,
+    requests_per_second: float = 0.0,
+    max_concurrent_requests: int = 0,
+    approve_edits: bool = False,
+) -> list[dict[str, Any]]:
+    """Run every task in `in_path` not already finished in `out_path`; append results."""
+    skill_loader = SkillLoader("skills")
+    skill_loader.discover_skills()
+    limited = LimitedClient(client, RateLimiter(requests_per_second, max_concurrent_requests))
+    recorded = _recorded_statuses(out_path)
+    done = {tid for tid, status in recorded.items() if status == "ok"}
+
+    write_lock = threading.Lock()
+    records: list[dict[str, Any]] = []
+
+    def write(record: dict[str, Any]) -> None:
+        with write_lock:
+            with out_path.open("a", encoding="utf-8") as handle:
+                handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+            records.append(record)
+            rounds = record.get("rounds", "-")
+            print(f"batch: {record['id']} {record['status']} {record['latency_s']}s rounds={rounds}", flush=True)
+
+    tasks: list[tuple[str, str]] = []
+    for line_no, line in enumerate(in_path.read_text(encoding="utf-8").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            task = json.loads(line)
+            error = None if isinstance(task, dict) else "task is not a JSON object"
+        except json.JSONDecodeError as exc:
+            error = f"invalid JSON: {exc}"
+        if error is not None:
+            # A bad line fails on its own and the rest of the batch still runs; a resumed
+            # run does not report the same bad line again.
+            if recorded.get(f"line-{line_no}") != "error":
+                write({"id": f"line-{line_no}", "status": "error", "error": error, "latency_s": 0.0})
+            continue
+        tid = task_id(task, line_no)
+        if tid not in done:
+            tasks.append((tid, task_prompt(task)))
+    print(f"batch: {len(tasks)} tasks to run, {len(done)} already done", flush=True)
+
+    def run_one(tid: str, prompt: str) -> None:
+        agent = Agent(config, limited, skill_loader, confirm=lambda _diff: approve_edits, echo=False)
+        start = time.perf_counter()
+        record: dict[str, Any] = {"id": tid}
+        try:
+            result = agent.run_turn(prompt)
+            record.update(status="ok", output=result.text, rounds=result.rounds)
+        except Exception as exc:
+            record.update(status="error", error=f"{type(exc).__name__}: {exc}")
+        finally:
+            agent.close()
+        record["latency_s"] = round(time.perf_counter() - start, 3)
+        write(record)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="task") as pool:
+        for tid, prompt in tasks:
+            pool.submit(run_one, tid, prompt)
+
+    latencies = [r["latency_s"] for r in records]
+    ok = sum(1 for r in records if r["status"] == "ok")
+    if records:
+        rounds = [r["rounds"] for r in records if "rounds" in r]
+        print(
+            f"batch: {ok}/{len(records)} ok, latency p50={percentile(latencies, 50):.2f}s "
+            f"p95={percentile(latencies, 95):.2f}s, mean rounds={statistics.fmean(rounds) if rounds else 0:.1f}"
+        )
+    return records
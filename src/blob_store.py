@@ -0,0 +1,71 @@
+"""Content-addressed store for tool outputs moved out of the conversation history."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+HANDLE_PREFIX = "blob:"
+
+
+class BlobStore:
+    """Text blobs keyed by a hash of their content.
+
+    Blobs live in an in-memory LRU; with `directory` set they are also written
+    there, so handles stay valid after eviction and across restarts.
+    """
+
+    def __init__(self, directory: str | Path | None = None, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = Path(directory) if directory else None
+        self.max_bytes = max_bytes
+        self._blobs: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, text: str) -> str:
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        handle = HANDLE_PREFIX + digest
+        with self._lock:
+            if digest in self._blobs:
+                self._blobs.move_to_end(digest)
+                return handle
+            self._blobs[digest] = text
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._blobs) > 1:
+                _old, evicted = self._blobs.popitem(last=False)
+                self._size -= len(evicted.encode("utf-8"))
+        if self.directory:
+            path = self.directory / digest
+            if not path.exists():
+                self.directory.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(".tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+        return handle
+
+    def get(self, handle: str) -> str | None:
+        digest = handle.strip().removeprefix(HANDLE_PREFIX)
+        if not digest.isalnum():
+            return None
+        with self._lock:
+            text = self._blobs.get(digest)
+            if text is not None:
+                self._blobs.move_to_end(digest)
+                return text
+        if self.directory:
+            try:
+                return (self.directory / digest).read_text(encoding="utf-8")
+            except OSError:
+                return None
+        return None
+
+
+BLOB_STORE = BlobStore(
+    os.getenv("AGENT_BLOB_DIR", "").strip() or None,
+    int(os.getenv("AGENT_BLOB_STORE_BYTES", str(DEFAULT_MAX_BYTES))),
+)
@@ -0,0 +1,321 @@
+"""Arithmetic for the `calculator` tool.
+
+Expressions are parsed once into a restricted AST, checked against fixed
+limits, rewritten so every operator goes through a guarded helper, and
+compiled to a code object cached by expression text. There are no loops in
+the language, so the node limit also bounds the number of evaluation steps.
+With variables given as arrays, one expression is evaluated over all values
+at once: in a single NumPy call when NumPy is installed, row by row otherwise.
+"""
+
+from __future__ import annotations
+
+import ast
+import functools
+import json
+import math
+import operator
+from dataclasses import dataclass
+from types import CodeType
+from typing import Any, Callable
+
+MAX_EXPRESSION_CHARS = 2000
+MAX_DEPTH = 200
+MAX_NODES = 2000
+MAX_EXPONENT = 10_000
+MAX_INT_BITS = 4096  # about 1200 decimal digits
+MAX_BATCH = 200
+MAX_VALUES = 10_000
+CACHE_SIZE = 512
+
+CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau}
+# name -> (scalar implementation, NumPy attribute)
+FUNCTIONS: dict[str, tuple[Callable[..., Any], str]] = {
+    "abs": (abs, "abs"),
+    "sqrt": (math.sqrt, "sqrt"),
+    "exp": (math.exp, "exp"),
+    "log": (math.log, "log"),
+    "log2": (math.log2, "log2"),
+    "log10": (math.log10, "log10"),
+    "sin": (math.sin, "sin"),
+    "cos": (math.cos, "cos"),
+    "tan": (math.tan, "tan"),
+    "asin": (math.asin, "arcsin"),
+    "acos": (math.acos, "arccos"),
+    "atan": (math.atan, "arctan"),
+    "atan2": (math.atan2, "arctan2"),
+    "sinh": (math.sinh, "sinh"),
+    "cosh": (math.cosh, "cosh"),
+    "tanh": (math.tanh, "tanh"),
+    "hypot": (math.hypot, "hypot"),
+    "floor": (math.floor, "floor"),
+    "ceil": (math.ceil, "ceil"),
+    "round": (round, "round"),
+    "min": (min, "minimum"),
+    "max": (max, "maximum"),
+}
+_BINOPS = {
+    ast.Add: "_add",
+    ast.Sub: "_sub",
+    ast.Mult: "_mul",
+    ast.Div: "_div",
+    ast.FloorDiv: "_floordiv",
+    ast.Mod: "_mod",
+    ast.Pow: "_pow",
+}
+
+
+class CalcError(ValueError):
+    """An expression that is invalid or over one of the limits."""
+
+
+@dataclass(frozen=True)
+class Compiled:
+    text: str
+    code: CodeType
+    variables: frozenset[str]  # names that must be supplied by the caller
+
+
+class _Guard(ast.NodeTransformer):
+    """Route every operator through a `_`-prefixed helper that checks its cost."""
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+        helper = ast.Name(_BINOPS[type(node.op)], ast.Load())
+        return ast.copy_location(ast.Call(helper, [node.left, node.right], []), node)
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        self.generic_visit(node)
+        if isinstance(node.op, ast.UAdd):
+            return node.operand
+        return ast.copy_location(ast.Call(ast.Name("_neg", ast.Load()), [node.operand], []), node)
+
+
+def _validate(tree: ast.Expression) -> frozenset[str]:
+    variables = set()
+    nodes = 0
+    stack: list[tuple[ast.AST, int]] = [(tree.body, 1)]
+    while stack:
+        node, depth = stack.pop()
+        nodes += 1
+        if nodes > MAX_NODES:
+            raise CalcError(f"expression too long (over {MAX_NODES} operations)")
+        if depth > MAX_DEPTH:
+            raise CalcError(f"expression nested too deeply (over {MAX_DEPTH} levels)")
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise CalcError(f"unsupported constant: {node.value!r}")
+        elif isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+            stack += [(node.left, depth + 1), (node.right, depth + 1)]
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            stack.append((node.operand, depth + 1))
+        elif isinstance(node, ast.Name):
+            if node.id.startswith("_") or node.id in FUNCTIONS:
+                raise CalcError(f"invalid name: {node.id}")
+            if node.id not in CONSTANTS:
+                variables.add(node.id)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+            if node.keywords or not node.args:
+                raise CalcError(f"{node.func.id}() takes positional arguments only")
+            stack += [(arg, depth + 1) for arg in node.args]
+        else:
+            raise CalcError(f"unsupported syntax: {ast.dump(node)[:60]}")
+    return frozenset(variables)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_expression(text: str) -> Compiled:
+    if len(text) > MAX_EXPRESSION_CHARS:
+        raise CalcError(f"expression longer than {MAX_EXPRESSION_CHARS} characters")
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except (SyntaxError, ValueError, RecursionError, MemoryError) as exc:
+        raise CalcError(f"cannot parse expression: {exc}") from None
+    variables = _validate(tree)
+    tree = ast.fix_missing_locations(_Guard().visit(tree))
+    return Compiled(text, compile(tree, "<calculator>", "eval"), variables)
+
+
+# -- scalar helpers ----------------------------------------------------
+
+
+def _check_int(value: Any) -> Any:
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise CalcError(f"result too large (over {MAX_INT_BITS} bits)")
+    if isinstance(value, complex):
+        raise CalcError("result is not a real number")
+    return value
+
+
+def _pow(base: Any, exponent: Any) -> Any:
+    if abs(exponent) > MAX_EXPONENT:
+        raise CalcError(f"exponent larger than {MAX_EXPONENT}")
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0:
+        if max(base.bit_length() - 1, 0) * exponent > MAX_INT_BITS:
+            raise CalcError(f"result too large (over {MAX_INT_BITS} bits)")
+    return _check_int(base**exponent)
+
+
+def _mul(a: Any, b: Any) -> Any:
+    if isinstance(a, int) and isinstance(b, int) and a.bit_length() + b.bit_length() > MAX_INT_BITS + 1:
+        raise CalcError(f"result too large (over {MAX_INT_BITS} bits)")
+    return a * b
+
+
+SCALAR_NAMESPACE: dict[str, Any] = {
+    "__builtins__": {},
+    "_add": operator.add,
+    "_sub": operator.sub,
+    "_mul": _mul,
+    "_div": operator.truediv,
+    "_floordiv": operator.floordiv,
+    "_mod": operator.mod,
+    "_pow": _pow,
+    "_neg": operator.neg,
+    **CONSTANTS,
+    **{name: scalar for name, (scalar, _np_name) in FUNCTIONS.items()},
+}
+
+
+def _run(compiled: Compiled, namespace: dict[str, Any], values: dict[str, Any]) -> Any:
+    try:
+        return eval(compiled.code, namespace, values)  # noqa: S307 - validated and guarded above
+    except CalcError:
+        raise
+    except ZeroDivisionError:
+        raise CalcError("division by zero") from None
+    except OverflowError:
+        raise CalcError("result too large") from None
+    except (ValueError, TypeError) as exc:
+        raise CalcError(str(exc)) from None
+
+
+def evaluate(text: str, values: dict[str, Any] | None = None) -> int | float:
+    compiled = compile_expression(text)
+    missing = compiled.variables - (values or {}).keys()
+    if missing:
+        raise CalcError(f"unknown name(s): {', '.join(sorted(missing))}")
+    result = _run(compiled, SCALAR_NAMESPACE, dict(values or {}))
+    if isinstance(result, float) and not math.isfinite(result):
+        raise CalcError("result is not finite")
+    return _check_int(result)
+
+
+# -- vectorized evaluation ---------------------------------------------
+
+
+@functools.lru_cache(maxsize=1)
+def _numpy() -> Any:
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+@functools.lru_cache(maxsize=1)
+def _numpy_namespace() -> dict[str, Any]:
+    np = _numpy()
+
+    def _pow_array(base: Any, exponent: Any) -> Any:
+        if np.size(exponent) and np.max(np.abs(exponent)) > MAX_EXPONENT:
+            raise CalcError(f"exponent larger than {MAX_EXPONENT}")
+        return np.power(base, exponent)
+
+    def _reduce(ufunc: Any) -> Callable[..., Any]:
+        return lambda *args: functools.reduce(ufunc, args)
+
+    functions = {name: getattr(np, np_name) for name, (_scalar, np_name) in FUNCTIONS.items()}
+    functions.update(min=_reduce(np.minimum), max=_reduce(np.maximum))
+    return {
+        "__builtins__": {},
+        "_add": np.add,
+        "_sub": np.subtract,
+        "_mul": np.multiply,
+        "_div": np.true_divide,
+        "_floordiv": np.floor_divide,
+        "_mod": np.mod,
+        "_pow": _pow_array,
+        "_neg": np.negative,
+        **CONSTANTS,
+        **functions,
+    }
+
+
+def _vector_length(variables: dict[str, Any]) -> int:
+    lengths = {len(value) for value in variables.values() if isinstance(value, list)}
+    if len(lengths) > 1:
+        raise CalcError("all array variables must have the same length")
+    length = lengths.pop() if lengths else 1
+    if length > MAX_VALUES:
+        raise CalcError(f"at most {MAX_VALUES} values per variable")
+    return length
+
+
+def evaluate_vector(text: str, variables: dict[str, Any]) -> list[Any]:
+    """Evaluate `text` once per position of the array variables (scalars are broadcast).
+
+    Returns one number, or an "error: ..." string, per position.
+    """
+    compiled = compile_expression(text)
+    missing = compiled.variables - variables.keys()
+    if missing:
+        raise CalcError(f"unknown name(s): {', '.join(sorted(missing))}")
+    length = _vector_length(variables)
+    np = _numpy()
+    if np is not None:
+        arrays = {name: np.asarray(value, dtype=float) for name, value in variables.items()}
+        with np.errstate(all="ignore"):
+            result = _run(compiled, _numpy_namespace(), arrays)
+        result = np.broadcast_to(np.asarray(result, dtype=float), (length,))
+        return [float(x) if math.isfinite(x) else "error: result is not finite" for x in result.tolist()]
+    results: list[Any] = []
+    for i in range(length):
+        row = {name: value[i] if isinstance(value, list) else value for name, value in variables.items()}
+        try:
+            results.append(evaluate(text, row))
+        except CalcError as exc:
+            results.append(f"error: {exc}")
+    return results
+
+
+# -- tool entry point --------------------------------------------------
+
+
+def _number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _result(text: str, variables: dict[str, Any]) -> str:
+    if any(isinstance(v, list) for v in variables.values()):
+        return json.dumps(evaluate_vector(text, variables))
+    return repr(evaluate(text, variables))
+
+
+def run_calculator(arguments: dict) -> str:
+    """Handle one `calculator` tool call: a single expression, a batch, or arrays of values."""
+    expressions = arguments.get("expressions")
+    variables = arguments.get("variables") or {}
+    if not isinstance(variables, dict) or not all(
+        _number(v) or (isinstance(v, list) and all(_number(x) for x in v)) for v in variables.values()
+    ):
+        return "error: variables must map names to numbers or arrays of numbers"
+    if expressions is not None:
+        if not isinstance(expressions, list) or not expressions:
+            return "error: expressions must be a non-empty list of strings"
+        if len(expressions) > MAX_BATCH:
+            return f"error: at most {MAX_BATCH} expressions per call"
+        lines = []
+        for text in expressions:
+            try:
+                lines.append(f"{text} = {_result(str(text), variables)}")
+            except CalcError as exc:
+                lines.append(f"{text} = error: {exc}")
+        return "\n".join(lines)
+    text = str(arguments.get("expression") or "")
+    if not text.strip():
+        return "error: give an expression or a list of expressions"
+    try:
+        return _result(text, variables)
+    except CalcError as exc:
+        return f"error: {exc}"
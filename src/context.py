@@ -0,0 +1,259 @@
+"""Token-budgeted compaction of the conversation history."""
+
+from __future__ import annotations
+
+import json
+import re
+
+from .blob_store import BLOB_STORE, BlobStore
+from .tools import resolve_path
+
+DEFAULT_BUDGET_TOKENS = 100_000
+MESSAGE_OVERHEAD_TOKENS = 4
+TRIMMED_TOOL_CHARS = 300
+SUMMARY_SNIPPET_CHARS = 200
+SUMMARY_HEADER = "[Summary of earlier conversation, compacted to save context]"
+DEDUP_HEADER = "[Earlier read_file result"
+BLOB_HEADER = "[Tool output moved to"
+# Tool outputs from earlier turns longer than this go to the blob store.
+DEFAULT_BLOB_MIN_CHARS = 8000
+BLOB_HEAD_CHARS = 1000
+BLOB_TAIL_CHARS = 500
+
+_WIDE_CHARS = re.compile(r"[^\x00-\x7f]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate BPE token count: ~4 ASCII chars per token, ~1 per CJK/other wide char."""
+    if not text:
+        return 0
+    wide = len(_WIDE_CHARS.findall(text))
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _content_text(message: dict) -> str:
+    content = message.get("content") or ""
+    return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+
+def _snippet(text: str, limit: int = SUMMARY_SNIPPET_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class ContextManager:
+    """Keep `[system, *history]` small and under a token budget.
+
+    Every round, and in place: an older `read_file` result of a file that was
+    read again later becomes a short reference, or a diff against the later
+    read; and large tool outputs from earlier turns move to the blob store,
+    leaving a head/tail preview and a `fetch_blob` handle. Over budget, old
+    tool outputs are then trimmed, and finally whole old turns are folded into
+    one summary message. An assistant `tool_calls` message and its `tool`
+    replies are always kept or dropped together, and the current turn is
+    never summarized.
+    """
+
+    def __init__(
+        self,
+        budget_tokens: int = DEFAULT_BUDGET_TOKENS,
+        keep_recent_turns: int = 2,
+        *,
+        dedupe_reads: bool = True,
+        blob_min_chars: int = DEFAULT_BLOB_MIN_CHARS,
+        blob_store: BlobStore | None = None,
+    ) -> None:
+        self.budget_tokens = budget_tokens
+        self.keep_recent_turns = max(1, keep_recent_turns)
+        self.dedupe_reads = dedupe_reads
+        self.blob_min_chars = blob_min_chars
+        self.blob_store = blob_store or BLOB_STORE
+        self._cache: dict[int, tuple[dict, int]] = {}
+        self._read_keys: dict[int, tuple[dict, tuple | None]] = {}
+        self._tools_cache: tuple[object, int] | None = None
+
+    def message_tokens(self, message: dict) -> int:
+        cached = self._cache.get(id(message))
+        if cached and cached[0] is message:
+            return cached[1]
+        tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(_content_text(message))
+        if message.get("tool_calls"):
+            tokens += estimate_tokens(json.dumps(message["tool_calls"], ensure_ascii=False))
+        self._cache[id(message)] = (message, tokens)
+        return tokens
+
+    def tools_tokens(self, tools: list[dict] | None) -> int:
+        if not tools:
+            return 0
+        if self._tools_cache and self._tools_cache[0] is tools:
+            return self._tools_cache[1]
+        tokens = estimate_tokens(json.dumps(tools, ensure_ascii=False))
+        self._tools_cache = (tools, tokens)
+        return tokens
+
+    def count(self, messages: list[dict], tools: list[dict] | None = None) -> int:
+        return sum(self.message_tokens(m) for m in messages) + self.tools_tokens(tools)
+
+    def fit(self, system_message: dict, history: list[dict], tools: list[dict] | None = None) -> list[dict]:
+        """Compact `history` in place if needed and return the messages to send."""
+        if self.dedupe_reads:
+            self._dedupe_reads(history)
+        if self.blob_min_chars > 0:
+            self._offload_outputs(history, self._turn_starts(history)[-1])
+        fixed = self.message_tokens(system_message) + self.tools_tokens(tools)
+        budget = self.budget_tokens - fixed
+        if self.count(history) > budget:
+            self._trim_tool_outputs(history, budget, self._turn_starts(history)[-self.keep_recent_turns :][0])
+        if self.count(history) > budget:
+            self._summarize_turns(history, budget)
+        if self.count(history) > budget:
+            # Last resort: trim tool outputs inside the recent turns as well.
+            self._trim_tool_outputs(history, budget, len(history))
+        live = {id(m) for m in history}
+        self._cache = {k: v for k, v in self._cache.items() if k in live}
+        self._read_keys = {k: v for k, v in self._read_keys.items() if k in live}
+        return [system_message, *history]
+
+    def _read_key(self, message: dict, function: dict) -> tuple | None:
+        cached = self._read_keys.get(id(message))
+        if cached and cached[0] is message:
+            return cached[1]
+        key = None
+        try:
+            args = json.loads(function.get("arguments") or "{}")
+        except json.JSONDecodeError:
+            args = None
+        if isinstance(args, dict) and args.get("path"):
+            raw = str(args["path"])
+            resolved = resolve_path(raw)
+            key = (str(resolved or raw), args.get("offset"), args.get("limit"), args.get("unit") or "lines")
+        self._read_keys[id(message)] = (message, key)
+        return key
+
+    def _dedupe_reads(self, history: list[dict]) -> None:
+        functions: dict[str, dict] = {}
+        latest: dict[tuple, int] = {}
+        for i, message in enumerate(history):
+            role = message.get("role")
+            if role == "assistant":
+                for call in message.get("tool_calls") or []:
+                    functions[call.get("id", "")] = call.get("function") or {}
+                continue
+            content = message.get("content")
+            function = functions.get(message.get("tool_call_id", ""))
+            if (
+                role != "tool"
+                or not function
+                or function.get("name") != "read_file"
+                or not isinstance(content, str)
+                or content.startswith(("error", DEDUP_HEADER, BLOB_HEADER))
+            ):
+                continue
+            key = self._read_key(message, function)
+            if key is None:
+                continue
+            if key in latest:
+                older = latest[key]
+                replacement = self._against_later(history[older], message, key[0])
+                if replacement is not None:
+                    history[older] = replacement
+            latest[key] = i
+
+    @staticmethod
+    def _against_later(older: dict, newer: dict, path: str) -> dict | None:
+        old, new = older["content"], newer["content"]
+        later = newer.get("tool_call_id", "?")
+        if old == new:
+            text = f"{DEDUP_HEADER} for {path}: identical to the later read (tool_call_id {later}), omitted]"
+        else:
+            import difflib
+
+            diff = "\n".join(
+                difflib.unified_diff(
+                    new.splitlines(), old.splitlines(), "later read", "this read", n=1, lineterm=""
+                )
+            )
+            if len(diff) > len(old) // 2:
+                return None  # mostly different: the diff would not save much
+            text = f"{DEDUP_HEADER} for {path}, as a diff against the later read (tool_call_id {later})]\n{diff}"
+        return {**older, "content": text}
+
+    def _offload_outputs(self, history: list[dict], stop: int) -> None:
+        for i in range(min(stop, len(history))):
+            message = history[i]
+            content = message.get("content")
+            if (
+                message.get("role") != "tool"
+                or not isinstance(content, str)
+                or len(content) <= self.blob_min_chars
+                or content.startswith((BLOB_HEADER, DEDUP_HEADER))
+            ):
+                continue
+            handle = self.blob_store.put(content)
+            omitted = len(content) - BLOB_HEAD_CHARS - BLOB_TAIL_CHARS
+            history[i] = {
+                **message,
+                "content": (
+                    f"{BLOB_HEADER} {handle} ({len(content)} chars); call fetch_blob to read all of it]\n"
+                    f"{content[:BLOB_HEAD_CHARS]}\n[... {omitted} chars omitted ...]\n{content[-BLOB_TAIL_CHARS:]}"
+                ),
+            }
+
+    @staticmethod
+    def _turn_starts(history: list[dict]) -> list[int]:
+        starts = [i for i, m in enumerate(history) if m.get("role") == "user"]
+        return starts or [0]
+
+    def _trim_tool_outputs(self, history: list[dict], budget: int, stop: int) -> None:
+        total = self.count(history)
+        for i in range(min(stop, len(history))):
+            if total <= budget:
+                return
+            message = history[i]
+            content = message.get("content")
+            if message.get("role") != "tool" or not isinstance(content, str) or len(content) <= TRIMMED_TOOL_CHARS:
+                continue
+            trimmed = dict(message)
+            if content.startswith(BLOB_HEADER):
+                # Already offloaded: keep just the line with the handle.
+                trimmed["content"] = content.split("\n", 1)[0]
+            else:
+                handle = self.blob_store.put(content)
+                trimmed["content"] = (
+                    content[:TRIMMED_TOOL_CHARS]
+                    + f"\n[... trimmed {len(content) - TRIMMED_TOOL_CHARS} chars of old tool output; full text: {handle} ...]"
+                )
+            total += self.message_tokens(trimmed) - self.message_tokens(message)
+            history[i] = trimmed
+
+    def _summarize_turns(self, history: list[dict], budget: int) -> None:
+        starts = self._turn_starts(history)
+        keep_from = starts[-self.keep_recent_turns] if len(starts) > self.keep_recent_turns else 0
+        cut = 0
+        # Cut only at user messages so tool_calls/tool pairs are never split.
+        for candidate in starts:
+            if candidate == 0 or candidate > keep_from:
+                continue
+            cut = candidate
+            summary_tokens = estimate_tokens(self._summary(history[:cut]))
+            if self.count(history[cut:]) + summary_tokens + MESSAGE_OVERHEAD_TOKENS <= budget:
+                break
+        if cut:
+            history[:cut] = [{"role": "user", "content": self._summary(history[:cut])}]
+
+    @staticmethod
+    def _summary(messages: list[dict]) -> str:
+        lines = [SUMMARY_HEADER]
+        for message in messages:
+            role = message.get("role")
+            text = _content_text(message)
+            if role == "user" and text.startswith(SUMMARY_HEADER):
+                lines.extend(text.splitlines()[1:])  # fold an earlier summary in as-is
+            elif role == "user":
+                lines.append(f"- user: {_snippet(text)}")
+            elif role == "assistant" and message.get("tool_calls"):
+                names = [c.get("function", {}).get("name", "?") for c in message["tool_calls"]]
+                lines.append(f"  - tools used: {', '.join(names)}")
+            elif role == "assistant" and text:
+                lines.append(f"  - assistant: {_snippet(text)}")
+        return "\n".join(lines)
@@ -0,0 +1,100 @@
+"""Stat-validated cache of decoded workspace files."""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class _Entry:
+    signature: tuple[int, int, int]  # (mtime_ns, size, inode)
+    text: str
+    # Set right after our own write, so the verify-read can skip the stat.
+    trusted: bool = False
+
+
+def _signature(st: os.stat_result) -> tuple[int, int, int]:
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _universal_newlines(text: str) -> str:
+    # Match what `Path.read_text()` returns for the same bytes.
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class FileCache:
+    """LRU cache of UTF-8 file contents keyed on resolved path.
+
+    Each hit is checked against the file's (mtime_ns, size, inode) so edits
+    made outside the agent are always picked up.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Bumped on every write or shell command we know of; lets indexes skip rescans.
+        self.generation = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def read_text(self, path: Path) -> str:
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.trusted:
+                entry.trusted = False
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.text
+        st = path.stat()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.signature == _signature(st):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.text
+            self.misses += 1
+        text = path.read_text(encoding="utf-8")
+        self._put(key, _Entry(_signature(st), text))
+        return text
+
+    def store(self, path: Path, text: str) -> None:
+        """Record content the agent has just written to `path`."""
+        self.generation += 1
+        self._put(str(path), _Entry(_signature(path.stat()), _universal_newlines(text), trusted=True))
+
+    def distrust_all(self) -> None:
+        """Force a stat on the next read of every file, e.g. after a shell command."""
+        self.generation += 1
+        with self._lock:
+            for entry in self._entries.values():
+                entry.trusted = False
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._size}
+
+    def _put(self, key: str, entry: _Entry) -> None:
+        cost = len(entry.text)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._size -= len(old.text)
+            if cost > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._size += cost
+            while self._size > self.max_bytes:
+                _key, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.text)
+
+
+FILE_CACHE = FileCache(int(os.getenv("AGENT_FILE_CACHE_BYTES", str(DEFAULT_MAX_BYTES))))
@@ -2,16 +2,17 @@
 
 from __future__ import annotations
 
+import argparse
 import os
 import sys
+import time
 from pathlib import Path
-import json
-import re
+from typing import Any
 
-from .skill_loader import SkillLoader
-from .tools import apply_edit, eval_math_expr, execute_tool, preview_edit, tool_specs
+from .startup import STARTUP, profile_startup, profiling
 
-from .openrouter_client import call_model
+# Everything else is imported inside `main()` by the mode that needs it, so a
+# run only pays for its own modules (and `requests` only on the first request).
 
 
 def load_dotenv(path: Path) -> None:
@@ -34,8 +35,14 @@ def load_config() -> dict[str, str]:
     api_key = os.getenv("OPENROUTER_API_KEY", "").strip()
     base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").strip()
     model = os.getenv("OPENROUTER_MODEL", "openrouter/auto").strip()
+    stream = os.getenv("OPENROUTER_STREAM", "0").strip()
+    tool_concurrency = os.getenv("AGENT_TOOL_CONCURRENCY", "4").strip()
+    context_budget = os.getenv("AGENT_CONTEXT_BUDGET", "100000").strip()
+    skills_top_k = os.getenv("AGENT_SKILLS_TOP_K", "20").strip()
+    dedupe_reads = os.getenv("AGENT_DEDUPE_READS", "1").strip()
+    blob_min_chars = os.getenv("AGENT_BLOB_MIN_CHARS", "8000").strip()
 
-    if not api_key:
+    if not api_key and not os.getenv("OPENROUTER_REPLAY", "").strip():
         print("Error: OPENROUTER_API_KEY is required.", file=sys.stderr)
         print("Tip: set it in your shell or create a local .env and load it.", file=sys.stderr)
         raise SystemExit(1)
@@ -44,187 +51,198 @@ def load_config() -> dict[str, str]:
         print("Error: OPENROUTER_MODEL is required.", file=sys.stderr)
         raise SystemExit(1)
 
-    return {"api_key": api_key, "base_url": base_url, "model": model}
+    return {
+        "api_key": api_key,
+        "base_url": base_url,
+        "model": model,
+        "stream": stream,
+        "tool_concurrency": tool_concurrency,
+        "context_budget": context_budget,
+        "skills_top_k": skills_top_k,
+        "dedupe_reads": dedupe_reads,
+        "blob_min_chars": blob_min_chars,
+    }
 
 
-def _parse_json_tool_call(text: str) -> tuple[str, dict] | None:
-    match = re.search(r"```json\\s*(\\{.*?\\})\\s*```", text, flags=re.S)
-    if not match:
-        return None
-    try:
-        payload = json.loads(match.group(1))
-    except json.JSONDecodeError:
-        return None
-    if payload.get("method") != "calculator":
-        return None
-    params = payload.get("params", {})
-    return "calculator", params
-
-
-def _parse_inline_tool_call(content: object) -> tuple[str, dict] | None:
-    if isinstance(content, list) and content:
-        first = content[0]
-        if isinstance(first, dict) and "name" in first and "arguments" in first:
-            return first["name"], first["arguments"]
-    if isinstance(content, str) and content.strip().startswith(("{", "[")):
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m src.main", description="Mini-agent CLI.")
+    parser.add_argument("prompt", nargs="*", help="initial prompt for the interactive session")
+    parser.add_argument("--batch", type=Path, help="run each JSONL line as an independent task")
+    parser.add_argument("--out", type=Path, default=Path("results.jsonl"), help="batch results file (appended, resumable)")
+    parser.add_argument("--workers", type=int, default=4, help="batch tasks run concurrently")
+    parser.add_argument("--rps", type=float, default=0.0, help="global model requests per second (0 = unlimited)")
+    parser.add_argument("--max-concurrent-requests", type=int, default=0, help="model requests in flight (0 = unlimited)")
+    parser.add_argument("--approve-edits", action="store_true", help="apply edit_file and apply_patch changes without asking in batch mode")
+    parser.add_argument("--serve", action="store_true", help="host many sessions over HTTP/WebSocket")
+    parser.add_argument("--host", default="127.0.0.1", help="server bind address")
+    parser.add_argument("--port", type=int, default=8700, help="server port")
+    parser.add_argument("--workspace-root", type=Path, default=Path("."), help="directory session workspaces live under")
+    parser.add_argument("--max-sessions", type=int, default=64, help="sessions one server hosts at most")
+    parser.add_argument("--max-concurrent-turns", type=int, default=16, help="turns the server runs at once")
+    parser.add_argument("--connect", metavar="URL", help="run the REPL against a server, e.g. http://127.0.0.1:8700")
+    parser.add_argument("--workspace", default="", help="session workspace, relative to the server's root (--connect)")
+    parser.add_argument("--resume", metavar="SESSION", help='continue a logged session (an id, id prefix or "latest")')
+    parser.add_argument("--fork-at", type=int, metavar="TURN", help="with --resume: start a new session from that turn")
+    parser.add_argument("--sessions", action="store_true", help="list logged sessions and exit")
+    parser.add_argument("--prune-sessions", type=float, metavar="DAYS", help="delete sessions idle for DAYS and exit")
+    parser.add_argument(
+        "--profile-startup", action="store_true", help="report import and init time up to the first turn, then exit"
+    )
+    return parser.parse_args(argv)
+
+
+def initial_prompt(args: argparse.Namespace) -> str:
+    if args.prompt:
+        return " ".join(args.prompt).strip()
+    return "Say '你好' and nothing else."
+
+
+def manage_sessions(args: argparse.Namespace) -> None:
+    from .session_log import default_session_dir, list_sessions, prune_sessions
+
+    directory = default_session_dir()
+    if args.prune_sessions is not None:
+        removed = prune_sessions(directory, args.prune_sessions)
+        print(f"removed {len(removed)} session(s) from {directory}")
+    if args.sessions:
+        for info in list_sessions(directory):
+            prompt = " ".join(info.last_prompt.split())
+            modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(info.modified))
+            print(f"{info.session_id}  {modified}  {info.turns:4d} turns  {info.size / 1024:8.1f} KB  {prompt[:60]}")
+
+
+def open_session(args: argparse.Namespace, agent: Any) -> None:
+    """Attach a session log to the REPL agent, restoring `--resume` history first."""
+    from .session_log import RESUME_BYTES_PER_TOKEN, SessionLog, default_session_dir, find_session, fork_session, load_session
+
+    directory = default_session_dir()
+    if args.resume:
         try:
-            payload = json.loads(content)
-        except json.JSONDecodeError:
-            return None
-        if isinstance(payload, list) and payload and "name" in payload[0]:
-            return payload[0]["name"], payload[0].get("arguments", {})
-        if isinstance(payload, dict) and "name" in payload:
-            return payload["name"], payload.get("arguments", {})
-    return None
+            path = find_session(directory, args.resume)
+            if args.fork_at is not None:
+                path = fork_session(path, args.fork_at, directory)
+        except ValueError as exc:
+            print(f"Error: {exc}", file=sys.stderr)
+            raise SystemExit(1) from None
+        messages, omitted = load_session(path, max_bytes=agent.context.budget_tokens * RESUME_BYTES_PER_TOKEN)
+        agent.restore(messages, omitted)
+        agent.session_log = SessionLog(path)
+        print(f"resumed session {path.stem} ({agent.session_log.turns} turns)", file=sys.stderr)
+    elif os.getenv("AGENT_SESSION_LOG", "1").strip().lower() not in {"0", "false", "no"}:
+        agent.session_log = SessionLog.create(directory, {"workspace": str(Path.cwd())})
+
+
+def ready() -> bool:
+    """True when only startup is being profiled: report the phases and stop before any work."""
+    if profiling():
+        STARTUP.report()
+        return True
+    return False
 
 
 def main() -> None:
-    config = load_config()
-    skill_loader = SkillLoader("skills")
-    loaded_skills = skill_loader.discover_skills()
-    system_message = {
-        "role": "system",
-        "content": (
-            "You are a helpful assistant. "
-            "When using tools, do not precompute or transform math expressions into numbers. "
-            "Only call tools with the original expression. "
-            "When a tool is needed, you must use tool_calls and never output JSON in plain text. "
-            "Before editing a file, you must read it. After editing, read it again to verify changes."
-        ),
-    }
-    metadata_prompt = skill_loader.get_skills_metadata_prompt()
-    if metadata_prompt:
-        system_message["content"] = f"{system_message['content']}\n\n{metadata_prompt}"
-    history: list[dict[str, str]] = []
-    get_skill_tool = {
-        "type": "function",
-        "function": {
-            "name": "get_skill",
-            "description": "Load full content for a specific skill by skill name.",
-            "parameters": {
-                "type": "object",
-                "properties": {"skill_name": {"type": "string"}},
-                "required": ["skill_name"],
-            },
-        },
-    }
+    with STARTUP.phase("parse_args"):
+        args = parse_args(sys.argv[1:])
+    if args.profile_startup:
+        raise SystemExit(profile_startup([arg for arg in sys.argv[1:] if arg != "--profile-startup"]))
+    if args.sessions or args.prune_sessions is not None:
+        manage_sessions(args)
+        return
+    token = os.getenv("AGENT_SERVER_TOKEN", "").strip()
+    if args.connect:
+        import asyncio
 
-    def active_tool_specs() -> list[dict]:
-        return [*tool_specs(), get_skill_tool]
-
-    initial_prompt = "Say '你好' and nothing else."
-    if len(sys.argv) > 1:
-        initial_prompt = " ".join(sys.argv[1:]).strip()
-
-    def run_turn(user_text: str) -> None:
-        history.append({"role": "user", "content": user_text})
-        if os.getenv("DEBUG", "").lower() in {"1", "true", "yes"}:
-            print("DEBUG loaded_skills:", [s.name for s in loaded_skills])
-            if metadata_prompt:
-                print("DEBUG skills_metadata_prompt:", metadata_prompt)
-            print(
-                "DEBUG new_messages:",
-                [system_message, {"role": "user", "content": user_text}],
-            )
-            print("DEBUG tools:", active_tool_specs())
-
-        max_tool_rounds = 15
-        rounds = 0
-        while True:
-            response_json = call_model(
-                api_key=config["api_key"],
-                base_url=config["base_url"],
-                model=config["model"],
-                messages=[system_message, *history],
-                tools=active_tool_specs(),
+        from .remote import remote_repl
+
+        if ready():
+            return
+        asyncio.run(remote_repl(args.connect, initial_prompt(args), workspace=args.workspace, token=token))
+        return
+
+    with STARTUP.phase("load_config"):
+        config = load_config()
+    with STARTUP.phase("client"):
+        from .openrouter_client import get_resilient_client
+
+        client = get_resilient_client(config["api_key"], config["base_url"])
+
+    if args.batch:
+        with STARTUP.phase("batch_setup"):
+            from .batch import run_batch
+        if ready():
+            return
+        run_batch(
+            config,
+            client,
+            args.batch,
+            args.out,
+            workers=args.workers,
+            requests_per_second=args.rps,
+            max_concurrent_requests=args.max_concurrent_requests,
+            approve_edits=args.approve_edits,
+        )
+        return
+
+    with STARTUP.phase("skills"):
+        from .skill_loader import SkillLoader
+
+        skill_loader = SkillLoader("skills")
+        skill_loader.discover_skills()
+        watch_interval = float(os.getenv("AGENT_SKILL_WATCH", "0") or 0)
+        if watch_interval > 0:
+            skill_loader.watch(watch_interval)
+
+    if args.serve:
+        with STARTUP.phase("server_setup"):
+            import asyncio
+
+            from .server import AgentServer
+
+            server = AgentServer(
+                config,
+                client,
+                skill_loader,
+                workspace_root=args.workspace_root,
+                max_sessions=args.max_sessions,
+                max_concurrent_turns=args.max_concurrent_turns,
+                max_concurrent_requests=args.max_concurrent_requests,
+                requests_per_second=args.rps,
+                token=token,
             )
-            choice = response_json["choices"][0]["message"]
-            tool_calls = choice.get("tool_calls") or []
-
-            if tool_calls:
-                history.append({"role": "assistant", "content": choice.get("content", ""), "tool_calls": tool_calls})
-                current_tool_results: list[dict[str, str]] = []
-                for call in tool_calls:
-                    name = call["function"]["name"]
-                    args = json.loads(call["function"]["arguments"] or "{}")
-                    if name == "get_skill":
-                        skill_name = str(args.get("skill_name", "")).strip()
-                        skill = skill_loader.get_skill(skill_name)
-                        if not skill:
-                            result = f"error: skill not found: {skill_name}"
-                        else:
-                            result = skill.full_prompt()
-                    elif name == "edit_file":
-                        path = str(args.get("path", ""))
-                        target = str(args.get("target", ""))
-                        replacement = str(args.get("replacement", ""))
-                        preview = preview_edit(path, target, replacement)
-                        if not preview:
-                            result = "error: edit preview failed"
-                        else:
-                            diff, updated = preview
-                            print("EDIT PREVIEW:\n" + diff)
-                            confirm = input("Apply this change? (yes/no) ").strip().lower()
-                            if confirm in {"y", "yes"}:
-                                result = apply_edit(path, updated)
-                            else:
-                                result = "canceled"
-                    else:
-                        result = execute_tool(name, args)
-                    tool_msg = {
-                        "role": "tool",
-                        "tool_call_id": call["id"],
-                        "content": result,
-                    }
-                    history.append(tool_msg)
-                    current_tool_results.append(tool_msg)
-                if os.getenv("DEBUG", "").lower() in {"1", "true", "yes"}:
-                    print("DEBUG tool_calls:", tool_calls)
-                    print("DEBUG tool_results:", current_tool_results)
-                    print(
-                        "DEBUG new_messages:",
-                        [
-                            {"role": "assistant", "content": choice.get("content", ""), "tool_calls": tool_calls},
-                            *current_tool_results,
-                        ],
-                    )
-                rounds += 1
-                if rounds >= max_tool_rounds:
-                    print("error: too many tool calls")
-                    return
-                continue
-
-            response_content = choice.get("content", "")
-            if isinstance(response_content, str):
-                response_text = response_content.strip()
-            else:
-                response_text = ""
-            tool_call = None
-            if isinstance(response_content, str) and response_text.startswith("```") and "calculator" in response_text:
-                tool_call = _parse_json_tool_call(response_text)
-            if not tool_call:
-                tool_call = _parse_inline_tool_call(response_content)
-            if tool_call:
-                name, args = tool_call
-                if name == "get_skill":
-                    skill_name = str(args.get("skill_name", "")).strip()
-                    skill = skill_loader.get_skill(skill_name)
-                    if not skill:
-                        result = f"error: skill not found: {skill_name}"
-                    else:
-                        result = skill.full_prompt()
-                else:
-                    result = execute_tool(name, args)
-                print(result)
-                history.append({"role": "assistant", "content": response_content})
-                history.append({"role": "tool", "content": result})
-                return
-            response = response_text
-            print(response)
-            history.append({"role": "assistant", "content": response})
+        if ready():
+            server.close()
             return
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except ValueError as exc:
+            print(f"Error: {exc}", file=sys.stderr)
+            raise SystemExit(1) from None
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+        return
+
+    with STARTUP.phase("agent"):
+        from .agent import Agent
+
+        agent = Agent(config, client, skill_loader)
+    if ready():
+        return
+    open_session(args, agent)
+    try:
+        repl(agent, args)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        if agent.session_log is not None:
+            agent.session_log.close()
+            print(f"session {agent.session_log.session_id} saved (--resume {agent.session_log.session_id})", file=sys.stderr)
+
 
-    run_turn(initial_prompt)
+def repl(agent: Any, args: argparse.Namespace) -> None:
+    if not args.resume or args.prompt:
+        agent.run_turn(initial_prompt(args))
 
     while True:
         try:
@@ -236,7 +254,7 @@ def main() -> None:
             continue
         if user_text.lower() in {"exit", "quit"}:
             break
-        run_turn(user_text)
+        agent.run_turn(user_text)
 
 
 if __name__ == "__main__":
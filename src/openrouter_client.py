@@ -2,11 +2,484 @@
 
 from __future__ import annotations
 
+import functools
+import gzip
 import json
 import os
-from typing import Any
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator
 
-import requests
+from .request_builder import RequestBuilder
+from .resilience import CircuitBreaker, Endpoint, ResilientClient, RetryPolicy
+from .response_cache import ResponseCache, SessionRecorder, SessionReplayer, request_key
+from .tracing import TRACER
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+GZIP_MIN_BYTES = 1024
+
+
+def _debug_enabled() -> bool:
+    return os.getenv("DEBUG", "").lower() in {"1", "true", "yes"}
+
+
+def _debug_response(parsed: dict[str, Any]) -> None:
+    if not _debug_enabled():
+        return
+    message = parsed["choices"][0]["message"]
+    print("DEBUG response_message:", message.get("content", ""))
+    if message.get("tool_calls"):
+        print("DEBUG response_tool_calls:", message["tool_calls"])
+
+
+def _trace_usage(span: Any, parsed: dict[str, Any]) -> None:
+    if not TRACER.enabled:
+        return
+    usage = parsed.get("usage") or {}
+    span.set(**{k: usage[k] for k in ("prompt_tokens", "completion_tokens", "total_tokens") if k in usage})
+    span.set(tool_calls=len(parsed["choices"][0]["message"].get("tool_calls") or []))
+
+
+class OpenRouterClient:
+    """Chat Completions client that owns a pooled keep-alive HTTP session."""
+
+    def __init__(
+        self,
+        *,
+        api_key: str,
+        base_url: str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        gzip_requests: bool = False,
+        pooled: bool = True,
+        cache: ResponseCache | None = None,
+        recorder: SessionRecorder | None = None,
+        replayer: SessionReplayer | None = None,
+    ) -> None:
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = max(1, pool_size)
+        self.timeout = (connect_timeout, read_timeout)
+        self.gzip_requests = gzip_requests
+        self.pooled = pooled
+        self.cache = cache
+        self.recorder = recorder
+        self.replayer = replayer
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}",
+            # Optional but recommended by OpenRouter
+            "HTTP-Referer": "http://localhost",
+            "X-Title": "mini-agent",
+        }
+        # Created on the first request: importing requests is most of CLI startup.
+        self._session: requests.Session | None = None
+        self._session_lock = threading.Lock()
+
+    def _new_session(self) -> requests.Session:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def _encode(
+        self, payload: dict[str, Any], builder: RequestBuilder | None = None
+    ) -> tuple[bytes, dict[str, str]]:
+        body = builder.build(payload) if builder else json.dumps(payload).encode("utf-8")
+        if self.gzip_requests and len(body) >= GZIP_MIN_BYTES:
+            return gzip.compress(body, compresslevel=5), {"Content-Encoding": "gzip"}
+        return body, {}
+
+    def post(
+        self,
+        path: str,
+        payload: dict[str, Any],
+        *,
+        builder: RequestBuilder | None = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        body, extra_headers = self._encode(payload, builder)
+        TRACER.current().set(request_bytes=len(body))
+        if self.pooled:
+            if self._session is None:
+                with self._session_lock:
+                    if self._session is None:
+                        self._session = self._new_session()
+            return self._session.post(url, data=body, headers=extra_headers, timeout=self.timeout, **kwargs)
+        # Unpooled mode mirrors a bare `requests.post`: one connection per request.
+        session = self._new_session()
+        resp = session.post(url, data=body, headers=extra_headers, timeout=self.timeout, **kwargs)
+        if not kwargs.get("stream"):
+            resp.content  # read the body before the connection is released
+        session.close()
+        return resp
+
+    def _lookup(self, payload: dict[str, Any]) -> tuple[str | None, dict[str, Any] | None]:
+        if not (self.cache or self.recorder or self.replayer):
+            return None, None
+        key = request_key(payload["model"], payload["messages"], payload.get("tools"), payload["temperature"])
+        if self.replayer:
+            return key, self.replayer.lookup(key)
+        parsed = self.cache.get(key) if self.cache else None
+        if parsed is not None and self.recorder:
+            # Record hits too: a replay of this session needs every answer, not only the fetched ones.
+            self.recorder.record(key, payload, parsed)
+        return key, parsed
+
+    def _remember(self, key: str | None, payload: dict[str, Any], parsed: dict[str, Any]) -> None:
+        if key is None or self.replayer:
+            return
+        if self.cache:
+            self.cache.put(key, parsed)
+        if self.recorder:
+            self.recorder.record(key, payload, parsed)
+
+    def chat(
+        self,
+        *,
+        model: str,
+        messages: list[dict[str, str]],
+        tools: list[dict[str, Any]] | None = None,
+        temperature: float = 0.2,
+        builder: RequestBuilder | None = None,
+    ) -> dict[str, Any]:
+        """Run one completion.
+
+        Pass the same `builder` on every round of a conversation to reuse the
+        encoded bytes of messages that were already sent.
+        """
+        payload: dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+        }
+        if tools:
+            payload["tools"] = tools
+        with TRACER.span("model_call", model=model, stream=False, messages=len(messages)) as span:
+            key, parsed = self._lookup(payload)
+            span.set(cached=parsed is not None)
+            if parsed is None:
+                resp = self.post("chat/completions", payload, builder=builder)
+                span.set(status=resp.status_code)
+                resp.raise_for_status()
+                span.set(response_bytes=len(resp.content))
+                with TRACER.span("json_parse", source="response", bytes=len(resp.content)):
+                    parsed = resp.json()
+                self._remember(key, payload, parsed)
+            _trace_usage(span, parsed)
+        _debug_response(parsed)
+        return parsed
+
+    def chat_stream(
+        self,
+        *,
+        model: str,
+        messages: list[dict[str, str]],
+        tools: list[dict[str, Any]] | None = None,
+        temperature: float = 0.2,
+        on_text: Callable[[str], None] | None = None,
+        on_tool_call: Callable[[dict[str, Any]], None] | None = None,
+        builder: RequestBuilder | None = None,
+    ) -> dict[str, Any]:
+        """Stream a completion and return it in the same shape as `chat`.
+
+        `on_text` receives assistant text deltas as they arrive; `on_tool_call`
+        receives each tool call as soon as its arguments are complete.
+        """
+        payload: dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+        }
+        if tools:
+            payload["tools"] = tools
+        with TRACER.span("model_call", model=model, stream=True, messages=len(messages)) as span:
+            key, parsed = self._lookup(payload)
+            span.set(cached=parsed is not None)
+            if parsed is not None:
+                # Cached or replayed: hand the whole answer to the callbacks at once.
+                message = parsed["choices"][0]["message"]
+                if on_text and isinstance(message.get("content"), str) and message["content"]:
+                    on_text(message["content"])
+                for call in message.get("tool_calls") or []:
+                    if on_tool_call:
+                        on_tool_call(call)
+            else:
+                assembler = StreamAssembler(on_text=on_text, on_tool_call=on_tool_call)
+                received = 0
+
+                def counted(lines: Iterable[bytes]) -> Iterator[bytes]:
+                    nonlocal received
+                    for line in lines:
+                        received += len(line) + 1
+                        yield line
+
+                with self.post("chat/completions", {**payload, "stream": True}, builder=builder, stream=True) as resp:
+                    span.set(status=resp.status_code)
+                    resp.raise_for_status()
+                    for chunk in iter_sse_chunks(counted(resp.iter_lines())):
+                        assembler.feed(chunk)
+                assembler.finish()
+                parsed = assembler.response()
+                span.set(response_bytes=received)
+                self._remember(key, payload, parsed)
+            _trace_usage(span, parsed)
+        _debug_response(parsed)
+        return parsed
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+
+    def __enter__(self) -> OpenRouterClient:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def iter_sse_chunks(lines: Iterable[bytes | str]) -> Iterator[dict[str, Any]]:
+    """Yield decoded JSON chunks from a `text/event-stream` body."""
+    data_lines: list[str] = []
+    for raw in lines:
+        line = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+        if not line:
+            if data_lines:
+                data = "\n".join(data_lines)
+                data_lines = []
+                if data.strip() == "[DONE]":
+                    return
+                yield json.loads(data)
+            continue
+        if line.startswith(":"):
+            continue  # keep-alive comments such as ": OPENROUTER PROCESSING"
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip(" "))
+    if data_lines:
+        data = "\n".join(data_lines)
+        if data.strip() != "[DONE]":
+            yield json.loads(data)
+
+
+class StreamAssembler:
+    """Rebuild a chat completion message from streamed deltas."""
+
+    def __init__(
+        self,
+        *,
+        on_text: Callable[[str], None] | None = None,
+        on_tool_call: Callable[[dict[str, Any]], None] | None = None,
+    ) -> None:
+        self.on_text = on_text
+        self.on_tool_call = on_tool_call
+        self.content_parts: list[str] = []
+        self.tool_calls: dict[int, dict[str, Any]] = {}
+        self.finish_reason: str | None = None
+        self.usage: dict[str, Any] | None = None
+        self._emitted: set[int] = set()
+
+    def feed(self, chunk: dict[str, Any]) -> None:
+        if "error" in chunk:
+            error = chunk["error"]
+            message = error.get("message", error) if isinstance(error, dict) else error
+            raise RuntimeError(f"stream error: {message}")
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            delta = choice.get("delta") or {}
+            text = delta.get("content")
+            if text:
+                self.content_parts.append(text)
+                if self.on_text:
+                    self.on_text(text)
+            for fragment in delta.get("tool_calls") or []:
+                self._add_fragment(fragment)
+            if choice.get("finish_reason"):
+                self.finish_reason = choice["finish_reason"]
+                self.finish()
+
+    def _add_fragment(self, fragment: dict[str, Any]) -> None:
+        if "index" in fragment:
+            index = int(fragment["index"])
+        else:
+            # Some providers leave out the index: a fragment continues the latest call
+            # unless it carries the id of a different one.
+            index = max(self.tool_calls, default=0)
+            current = self.tool_calls.get(index)
+            if current and fragment.get("id") and current["id"] and fragment["id"] != current["id"]:
+                index += 1
+        # Providers send calls in index order, so a new index closes the earlier ones.
+        for earlier in sorted(self.tool_calls):
+            if earlier < index:
+                self._emit(earlier)
+        call = self.tool_calls.setdefault(
+            index,
+            {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+        )
+        if fragment.get("id"):
+            call["id"] = fragment["id"]
+        if fragment.get("type"):
+            call["type"] = fragment["type"]
+        function = fragment.get("function") or {}
+        if function.get("name"):
+            call["function"]["name"] += function["name"]
+        if function.get("arguments"):
+            call["function"]["arguments"] += function["arguments"]
+
+    def _emit(self, index: int) -> None:
+        if index in self._emitted:
+            return
+        self._emitted.add(index)
+        if self.on_tool_call:
+            self.on_tool_call(self.tool_calls[index])
+
+    def finish(self) -> None:
+        for index in sorted(self.tool_calls):
+            self._emit(index)
+
+    def message(self) -> dict[str, Any]:
+        message: dict[str, Any] = {"role": "assistant", "content": "".join(self.content_parts)}
+        if self.tool_calls:
+            message["tool_calls"] = [self.tool_calls[i] for i in sorted(self.tool_calls)]
+        return message
+
+    def response(self) -> dict[str, Any]:
+        parsed: dict[str, Any] = {
+            "choices": [{"message": self.message(), "finish_reason": self.finish_reason}],
+        }
+        if self.usage:
+            parsed["usage"] = self.usage
+        return parsed
+
+
+@functools.cache
+def _response_cache(directory: str, max_entries: int, ttl_seconds: float | None) -> ResponseCache:
+    return ResponseCache(directory, max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+
+@functools.cache
+def _session_recorder(path: str) -> SessionRecorder:
+    return SessionRecorder(path)
+
+
+@functools.cache
+def _session_replayer(path: str) -> SessionReplayer:
+    return SessionReplayer(path)
+
+
+def client_options_from_env() -> dict[str, Any]:
+    """Read transport options from `OPENROUTER_*` environment variables.
+
+    The cache, recorder and replayer are built once per process, so every
+    endpoint client (primary and fallbacks) shares hits and appends to one file
+    through one recorder.
+    """
+    cache_dir = os.getenv("OPENROUTER_CACHE_DIR", "").strip()
+    ttl = os.getenv("OPENROUTER_CACHE_TTL", "").strip()
+    record_path = os.getenv("OPENROUTER_RECORD", "").strip()
+    replay_path = os.getenv("OPENROUTER_REPLAY", "").strip()
+    return {
+        "pool_size": int(os.getenv("OPENROUTER_POOL_SIZE", str(DEFAULT_POOL_SIZE))),
+        "connect_timeout": float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", str(DEFAULT_CONNECT_TIMEOUT))),
+        "read_timeout": float(os.getenv("OPENROUTER_READ_TIMEOUT", str(DEFAULT_READ_TIMEOUT))),
+        "gzip_requests": os.getenv("OPENROUTER_GZIP", "").lower() in {"1", "true", "yes"},
+        "pooled": os.getenv("OPENROUTER_POOLED", "1").lower() not in {"0", "false", "no"},
+        "cache": _response_cache(
+            cache_dir,
+            int(os.getenv("OPENROUTER_CACHE_MAX_ENTRIES", "1000")),
+            float(ttl) if ttl else None,
+        )
+        if cache_dir
+        else None,
+        "recorder": _session_recorder(record_path) if record_path else None,
+        "replayer": _session_replayer(replay_path) if replay_path else None,
+    }
+
+
+_CLIENTS: dict[tuple[str, str], OpenRouterClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(api_key: str, base_url: str) -> OpenRouterClient:
+    """Return the process-wide shared client for one (base_url, api_key) pair."""
+    key = (base_url.rstrip("/"), api_key)
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = OpenRouterClient(api_key=api_key, base_url=base_url, **client_options_from_env())
+            _CLIENTS[key] = client
+        return client
+
+
+def endpoints_from_env(api_key: str, base_url: str, model: str | None = None) -> list[Endpoint]:
+    """The primary endpoint followed by any `OPENROUTER_FALLBACKS`.
+
+    `OPENROUTER_FALLBACKS` is a JSON list of objects with `base_url` and
+    optional `api_key` and `model`; missing fields default to the primary's.
+    """
+    threshold = int(os.getenv("OPENROUTER_BREAKER_THRESHOLD", "3"))
+    reset = float(os.getenv("OPENROUTER_BREAKER_RESET", "30"))
+    specs = [{"base_url": base_url, "api_key": api_key, "model": model}]
+    raw = os.getenv("OPENROUTER_FALLBACKS", "").strip()
+    if raw:
+        for spec in json.loads(raw):
+            specs.append(
+                {
+                    "base_url": spec.get("base_url") or base_url,
+                    "api_key": spec.get("api_key") or api_key,
+                    "model": spec.get("model") or model,
+                }
+            )
+    return [
+        Endpoint(
+            client=get_client(spec["api_key"], spec["base_url"]),
+            model=spec["model"],
+            name=f"{spec['base_url'].rstrip('/')}#{spec['model'] or 'default'}",
+            breaker=CircuitBreaker(threshold, reset),
+        )
+        for spec in specs
+    ]
+
+
+def resilient_options_from_env() -> dict[str, Any]:
+    """Read retry and hedging options from `OPENROUTER_*` environment variables."""
+    return {
+        "retry": RetryPolicy(
+            max_attempts=max(1, int(os.getenv("OPENROUTER_MAX_ATTEMPTS", "3"))),
+            base_delay=float(os.getenv("OPENROUTER_BACKOFF_BASE", "0.5")),
+            max_delay=float(os.getenv("OPENROUTER_BACKOFF_MAX", "20")),
+        ),
+        "hedge_after": float(os.getenv("OPENROUTER_HEDGE_AFTER", "0") or 0),
+    }
+
+
+_RESILIENT: dict[tuple[str, str], ResilientClient] = {}
+
+
+def get_resilient_client(api_key: str, base_url: str) -> ResilientClient:
+    """Process-wide retrying/failover client whose primary endpoint is (base_url, api_key).
+
+    The primary keeps the model the caller asks for; fallbacks may override it.
+    """
+    key = (base_url.rstrip("/"), api_key)
+    with _CLIENTS_LOCK:
+        client = _RESILIENT.get(key)
+    if client is None:
+        client = ResilientClient(endpoints_from_env(api_key, base_url), **resilient_options_from_env())
+        with _CLIENTS_LOCK:
+            client = _RESILIENT.setdefault(key, client)
+    return client
 
 
 def call_model(
@@ -16,30 +489,13 @@ def call_model(
     model: str,
     messages: list[dict[str, str]],
     tools: list[dict[str, Any]] | None = None,
+    stream: bool = False,
+    on_text: Callable[[str], None] | None = None,
+    on_tool_call: Callable[[dict[str, Any]], None] | None = None,
 ) -> dict[str, Any]:
-    url = f"{base_url.rstrip('/')}/chat/completions"
-    payload: dict[str, Any] = {
-        "model": model,
-        "messages": messages,
-        "temperature": 0.2,
-    }
-    if tools:
-        payload["tools"] = tools
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-        # Optional but recommended by OpenRouter
-        "HTTP-Referer": "http://localhost",
-        "X-Title": "mini-agent",
-    }
-
-    resp = requests.post(url, headers=headers, data=json.dumps(payload), timeout=60)
-    resp.raise_for_status()
-    parsed = resp.json()
-    if os.getenv("DEBUG", "").lower() in {"1", "true", "yes"}:
-        message = parsed["choices"][0]["message"]
-        content = message.get("content", "")
-        print("DEBUG response_message:", content)
-        if message.get("tool_calls"):
-            print("DEBUG response_tool_calls:", message["tool_calls"])
-    return parsed
+    client = get_resilient_client(api_key, base_url)
+    if stream:
+        return client.chat_stream(
+            model=model, messages=messages, tools=tools, on_text=on_text, on_tool_call=on_tool_call
+        )
+    return client.chat(model=model, messages=messages, tools=tools)
@@ -0,0 +1,333 @@
+"""Multi-file patches: validate everything, preview once, write atomically."""
+
+from __future__ import annotations
+
+import os
+import re
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from .file_cache import FILE_CACHE
+
+DIFF_CONTEXT = 3
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    """A patch that cannot be applied; the message lists every problem found."""
+
+
+@dataclass
+class Hunk:
+    old_start: int
+    lines: list[str] = field(default_factory=list)  # diff body lines, each starting with " ", "-" or "+"
+
+    @property
+    def old(self) -> list[str]:
+        return [line[1:] for line in self.lines if line[:1] in (" ", "-")]
+
+    @property
+    def new(self) -> list[str]:
+        return [line[1:] for line in self.lines if line[:1] in (" ", "+")]
+
+
+@dataclass
+class FilePatch:
+    old_path: str | None  # None for a new file
+    new_path: str | None  # None for a deleted file
+    hunks: list[Hunk] = field(default_factory=list)
+
+
+@dataclass
+class FileChange:
+    """Planned new content of one file; None means the file does not exist before/after."""
+
+    display: str
+    path: Path
+    before: str | None
+    after: str | None
+
+
+def _strip_prefix(name: str) -> str | None:
+    name = name.split("\t", 1)[0].strip()
+    if name == "/dev/null":
+        return None
+    return name[2:] if name.startswith(("a/", "b/")) else name
+
+
+def parse_unified_diff(text: str) -> list[FilePatch]:
+    patches: list[FilePatch] = []
+    lines = text.splitlines()
+    i = 0
+    current: FilePatch | None = None
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = FilePatch(_strip_prefix(line[4:]), _strip_prefix(lines[i + 1][4:]))
+            patches.append(current)
+            i += 2
+            continue
+        match = _HUNK_RE.match(line)
+        if match:
+            if current is None:
+                raise PatchError("hunk before any '---'/'+++' file header")
+            old_count = int(match.group(2) or 1)
+            new_count = int(match.group(4) or 1)
+            hunk = Hunk(int(match.group(1)))
+            i += 1
+            seen_old = seen_new = 0
+            while i < len(lines) and (seen_old < old_count or seen_new < new_count):
+                body = lines[i]
+                if body.startswith("\\"):  # "\ No newline at end of file"
+                    i += 1
+                    continue
+                body = body or " "  # some tools drop the space on empty context lines
+                kind = body[0]
+                if kind not in " -+":
+                    break
+                seen_old += kind in " -"
+                seen_new += kind in " +"
+                hunk.lines.append(body)
+                i += 1
+            current.hunks.append(hunk)
+            continue
+        i += 1
+    if not patches:
+        raise PatchError("no file headers ('--- a/path' / '+++ b/path') found in patch")
+    return patches
+
+
+def _find_block(lines: list[str], block: list[str], expected: int, start: int) -> int | None:
+    """Line index where `block` occurs at or after `start`, nearest to `expected`."""
+    if not block:
+        return min(max(expected, start), len(lines))
+    width = len(block)
+    if 0 <= expected <= len(lines) - width and expected >= start and lines[expected : expected + width] == block:
+        return expected
+    first = block[0]
+    matches = [
+        i
+        for i in range(start, len(lines) - width + 1)
+        if lines[i] == first and lines[i : i + width] == block
+    ]
+    if not matches:
+        return None
+    return min(matches, key=lambda i: abs(i - expected))
+
+
+def apply_hunks(text: str, hunks: list[Hunk], display: str) -> str:
+    lines = text.split("\n") if text else []
+    trailing_newline = text.endswith("\n")
+    if trailing_newline:
+        lines.pop()
+    out: list[str] = []
+    cursor = 0
+    offset = 0
+    for number, hunk in enumerate(hunks, 1):
+        expected = max(0, hunk.old_start - 1 + offset) if hunk.old else hunk.old_start + offset
+        position = _find_block(lines, hunk.old, expected, cursor)
+        if position is None:
+            raise PatchError(f"{display}: hunk {number} (@@ -{hunk.old_start}) does not match the file")
+        out.extend(lines[cursor:position])
+        out.extend(hunk.new)
+        cursor = position + len(hunk.old)
+        offset = position - (hunk.old_start - 1) + len(hunk.new) - len(hunk.old)
+    out.extend(lines[cursor:])
+    result = "\n".join(out)
+    if out and (trailing_newline or not text):
+        result += "\n"
+    return result
+
+
+def region_diff(before: str, after: str, display: str, context: int = DIFF_CONTEXT) -> str:
+    """Unified diff that only runs difflib over the changed region of the file.
+
+    Common leading and trailing lines are skipped with a linear scan first,
+    so previewing a small edit in a large file stays cheap.
+    """
+    import difflib
+
+    a = before.splitlines()
+    b = after.splitlines()
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[len(a) - 1 - suffix] == b[len(b) - 1 - suffix]:
+        suffix += 1
+    start = max(0, prefix - context)
+    a_end = min(len(a), len(a) - suffix + context)
+    b_end = min(len(b), len(b) - suffix + context)
+    body = list(difflib.unified_diff(a[start:a_end], b[start:b_end], display, display, n=context, lineterm=""))
+    if not body:
+        return ""
+
+    def shift(match: re.Match[str]) -> str:
+        old_start, old_len, new_start, new_len = match.groups()
+        old_start = int(old_start) + start if int(old_start) or old_len != "0" else start
+        new_start = int(new_start) + start if int(new_start) or new_len != "0" else start
+        old_part = f"{old_start},{old_len}" if old_len is not None else f"{old_start}"
+        new_part = f"{new_start},{new_len}" if new_len is not None else f"{new_start}"
+        return f"@@ -{old_part} +{new_part} @@"
+
+    return "\n".join(_HUNK_RE.sub(shift, line) if line.startswith("@@") else line for line in body)
+
+
+def _read(path: Path) -> str:
+    return FILE_CACHE.read_text(path)
+
+
+def plan_patch(
+    resolve: Callable[[str], Path | None], edits: list[dict] | None = None, patch: str | None = None
+) -> list[FileChange]:
+    """Check every edit and hunk against the current files and return the new contents.
+
+    `resolve` maps a tool-supplied path into the workspace (None if outside it).
+    Raises `PatchError` listing all problems; nothing is written here.
+    """
+    problems: list[str] = []
+    changes: dict[Path, FileChange] = {}
+
+    def _resolve(display: str) -> Path | None:
+        path = resolve(display)
+        if path is None:
+            problems.append(f"{display or '(empty)'}: invalid path")
+        return path
+
+    def current(path: Path) -> str | None:
+        change = changes.get(path)
+        if change is not None:
+            return change.after
+        if path.is_file():
+            return _read(path)
+        return None
+
+    def update(display: str, path: Path, after: str | None) -> None:
+        if path in changes:
+            changes[path].after = after
+        else:
+            before = _read(path) if path.is_file() else None
+            changes[path] = FileChange(display, path, before, after)
+
+    for number, edit in enumerate(edits or [], 1):
+        if not isinstance(edit, dict):
+            problems.append(f"edit {number}: must be an object")
+            continue
+        display = str(edit.get("path", ""))
+        target = str(edit.get("target", ""))
+        replacement = str(edit.get("replacement", ""))
+        path = _resolve(display)
+        if path is None:
+            continue
+        text = current(path)
+        if text is None:
+            problems.append(f"{display}: file not found (edit {number})")
+            continue
+        if not target:
+            problems.append(f"{display}: edit {number} has an empty target")
+            continue
+        count = text.count(target)
+        if count == 0:
+            problems.append(f"{display}: target of edit {number} not found")
+            continue
+        if count > 1 and not edit.get("replace_all"):
+            problems.append(f"{display}: target of edit {number} matches {count} times; add context or set replace_all")
+            continue
+        update(display, path, text.replace(target, replacement) if edit.get("replace_all") else text.replace(target, replacement, 1))
+
+    if patch:
+        try:
+            file_patches = parse_unified_diff(patch)
+        except PatchError as exc:
+            problems.append(str(exc))
+            file_patches = []
+        for file_patch in file_patches:
+            display = file_patch.new_path or file_patch.old_path or ""
+            path = _resolve(display)
+            if path is None:
+                continue
+            text = current(path)
+            if file_patch.old_path is None:
+                if text is not None:
+                    problems.append(f"{display}: patch creates a file that already exists")
+                    continue
+                if not path.parent.is_dir():
+                    problems.append(f"{display}: parent directory does not exist")
+                    continue
+                text = ""
+            elif text is None:
+                problems.append(f"{display}: file not found")
+                continue
+            try:
+                after = apply_hunks(text, file_patch.hunks, display)
+            except PatchError as exc:
+                problems.append(str(exc))
+                continue
+            update(display, path, None if file_patch.new_path is None else after)
+
+    if problems:
+        raise PatchError("patch rejected, nothing was changed:\n" + "\n".join(f"- {p}" for p in problems))
+    return [change for change in changes.values() if change.before != change.after]
+
+
+def preview_patch(changes: list[FileChange]) -> str:
+    parts = []
+    for change in changes:
+        if change.after is None:
+            parts.append(f"--- {change.display}\n+++ /dev/null\n(delete file, {len(change.before or '')} chars)")
+        else:
+            parts.append(region_diff(change.before or "", change.after, change.display))
+    return "\n".join(part for part in parts if part)
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as handle:
+            handle.write(text)
+            handle.flush()
+            os.fsync(handle.fileno())
+        if path.exists():
+            os.chmod(tmp, path.stat().st_mode & 0o7777)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _restore(change: FileChange) -> None:
+    if change.before is None:
+        change.path.unlink(missing_ok=True)
+    else:
+        _write_atomic(change.path, change.before)
+        FILE_CACHE.store(change.path, change.before)
+
+
+def apply_changes(changes: list[FileChange]) -> str:
+    """Write every change, or none: files already written are restored if a later one fails."""
+    for change in changes:
+        now = _read(change.path) if change.path.is_file() else None
+        if now != change.before:
+            return f"error: {change.display} changed since the patch was previewed; nothing was written"
+    done: list[FileChange] = []
+    try:
+        for change in changes:
+            if change.after is None:
+                change.path.unlink()
+            else:
+                _write_atomic(change.path, change.after)
+                FILE_CACHE.store(change.path, change.after)
+            done.append(change)
+    except OSError as exc:
+        failed = change.display
+        for written in reversed(done):
+            _restore(written)
+        return f"error: writing {failed} failed ({exc}); all files were rolled back"
+    summary = ", ".join(
+        f"{c.display} ({'created' if c.before is None else 'deleted' if c.after is None else 'modified'})" for c in changes
+    )
+    return f"ok: {len(changes)} file(s) changed: {summary}"
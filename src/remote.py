@@ -0,0 +1,69 @@
+"""Thin interactive client for `src.server`: the REPL, with the agent running server-side."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any
+
+from .websocket import connect
+
+
+def _headers(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
+async def _turn(ws: Any, text: str) -> None:
+    await ws.send_json({"type": "prompt", "text": text})
+    streamed = False
+    while (message := await ws.receive()) is not None:
+        event = json.loads(message)
+        kind = event.get("type")
+        if kind == "text":
+            streamed = True
+            print(event["text"], end="", flush=True)
+        elif kind == "confirm":
+            print("EDIT PREVIEW:\n" + event["diff"])
+            reply = await asyncio.to_thread(input, "Apply this change? (yes/no) ")
+            await ws.send_json({"type": "confirm", "approved": reply.strip().lower() in {"y", "yes"}})
+        elif kind == "answer":
+            if streamed:
+                print()
+            else:
+                print(event["text"])
+            return
+        elif kind == "error":
+            print(f"error: {event['message']}")
+            return
+    raise ConnectionError("server closed the connection")
+
+
+async def remote_repl(url: str, initial_prompt: str, *, workspace: str = "", token: str = "") -> None:
+    import requests
+
+    base = url.rstrip("/")
+    reply = await asyncio.to_thread(
+        requests.post, f"{base}/sessions", json={"workspace": workspace}, headers=_headers(token), timeout=30
+    )
+    reply.raise_for_status()
+    session_id = reply.json()["session_id"]
+    ws_url = "ws" + base.removeprefix("http") + f"/sessions/{session_id}/ws"
+    ws = await connect(ws_url, _headers(token))
+    try:
+        await _turn(ws, initial_prompt)
+        while True:
+            try:
+                text = (await asyncio.to_thread(input, "> ")).strip()
+            except EOFError:
+                print()
+                break
+            if not text:
+                continue
+            if text.lower() in {"exit", "quit"}:
+                break
+            await _turn(ws, text)
+    finally:
+        await ws.close()
+        await asyncio.to_thread(
+            requests.delete, f"{base}/sessions/{session_id}", headers=_headers(token), timeout=30
+        )
@@ -0,0 +1,64 @@
+"""Incremental JSON encoding of chat completion requests."""
+
+from __future__ import annotations
+
+import json
+import threading
+from typing import Any
+
+# Fixed key order: everything that stays the same across rounds comes first,
+# so the serialized prefix (model, tools, system message, older history) is
+# byte-identical from one round to the next.
+_LEADING_KEYS = ("model", "temperature", "stream", "tools")
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class RequestBuilder:
+    """Build request bodies by joining cached per-message JSON bytes.
+
+    Each message dict is encoded once, the first time it is sent, so a round
+    only pays for the messages added since the previous one. The cache is
+    keyed on object identity; messages are never mutated in place (context
+    compaction replaces them), so a cached encoding is always current.
+    """
+
+    def __init__(self) -> None:
+        self._messages: dict[int, tuple[dict, bytes]] = {}
+        self._tools: tuple[object, bytes] | None = None
+        self._lock = threading.Lock()
+
+    def _message_bytes(self, message: dict) -> bytes:
+        cached = self._messages.get(id(message))
+        if cached and cached[0] is message:
+            return cached[1]
+        encoded = _dumps(message)
+        self._messages[id(message)] = (message, encoded)
+        return encoded
+
+    def _tools_bytes(self, tools: list[dict]) -> bytes:
+        if self._tools and self._tools[0] is tools:
+            return self._tools[1]
+        encoded = _dumps(tools)
+        self._tools = (tools, encoded)
+        return encoded
+
+    def build(self, payload: dict[str, Any]) -> bytes:
+        with self._lock:
+            parts: list[bytes] = []
+            for key in _LEADING_KEYS:
+                if key not in payload:
+                    continue
+                value = self._tools_bytes(payload[key]) if key == "tools" else _dumps(payload[key])
+                parts.append(b'"' + key.encode() + b'":' + value)
+            for key, value in payload.items():
+                if key not in _LEADING_KEYS and key != "messages":
+                    parts.append(_dumps(key) + b":" + _dumps(value))
+            messages = payload.get("messages", [])
+            parts.append(b'"messages":[' + b",".join(self._message_bytes(m) for m in messages) + b"]")
+            if len(self._messages) > 2 * len(messages) + 16:
+                live = {id(m) for m in messages}
+                self._messages = {k: v for k, v in self._messages.items() if k in live}
+            return b"{" + b",".join(parts) + b"}"
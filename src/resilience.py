@@ -0,0 +1,257 @@
+"""Retries, hedged requests and failover across model endpoints."""
+
+from __future__ import annotations
+
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from .tracing import TRACER
+
+RETRY_STATUSES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+# Errors that another endpoint (different key or provider) may not have.
+FAILOVER_STATUSES = frozenset({401, 402, 403, 404})
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """The `Retry-After` header of a failed response, in seconds."""
+    response = getattr(exc, "response", None)
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils  # HTTP-date form; rare, and the email package is slow to import
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def classify_error(exc: BaseException) -> str:
+    """`"retry"`, `"failover"` or `"raise"` for an exception from one model request."""
+    requests = sys.modules.get("requests")  # not imported yet means not a requests error
+    if requests is not None and isinstance(exc, requests.HTTPError):
+        status = exc.response.status_code if exc.response is not None else 0
+        if status in RETRY_STATUSES:
+            return "retry"
+        if status in FAILOVER_STATUSES:
+            return "failover"
+        return "raise"
+    if requests is not None and isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return "retry"
+    if isinstance(exc, RuntimeError) and str(exc).startswith("stream error"):
+        return "retry"
+    return "raise"
+
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff that honours `Retry-After`."""
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float | None:
+        """Seconds to wait before attempt `attempt + 1`, or None to give up on this endpoint."""
+        if retry_after is not None:
+            # A server asking for a longer pause than we are willing to wait: try elsewhere.
+            return retry_after + random.uniform(0, 0.1) if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Stop sending to an endpoint after repeated failures, then probe it again later.
+
+    Closed until `failure_threshold` consecutive failures; then open for
+    `reset_timeout` seconds, after which requests may go through again
+    (half-open). One more failure reopens it, one success closes it.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def available(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+@dataclass
+class Endpoint:
+    """One model client plus the model to ask it for (None keeps the caller's model)."""
+
+    client: Any
+    model: str | None = None
+    name: str = ""
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    latency: float | None = None  # moving average of successful request times, seconds
+    successes: int = 0
+    failures: int = 0
+
+    def observe(self, elapsed: float, alpha: float = 0.3) -> None:
+        self.latency = elapsed if self.latency is None else alpha * elapsed + (1 - alpha) * self.latency
+
+
+class ResilientClient:
+    """Model client with retries, optional hedging and failover across endpoints.
+
+    Endpoints are tried fastest first among those whose circuit breaker is
+    not open; endpoints without a latency measurement keep their configured
+    order after the measured ones. With `hedge_after` set, a non-streaming
+    request that has not answered within that many seconds is duplicated to
+    the next endpoint and whichever answers first wins. Streaming requests
+    are never retried once text or a tool call has been handed to the
+    caller, so callbacks never see the same output twice.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[Endpoint],
+        *,
+        retry: RetryPolicy | None = None,
+        hedge_after: float = 0.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if not endpoints:
+            raise ValueError("at least one endpoint is required")
+        self.endpoints = endpoints
+        self.retry = retry or RetryPolicy()
+        self.hedge_after = hedge_after
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def candidates(self) -> list[Endpoint]:
+        healthy = [e for e in self.endpoints if e.breaker.available()]
+        # Everything is failing: trying anyway beats failing without a request.
+        pool = healthy or list(self.endpoints)
+        return sorted(pool, key=lambda e: float("inf") if e.latency is None else e.latency)
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "name": e.name,
+                "state": e.breaker.state,
+                "latency_ms": None if e.latency is None else round(e.latency * 1000, 1),
+                "successes": e.successes,
+                "failures": e.failures,
+            }
+            for e in self.endpoints
+        ]
+
+    def chat(self, **kwargs: Any) -> dict[str, Any]:
+        return self._call("chat", kwargs)
+
+    def chat_stream(self, **kwargs: Any) -> dict[str, Any]:
+        emitted = False
+
+        def wrap(callback: Callable[[Any], None] | None) -> Callable[[Any], None] | None:
+            if callback is None:
+                return None
+
+            def tracked(value: Any) -> None:
+                nonlocal emitted
+                emitted = True
+                callback(value)
+
+            return tracked
+
+        kwargs = {**kwargs, "on_text": wrap(kwargs.get("on_text")), "on_tool_call": wrap(kwargs.get("on_tool_call"))}
+        return self._call("chat_stream", kwargs, lambda: emitted)
+
+    def _attempt(self, endpoint: Endpoint, method: str, kwargs: dict[str, Any]) -> dict[str, Any]:
+        if endpoint.model:
+            kwargs = {**kwargs, "model": endpoint.model}
+        start = time.perf_counter()
+        try:
+            result = getattr(endpoint.client, method)(**kwargs)
+        except Exception as exc:
+            if classify_error(exc) != "raise":
+                with self._lock:
+                    endpoint.failures += 1
+                endpoint.breaker.record_failure()
+            raise
+        with self._lock:
+            endpoint.successes += 1
+            endpoint.observe(time.perf_counter() - start)
+        endpoint.breaker.record_success()
+        return result
+
+    def _hedged(self, primary: Endpoint, backup: Endpoint, kwargs: dict[str, Any]) -> dict[str, Any]:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+        futures: dict[Future, Endpoint] = {self._executor.submit(self._attempt, primary, "chat", kwargs): primary}
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            TRACER.current().set(hedged=True)
+            futures[self._executor.submit(self._attempt, backup, "chat", kwargs)] = backup
+        pending = set(futures)
+        first_error: BaseException | None = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()  # the slower request finishes in the background
+                first_error = first_error or future.exception()
+        assert first_error is not None
+        raise first_error
+
+    def _call(
+        self, method: str, kwargs: dict[str, Any], emitted: Callable[[], bool] = lambda: False
+    ) -> dict[str, Any]:
+        candidates = self.candidates()
+        last_error: BaseException | None = None
+        for position, endpoint in enumerate(candidates):
+            for attempt in range(1, self.retry.max_attempts + 1):
+                try:
+                    if method == "chat" and self.hedge_after > 0 and attempt == 1 and position + 1 < len(candidates):
+                        return self._hedged(endpoint, candidates[position + 1], kwargs)
+                    return self._attempt(endpoint, method, kwargs)
+                except Exception as exc:
+                    last_error = exc
+                    action = classify_error(exc)
+                    if action == "raise" or emitted():
+                        raise
+                if action == "failover" or attempt == self.retry.max_attempts:
+                    break
+                delay = self.retry.delay(attempt, retry_after_seconds(last_error))
+                if delay is None:
+                    break
+                with TRACER.span("backoff", endpoint=endpoint.name, attempt=attempt, delay_ms=round(delay * 1000, 1)):
+                    self.sleep(delay)
+        assert last_error is not None
+        raise last_error
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
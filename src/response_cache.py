@@ -0,0 +1,125 @@
+"""Content-addressed response cache and record/replay for model calls."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from pathlib import Path
+from typing import Any
+
+
+def request_key(
+    model: str,
+    messages: list[dict[str, Any]],
+    tools: list[dict[str, Any]] | None,
+    temperature: float,
+) -> str:
+    """Return a stable hash of everything that determines the model's answer."""
+    canonical = json.dumps(
+        {"model": model, "messages": messages, "tools": tools or [], "temperature": temperature},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache with one JSON file per key, an LRU entry limit and optional TTL."""
+
+    def __init__(self, directory: str | Path, max_entries: int = 1000, ttl_seconds: float | None = None) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> last access time, oldest first; file mtimes carry the order across runs.
+        self._index: OrderedDict[str, float] = OrderedDict()
+        entries = sorted((p.stat().st_mtime, p.stem) for p in self.directory.glob("*.json"))
+        for mtime, key in entries:
+            self._index[key] = mtime
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                entry = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                self._drop(key)
+                self.misses += 1
+                return None
+            if self.ttl_seconds is not None and time.time() - entry.get("stored_at", 0) > self.ttl_seconds:
+                self._drop(key)
+                self.misses += 1
+                return None
+            now = time.time()
+            os.utime(path, (now, now))
+            self._index[key] = now
+            self._index.move_to_end(key)
+            self.hits += 1
+            return entry["response"]
+
+    def put(self, key: str, response: dict[str, Any]) -> None:
+        with self._lock:
+            path = self._path(key)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"stored_at": time.time(), "response": response}, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(path)
+            self._index[key] = time.time()
+            self._index.move_to_end(key)
+            while len(self._index) > self.max_entries:
+                self._drop(next(iter(self._index)))
+
+    def _drop(self, key: str) -> None:
+        self._index.pop(key, None)
+        self._path(key).unlink(missing_ok=True)
+
+
+class SessionRecorder:
+    """Append every request/response pair to a JSONL session file."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def record(self, key: str, request: dict[str, Any], response: dict[str, Any]) -> None:
+        line = json.dumps({"key": key, "request": request, "response": response}, ensure_ascii=False)
+        with self._lock, self.path.open("a", encoding="utf-8") as handle:
+            handle.write(line + "\n")
+
+
+class SessionReplayer:
+    """Serve responses from a recorded session file without touching the network.
+
+    Identical requests recorded several times are answered in recording order.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._responses: dict[str, deque[dict[str, Any]]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        for line in self.path.read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                self._responses[entry["key"]].append(entry["response"])
+
+    def lookup(self, key: str) -> dict[str, Any]:
+        with self._lock:
+            queue = self._responses.get(key)
+            if not queue:
+                raise LookupError(f"replay: no recorded response for request {key[:12]} in {self.path}")
+            # Keep the last answer around so a replayed loop can repeat a request.
+            return queue.popleft() if len(queue) > 1 else queue[0]
@@ -0,0 +1,150 @@
+"""Concurrent execution of the tool calls from one model round."""
+
+from __future__ import annotations
+
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable
+
+from .tool_registry import REGISTRY
+from .tools import resolve_path
+from .tracing import TRACER
+
+
+@dataclass(frozen=True)
+class ToolResult:
+    """Outcome of one tool call."""
+
+    call_id: str
+    name: str
+    content: str
+    elapsed: float
+
+    def message(self) -> dict[str, str]:
+        return {"role": "tool", "tool_call_id": self.call_id, "content": self.content}
+
+
+@dataclass(frozen=True)
+class _Access:
+    kind: str  # "pure", "read", "scan", "write" or "barrier"
+    path: str | None = None
+
+    def conflicts_with(self, other: _Access) -> bool:
+        if self.kind == "barrier" or other.kind == "barrier":
+            return True
+        if "pure" in (self.kind, other.kind):
+            return False
+        if "scan" in (self.kind, other.kind):
+            return "write" in (self.kind, other.kind)
+        if self.path is None or self.path != other.path:
+            return False
+        return "write" in (self.kind, other.kind)
+
+
+def _classify(name: str, args: dict) -> _Access:
+    # Each tool declares its access kind when registered: "read" and "write" tools
+    # touch the path in their arguments, and run_shell and unknown tools are barriers.
+    kind = REGISTRY.access(name)
+    if kind in {"read", "write"}:
+        raw = str(args.get("path", ""))
+        resolved = resolve_path(raw)
+        return _Access(kind, str(resolved) if resolved else raw)
+    return _Access(kind)
+
+
+class ToolScheduler:
+    """Run independent tool calls in a thread pool, ordering conflicting ones.
+
+    Calls touching the same path are serialized when either one writes,
+    workspace-wide reads (`search_files`, `glob_files`) wait for writes, and a
+    `run_shell` (or any unknown tool) waits for every earlier call and blocks
+    every later one. Results always come back in the original call order.
+    """
+
+    def __init__(self, runner: Callable[[str, dict], str], max_workers: int = 4) -> None:
+        self.runner = runner
+        self.max_workers = max(1, max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+
+    def call(self, name: str, args: dict) -> str:
+        """Run one tool call, reporting exceptions as an error result."""
+        with TRACER.span("tool_call", tool=name) as span:
+            try:
+                content = self.runner(name, args)
+            except Exception as exc:
+                content = f"error: {type(exc).__name__}: {exc}"
+            outcome = "error" if content.startswith("error") else "canceled" if content == "canceled" else "ok"
+            span.set(outcome=outcome, result_bytes=len(content))
+        return content
+
+    def _timed(self, name: str, args: dict) -> tuple[str, float]:
+        start = time.perf_counter()
+        content = self.call(name, args)
+        return content, time.perf_counter() - start
+
+    def run(
+        self,
+        tool_calls: list[dict],
+        prefetched: dict[str, tuple[Future[str], float]] | None = None,
+    ) -> list[ToolResult]:
+        """Run one round of calls; `prefetched` maps call ids already submitted to (future, submit time)."""
+        prefetched = prefetched or {}
+        count = len(tool_calls)
+        functions = [call.get("function") or {} for call in tool_calls]
+        names = [str(function.get("name") or "") for function in functions]
+        parsed: list[dict | None] = []
+        with TRACER.span("json_parse", source="tool_arguments", calls=count):
+            for function in functions:
+                try:
+                    args = json.loads(function.get("arguments") or "{}")
+                except (json.JSONDecodeError, TypeError):
+                    args = None
+                parsed.append(args if isinstance(args, dict) else None)
+        accesses = [_classify(names[i], parsed[i] or {}) for i in range(count)]
+        deps = [{j for j in range(i) if accesses[i].conflicts_with(accesses[j])} for i in range(count)]
+
+        outcomes: dict[int, tuple[str, float]] = {}
+        running: dict[Future, int] = {}
+        started: dict[int, float] = {}
+        waiting = list(range(count))
+        for i, call in enumerate(tool_calls):
+            if not names[i] or not call.get("id"):
+                outcomes[i] = ("error: malformed tool call", 0.0)
+                waiting.remove(i)
+            elif parsed[i] is None:
+                outcomes[i] = ("error: invalid tool arguments", 0.0)
+                waiting.remove(i)
+            elif call["id"] in prefetched:
+                # Timed from when the call was dispatched during streaming, not from now.
+                future, started[i] = prefetched[call["id"]]
+                running[future] = i
+                waiting.remove(i)
+
+        while waiting or running:
+            for i in list(waiting):
+                if len(running) >= self.max_workers:
+                    break
+                if deps[i] <= outcomes.keys():
+                    running[self.executor.submit(self._timed, names[i], parsed[i])] = i
+                    waiting.remove(i)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                if i in started:
+                    try:
+                        content = future.result()
+                    except Exception as exc:
+                        content = f"error: {type(exc).__name__}: {exc}"
+                    outcomes[i] = (content, time.perf_counter() - started[i])
+                else:
+                    outcomes[i] = future.result()
+
+        return [
+            ToolResult(call_id=call.get("id") or "", name=names[i], content=outcomes[i][0], elapsed=outcomes[i][1])
+            for i, call in enumerate(tool_calls)
+        ]
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
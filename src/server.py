@@ -0,0 +1,398 @@
+"""Multi-session server: many agent conversations in one process over HTTP and WebSocket.
+
+Routes (JSON bodies and replies):
+
+- `GET /health`
+- `GET /sessions`, `POST /sessions` (`{"workspace": "sub/dir", "approve_edits": false}`)
+- `DELETE /sessions/<id>`
+- `POST /sessions/<id>/turns` (`{"prompt": "..."}`) answers with `{"text", "rounds"}`
+- `GET /sessions/<id>/ws` upgrades to a WebSocket. Send `{"type": "prompt", "text": ...}`
+  and `{"type": "confirm", "approved": bool}`; receive `text`, `tool_call`,
+  `tool_result`, `confirm`, `answer` and `error` events.
+
+Without a token the server only listens on loopback addresses. Requests
+from another web origin are refused (a page open in a local browser could
+otherwise drive it), and POST bodies must be sent as `application/json`,
+which a cross-site form cannot do without a preflight.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import json
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlsplit
+
+from .agent import Agent, TurnResult
+from .batch import LimitedClient, RateLimiter
+from .skill_loader import SkillLoader
+from .websocket import WebSocket, handshake_response
+
+# How long an edit waits for a WebSocket client to approve it before it is canceled.
+CONFIRM_TIMEOUT = 300.0
+MAX_BODY_BYTES = 1024 * 1024
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # a host name, or "" for every interface
+
+
+def _cross_origin(headers: dict[str, str]) -> bool:
+    """True for browser requests from a page not served by this server (non-browser clients send no Origin)."""
+    origin = headers.get("origin")
+    if origin is None:
+        return False
+    return urlsplit(origin).netloc.lower() != headers.get("host", "").lower()
+
+
+_REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    415: "Unsupported Media Type",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+}
+
+
+class AgentSession:
+    """One conversation with async turns.
+
+    The agent loop itself is blocking (HTTP requests, tools), so each turn runs
+    on the server's turn executor and the event loop stays free. Turns of one
+    session run one at a time. Agent events are handed to the listener queue
+    of the current turn, and edit confirmations are asked over it when the
+    turn came from a WebSocket.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        config: dict[str, str],
+        client: Any,
+        skill_loader: SkillLoader,
+        *,
+        workspace: Path,
+        approve_edits: bool = False,
+    ) -> None:
+        self.session_id = session_id
+        self.workspace = workspace
+        self.approve_edits = approve_edits
+        self.created = time.time()
+        self.turns = 0
+        self.agent = Agent(
+            config,
+            client,
+            skill_loader,
+            confirm=self._confirm,
+            echo=False,
+            workspace=workspace,
+            on_event=self._on_event,
+        )
+        self._lock = asyncio.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._listener: asyncio.Queue[dict[str, Any] | None] | None = None
+        self._answers: asyncio.Queue[bool] = asyncio.Queue()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def info(self) -> dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "workspace": str(self.workspace),
+            "turns": self.turns,
+            "messages": len(self.agent.history),
+            "busy": self.busy,
+            "created": self.created,
+        }
+
+    async def run_turn(
+        self,
+        text: str,
+        executor: ThreadPoolExecutor,
+        listener: asyncio.Queue[dict[str, Any] | None] | None = None,
+    ) -> TurnResult:
+        async with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._listener = listener
+            try:
+                result = await self._loop.run_in_executor(executor, self.agent.run_turn, text)
+            finally:
+                self._listener = None
+            self.turns += 1
+            return result
+
+    def answer(self, approved: bool) -> None:
+        self._answers.put_nowait(approved)
+
+    def _on_event(self, event: dict[str, Any]) -> None:
+        # Called from agent worker threads.
+        if self._listener is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._listener.put_nowait, event)
+
+    async def _ask(self, diff: str) -> bool:
+        while not self._answers.empty():
+            self._answers.get_nowait()  # drop stale answers
+        assert self._listener is not None
+        self._listener.put_nowait({"type": "confirm", "diff": diff})
+        try:
+            return await asyncio.wait_for(self._answers.get(), CONFIRM_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+
+    def _confirm(self, diff: str) -> bool:
+        # Called from a tool thread while the turn is running.
+        if self.approve_edits:
+            return True
+        if self._listener is None or self._loop is None:
+            return False
+        return asyncio.run_coroutine_threadsafe(self._ask(diff), self._loop).result()
+
+    def close(self) -> None:
+        self.agent.close()
+
+
+class AgentServer:
+    """Hosts `AgentSession`s that share one model client, skill catalog and limits."""
+
+    def __init__(
+        self,
+        config: dict[str, str],
+        client: Any,
+        skill_loader: SkillLoader,
+        *,
+        workspace_root: Path,
+        max_sessions: int = 64,
+        max_concurrent_turns: int = 16,
+        max_concurrent_requests: int = 0,
+        requests_per_second: float = 0.0,
+        token: str = "",
+    ) -> None:
+        self.config = config
+        self.skill_loader = skill_loader
+        if max_concurrent_requests or requests_per_second:
+            client = LimitedClient(client, RateLimiter(requests_per_second, max_concurrent_requests))
+        self.client = client
+        self.workspace_root = workspace_root.resolve()
+        self.max_sessions = max_sessions
+        self.token = token
+        self.sessions: dict[str, AgentSession] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_concurrent_turns), thread_name_prefix="turn")
+        self._server: asyncio.Server | None = None
+
+    # -- sessions -------------------------------------------------------------
+
+    def create_session(self, workspace: str = "", approve_edits: bool = False) -> AgentSession:
+        if len(self.sessions) >= self.max_sessions:
+            raise OverflowError(f"session limit reached ({self.max_sessions})")
+        root = (self.workspace_root / workspace).resolve()
+        if root != self.workspace_root and self.workspace_root not in root.parents:
+            raise ValueError("workspace must be inside the server workspace root")
+        if not root.is_dir():
+            raise ValueError(f"workspace does not exist: {workspace}")
+        session_id = secrets.token_hex(8)
+        session = AgentSession(
+            session_id, self.config, self.client, self.skill_loader, workspace=root, approve_edits=approve_edits
+        )
+        self.sessions[session_id] = session
+        return session
+
+    def close_session(self, session_id: str) -> bool:
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.close()
+        return True
+
+    # -- HTTP -----------------------------------------------------------------
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: Any) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode("ascii") + data)
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        upgraded = False
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                return
+            method, target, _version = request_line.split(" ", 2)
+            headers: dict[str, str] = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if self.token and not secrets.compare_digest(headers.get("authorization", ""), f"Bearer {self.token}"):
+                await self._respond(writer, 401, {"error": "unauthorized"})
+                return
+            if _cross_origin(headers):
+                await self._respond(writer, 403, {"error": "cross-origin requests are not allowed"})
+                return
+            if method == "POST" and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+                await self._respond(writer, 415, {"error": "POST bodies must be application/json"})
+                return
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_BODY_BYTES:
+                await self._respond(writer, 413, {"error": "request body too large"})
+                return
+            body = json.loads(await reader.readexactly(length) or b"{}") if length else {}
+            if not isinstance(body, dict):
+                raise ValueError("request body must be a JSON object")
+            parts = [p for p in target.split("?", 1)[0].split("/") if p]
+            if parts[-1:] == ["ws"] and method == "GET":
+                session = await self._upgrade(parts, headers, writer)
+                if session is not None:
+                    # From here on the socket speaks WebSocket: errors close it with a
+                    # close code (see `WebSocket.receive`), never with an HTTP reply.
+                    upgraded = True
+                    await self._serve_websocket(session, WebSocket(reader, writer))
+                return
+            status, reply = await self._route(method, parts, body)
+            await self._respond(writer, status, reply)
+        except (ValueError, json.JSONDecodeError) as exc:
+            if not upgraded:
+                await self._respond(writer, 400, {"error": str(exc)})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if not upgraded:
+                writer.close()
+
+    async def _route(self, method: str, parts: list[str], body: dict[str, Any]) -> tuple[int, Any]:
+        if parts == ["health"]:
+            return 200, {"ok": True, "sessions": len(self.sessions)}
+        if parts == ["sessions"]:
+            if method == "GET":
+                return 200, [session.info() for session in self.sessions.values()]
+            if method == "POST":
+                try:
+                    session = self.create_session(str(body.get("workspace") or ""), bool(body.get("approve_edits")))
+                except OverflowError as exc:
+                    return 429, {"error": str(exc)}
+                return 201, session.info()
+            return 405, {"error": "method not allowed"}
+        if len(parts) >= 2 and parts[0] == "sessions":
+            session = self.sessions.get(parts[1])
+            if session is None:
+                return 404, {"error": "unknown session"}
+            if len(parts) == 2 and method == "GET":
+                return 200, session.info()
+            if len(parts) == 2 and method == "DELETE":
+                self.close_session(session.session_id)
+                return 200, {"deleted": session.session_id}
+            if parts[2:] == ["turns"] and method == "POST":
+                prompt = str(body.get("prompt") or "").strip()
+                if not prompt:
+                    return 400, {"error": "prompt must be non-empty"}
+                try:
+                    result = await session.run_turn(prompt, self.executor)
+                except Exception as exc:
+                    return 500, {"error": f"{type(exc).__name__}: {exc}"}
+                return 200, {"text": result.text, "rounds": result.rounds}
+        return 404, {"error": "not found"}
+
+    # -- WebSocket ------------------------------------------------------------
+
+    async def _upgrade(
+        self, parts: list[str], headers: dict[str, str], writer: asyncio.StreamWriter
+    ) -> AgentSession | None:
+        """Complete the handshake and return the session, or answer with an HTTP error and return None."""
+        session = self.sessions.get(parts[1]) if len(parts) == 3 and parts[0] == "sessions" else None
+        if session is None:
+            await self._respond(writer, 404, {"error": "unknown session"})
+            return None
+        reply = handshake_response(headers)
+        if reply is None:
+            await self._respond(writer, 400, {"error": "expected a websocket upgrade"})
+            return None
+        writer.write(reply)
+        await writer.drain()
+        return session
+
+    async def _serve_websocket(self, session: AgentSession, ws: WebSocket) -> None:
+        events: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+        turn: asyncio.Task | None = None
+
+        async def pump() -> None:
+            while (event := await events.get()) is not None:
+                await ws.send_json(event)
+
+        async def run(text: str) -> None:
+            try:
+                result = await session.run_turn(text, self.executor, events)
+                events.put_nowait({"type": "answer", "text": result.text, "rounds": result.rounds})
+            except Exception as exc:
+                events.put_nowait({"type": "error", "message": f"{type(exc).__name__}: {exc}"})
+
+        sender = asyncio.create_task(pump())
+        try:
+            while (message := await ws.receive()) is not None:
+                try:
+                    data = json.loads(message)
+                except json.JSONDecodeError:
+                    data = {"type": "prompt", "text": message}
+                if not isinstance(data, dict):
+                    data = {"type": "prompt", "text": message}
+                if data.get("type") == "confirm":
+                    session.answer(bool(data.get("approved")))
+                    continue
+                text = str(data.get("text") or "").strip()
+                if not text:
+                    events.put_nowait({"type": "error", "message": "prompt must be non-empty"})
+                elif turn is not None and not turn.done():
+                    events.put_nowait({"type": "error", "message": "a turn is already running"})
+                else:
+                    turn = asyncio.create_task(run(text))
+        finally:
+            session.answer(False)  # release an edit waiting for this client
+            if turn is not None:
+                await asyncio.gather(turn, return_exceptions=True)
+            events.put_nowait(None)
+            await asyncio.gather(sender, return_exceptions=True)
+            await ws.close()
+
+    # -- lifecycle ------------------------------------------------------------
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8700, ready: threading.Event | None = None) -> None:
+        if not self.token and not is_loopback(host):
+            raise ValueError(f"refusing to listen on {host or 'every interface'} without AGENT_SERVER_TOKEN")
+        self._server = await asyncio.start_server(self._handle, host, port)
+        if ready is not None:
+            ready.set()
+        print(f"agent server listening on http://{host}:{self.port}", flush=True)
+        async with self._server:
+            await self._server.serve_forever()
+
+    @property
+    def port(self) -> int:
+        assert self._server is not None
+        return self._server.sockets[0].getsockname()[1]
+
+    def close(self) -> None:
+        for session_id in list(self.sessions):
+            self.close_session(session_id)
+        self.executor.shutdown(wait=False, cancel_futures=True)
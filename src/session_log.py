@@ -0,0 +1,268 @@
+"""Append-only per-session message log, for resuming and forking REPL sessions.
+
+`<id>.jsonl` starts with a header line and then holds one message per line,
+in the order they entered the history. `<id>.idx` is the sidecar index: one
+little-endian u64 per turn, the byte offset of the turn's user message. With
+it, resuming maps the log and parses only the turns it restores, and forking
+copies a byte prefix of the log without parsing it at all.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+_OFFSET = struct.Struct("<Q")
+# Seconds between fsyncs while a turn runs; the end of every turn is always synced.
+FSYNC_INTERVAL = float(os.getenv("AGENT_SESSION_FSYNC_INTERVAL", "1.0"))
+# Log bytes reloaded per token of context budget on resume: generous, since the
+# context manager compacts whatever does not fit, but older turns stay on disk.
+RESUME_BYTES_PER_TOKEN = 8
+
+
+def default_session_dir() -> Path:
+    override = os.getenv("AGENT_SESSION_DIR", "").strip()
+    if override:
+        return Path(override)
+    return Path(os.getenv("XDG_STATE_HOME", Path.home() / ".local" / "state")) / "mini-agent" / "sessions"
+
+
+def _encode(record: dict[str, Any]) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class SessionLog:
+    """Writer for one session; messages are buffered and fsynced in batches."""
+
+    def __init__(self, path: Path, fsync_interval: float = FSYNC_INTERVAL) -> None:
+        self.path = path
+        self.session_id = path.stem
+        self.fsync_interval = fsync_interval
+        _repair(path)
+        self._log = path.open("ab")
+        self._index = path.with_suffix(".idx").open("ab")
+        self._size = self._log.tell()
+        self.turns = self._index.tell() // _OFFSET.size
+        self._synced_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, directory: Path, header: dict[str, Any] | None = None) -> SessionLog:
+        directory.mkdir(parents=True, exist_ok=True)
+        session_id = time.strftime("%Y%m%d-%H%M%S-") + secrets.token_hex(2)
+        path = directory / f"{session_id}.jsonl"
+        path.write_bytes(_encode({"session": session_id, "created": time.time(), **(header or {})}))
+        path.with_suffix(".idx").write_bytes(b"")
+        return cls(path)
+
+    def begin_turn(self) -> None:
+        """Mark the next appended message as the start of a new turn."""
+        with self._lock:
+            self._index.write(_OFFSET.pack(self._size))
+            self.turns += 1
+
+    def append(self, message: dict[str, Any]) -> None:
+        data = _encode(message)
+        with self._lock:
+            self._log.write(data)
+            self._size += len(data)
+            if time.monotonic() - self._synced_at >= self.fsync_interval:
+                self._sync()
+
+    def sync(self) -> None:
+        with self._lock:
+            self._sync()
+
+    def _sync(self) -> None:
+        # Log before index, so a synced offset never points past synced data.
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        self._synced_at = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log.closed:
+                return
+            self._sync()
+            self._log.close()
+            self._index.close()
+
+
+def read_offsets(path: Path) -> list[int]:
+    """Turn offsets from the sidecar index, dropping any past the end of the log (after a crash)."""
+    try:
+        raw = path.with_suffix(".idx").read_bytes()
+    except OSError:
+        return []
+    size = path.stat().st_size
+    offsets = [offset for (offset,) in _OFFSET.iter_unpack(raw[: len(raw) - len(raw) % _OFFSET.size])]
+    return [offset for offset in offsets if offset < size]
+
+
+def _repair(path: Path) -> None:
+    """Cut a line left half-written by a crash, and index entries past it, before appending again."""
+    with path.open("r+b") as handle:
+        size = handle.seek(0, os.SEEK_END)
+        if size:
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = mm.rfind(b"\n") + 1
+            if end != size:
+                handle.truncate(end)
+    offsets = read_offsets(path)
+    index = path.with_suffix(".idx")
+    if index.exists() and index.stat().st_size != len(offsets) * _OFFSET.size:
+        index.write_bytes(b"".join(_OFFSET.pack(offset) for offset in offsets))
+
+
+def _parse_lines(data: bytes) -> list[dict[str, Any]]:
+    messages = []
+    for line in data.split(b"\n"):
+        if not line:
+            continue
+        try:
+            messages.append(json.loads(line))
+        except json.JSONDecodeError:
+            break  # a line cut short by a crash; everything after it is lost too
+    return messages
+
+
+INTERRUPTED = "error: interrupted before this tool call finished"
+
+
+def _pair_tool_calls(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Give every assistant `tool_calls` entry a tool reply, as the API requires.
+
+    A crash or Ctrl-C during a tool round leaves calls without results in the
+    log; they get a synthetic "interrupted" result, wherever they are (a
+    resumed session keeps appending after them).
+    """
+    paired: list[dict[str, Any]] = []
+    pending: list[str] = []
+    for message in [*messages, None]:
+        if message is not None and message.get("role") == "tool" and message.get("tool_call_id") in pending:
+            pending.remove(message["tool_call_id"])
+            paired.append(message)
+            continue
+        paired += [{"role": "tool", "tool_call_id": call_id, "content": INTERRUPTED} for call_id in pending]
+        pending = []
+        if message is None:
+            break
+        paired.append(message)
+        if message.get("role") == "assistant":
+            pending = [call["id"] for call in message.get("tool_calls") or [] if call.get("id")]
+    return paired
+
+
+def _read_header(mm: mmap.mmap | bytes) -> dict[str, Any]:
+    end = mm.find(b"\n")
+    try:
+        return json.loads(mm[: end if end != -1 else len(mm)])
+    except json.JSONDecodeError:
+        return {}
+
+
+def load_session(path: Path, max_bytes: int | None = None) -> tuple[list[dict[str, Any]], int]:
+    """The session's messages, newest turns first to fit `max_bytes`, and how many turns were left out.
+
+    Only the restored turns are parsed: the index gives their byte range and
+    the log is memory-mapped, so resuming a long session stays cheap. The
+    result starts at a user turn and has no tool call left without a reply.
+    """
+    offsets = read_offsets(path)
+    if not offsets:
+        return [], 0
+    with path.open("rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = len(mm)
+        first = len(offsets) - 1  # the latest turn is always restored
+        if max_bytes is None:
+            first = 0
+        else:
+            while first > 0 and end - offsets[first - 1] <= max_bytes:
+                first -= 1
+        messages = _parse_lines(mm[offsets[first] : end])
+    return _pair_tool_calls(messages), first
+
+
+def fork_session(path: Path, turn: int, directory: Path) -> Path:
+    """A new session holding turns 1..`turn` of `path`, copied byte for byte."""
+    offsets = read_offsets(path)
+    if not 1 <= turn <= len(offsets):
+        raise ValueError(f"session {path.stem} has turns 1..{len(offsets)}, not {turn}")
+    with path.open("rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        stop = offsets[turn] if turn < len(offsets) else len(mm)
+        source = _read_header(mm)
+        log = SessionLog.create(directory, {"forked_from": path.stem, "turn": turn, "workspace": source.get("workspace")})
+        with log._lock:
+            shift = log._size - offsets[0]
+            log._log.write(mm[offsets[0] : stop])
+            log._size += stop - offsets[0]
+            log._index.write(b"".join(_OFFSET.pack(offset + shift) for offset in offsets[:turn]))
+            log.turns = turn
+    log.close()
+    return log.path
+
+
+@dataclass(frozen=True)
+class SessionInfo:
+    session_id: str
+    path: Path
+    turns: int
+    size: int
+    modified: float
+    last_prompt: str
+
+
+def list_sessions(directory: Path) -> list[SessionInfo]:
+    """Sessions in `directory`, most recently used first; reads one line of each log."""
+    sessions = []
+    for path in directory.glob("*.jsonl"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        offsets = read_offsets(path)
+        last_prompt = ""
+        if offsets:
+            with path.open("rb") as handle:
+                handle.seek(offsets[-1])
+                message = _parse_lines(handle.readline())
+            if message:
+                last_prompt = str(message[0].get("content") or "")
+        sessions.append(SessionInfo(path.stem, path, len(offsets), st.st_size, st.st_mtime, last_prompt))
+    sessions.sort(key=lambda info: info.modified, reverse=True)
+    return sessions
+
+
+def find_session(directory: Path, name: str) -> Path:
+    """`name` is a session id, a unique prefix of one, or "latest"."""
+    sessions = list_sessions(directory)
+    if name == "latest":
+        if not sessions:
+            raise ValueError(f"no sessions in {directory}")
+        return sessions[0].path
+    matches = [info.path for info in sessions if info.session_id.startswith(name)]
+    if len(matches) != 1:
+        raise ValueError(f"{'no' if not matches else 'more than one'} session matches {name!r}")
+    return matches[0]
+
+
+def prune_sessions(directory: Path, older_than_days: float) -> list[str]:
+    """Delete sessions not written to for `older_than_days`; returns their ids."""
+    cutoff = time.time() - older_than_days * 86400
+    removed = []
+    for info in list_sessions(directory):
+        if info.modified < cutoff:
+            info.path.unlink(missing_ok=True)
+            info.path.with_suffix(".idx").unlink(missing_ok=True)
+            removed.append(info.session_id)
+    return removed
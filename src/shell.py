@@ -0,0 +1,342 @@
+"""Shell command execution with bounded output and background jobs."""
+
+from __future__ import annotations
+
+import itertools
+import os
+import secrets
+import selectors
+import shutil
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import asyncio
+    import subprocess
+    from concurrent.futures import Future
+
+DEFAULT_TIMEOUT = 30.0
+MAX_TIMEOUT = 3600.0
+DEFAULT_OUTPUT_BYTES = 64 * 1024
+# Finished background jobs whose output was never read; the oldest are dropped beyond this.
+MAX_FINISHED_JOBS = 32
+_READ_CHUNK = 64 * 1024
+
+
+class HeadTailBuffer:
+    """Keep the first and last bytes of a stream under a fixed byte cap."""
+
+    def __init__(self, cap_bytes: int = DEFAULT_OUTPUT_BYTES) -> None:
+        self.head_cap = cap_bytes // 4
+        self.tail_cap = cap_bytes - self.head_cap
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data: bytes) -> None:
+        self.total += len(data)
+        room = self.head_cap - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            excess = len(self.tail) - self.tail_cap
+            if excess > 0:
+                del self.tail[:excess]
+
+    @property
+    def omitted(self) -> int:
+        return self.total - len(self.head) - len(self.tail)
+
+    def text(self) -> str:
+        head = self.head.decode("utf-8", errors="replace")
+        tail = self.tail.decode("utf-8", errors="replace")
+        if self.omitted:
+            return f"{head}\n[... {self.omitted} bytes omitted ...]\n{tail}"
+        return head + tail
+
+    def last(self, nbytes: int) -> str:
+        data = bytes(self.head + self.tail) if not self.omitted else bytes(self.tail)
+        return data[-nbytes:].decode("utf-8", errors="replace") if nbytes > 0 else ""
+
+
+@dataclass
+class ShellJob:
+    """One command, running or finished."""
+
+    job_id: str
+    command: str
+    stdout: HeadTailBuffer
+    stderr: HeadTailBuffer
+    started: float = field(default_factory=time.monotonic)
+    finished: float | None = None
+    returncode: int | None = None
+    timed_out: bool = False
+    process: asyncio.subprocess.Process | None = None
+
+    @property
+    def state(self) -> str:
+        if self.returncode is None:
+            return "running"
+        return "timeout" if self.timed_out else "exited"
+
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def result(self) -> str:
+        exit_code = f"timeout after {self.elapsed():.0f}s" if self.timed_out else str(self.returncode)
+        return f"exit_code: {exit_code}\nstdout:\n{self.stdout.text()}\nstderr:\n{self.stderr.text()}"
+
+    def status(self) -> str:
+        return (
+            f"job_id: {self.job_id}\nstate: {self.state}\nexit_code: {self.returncode}\n"
+            f"elapsed: {self.elapsed():.1f}s\nstdout_bytes: {self.stdout.total}\nstderr_bytes: {self.stderr.total}"
+        )
+
+
+def _kill_group(process: asyncio.subprocess.Process) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ShellRunner:
+    """Run shell commands on a private asyncio loop in a background thread.
+
+    Output is streamed into head+tail buffers instead of being collected whole,
+    so a command that prints megabytes costs a fixed amount of memory.
+    """
+
+    def __init__(self, output_bytes: int = DEFAULT_OUTPUT_BYTES) -> None:
+        self.output_bytes = output_bytes
+        self.jobs: dict[str, ShellJob] = {}
+        self._ids = itertools.count(1)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # asyncio is imported on the first command: it is a large part of CLI startup.
+        import asyncio
+
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="shell-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    async def _pump(self, reader: asyncio.StreamReader, buffer: HeadTailBuffer) -> None:
+        while chunk := await reader.read(_READ_CHUNK):
+            buffer.write(chunk)
+
+    async def _run(self, job: ShellJob, cwd: Path, timeout: float | None) -> None:
+        import asyncio
+
+        process = await asyncio.create_subprocess_shell(
+            job.command,
+            cwd=cwd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        job.process = process
+        pumps = asyncio.gather(self._pump(process.stdout, job.stdout), self._pump(process.stderr, job.stderr))
+        deadline = None if timeout is None else asyncio.get_running_loop().time() + timeout
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(process.wait()), timeout)
+            except asyncio.TimeoutError:
+                job.timed_out = True
+                _kill_group(process)
+                await process.wait()
+            # A child left running in the background (`server &`) keeps the pipes open after
+            # the shell exits; the timeout covers it too, keeping what it printed so far.
+            remaining = None if deadline is None else max(0.0, deadline - asyncio.get_running_loop().time())
+            try:
+                await asyncio.wait_for(pumps, remaining)
+            except asyncio.TimeoutError:
+                job.timed_out = True
+                _kill_group(process)
+        except asyncio.CancelledError:
+            _kill_group(process)
+            pumps.cancel()
+            await process.wait()
+            raise
+        finally:
+            job.returncode = process.returncode
+            job.finished = time.monotonic()
+
+    def _new_job(self, command: str) -> ShellJob:
+        job_id = f"job-{next(self._ids)}"
+        job = ShellJob(job_id, command, HeadTailBuffer(self.output_bytes), HeadTailBuffer(self.output_bytes))
+        with self._lock:
+            finished = [old.job_id for old in self.jobs.values() if old.returncode is not None]
+            for old_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS + 1)]:
+                del self.jobs[old_id]  # dicts keep insertion order: these are the oldest
+            self.jobs[job_id] = job
+        return job
+
+    def forget(self, job_id: str) -> None:
+        """Drop a job once its output has been read (a no-op while it is still running)."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job and job.returncode is not None:
+                del self.jobs[job_id]
+
+    def run(self, command: str, cwd: Path, timeout: float = DEFAULT_TIMEOUT) -> str:
+        """Run a command to completion (or timeout) and return its bounded output."""
+        job = self._new_job(command)
+        self._submit(job, cwd, timeout).result()
+        self.forget(job.job_id)
+        return job.result()
+
+    def start(self, command: str, cwd: Path, timeout: float | None = None) -> ShellJob:
+        """Start a command in the background and return its job immediately."""
+        job = self._new_job(command)
+        self._submit(job, cwd, timeout)
+        return job
+
+    def _submit(self, job: ShellJob, cwd: Path, timeout: float | None) -> Future[None]:
+        loop = self._ensure_loop()
+        import asyncio
+
+        return asyncio.run_coroutine_threadsafe(self._run(job, cwd, timeout), loop)
+
+    def kill(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or job.process is None or job.returncode is not None:
+            return False
+        _kill_group(job.process)
+        return True
+
+
+class PersistentShell:
+    """One long-lived shell process that keeps `cd`, exports and venvs between commands.
+
+    Each command is sent through `eval` followed by a random sentinel line on
+    stdout and stderr; the sentinel on stdout carries the exit status. The
+    shell is restarted after a timeout or if a command makes it exit.
+    """
+
+    def __init__(self, cwd: Path, output_bytes: int = DEFAULT_OUTPUT_BYTES) -> None:
+        self.cwd = cwd
+        self.output_bytes = output_bytes
+        self.executable = shutil.which("bash") or "/bin/sh"
+        self._proc: subprocess.Popen[bytes] | None = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> subprocess.Popen[bytes]:
+        import subprocess
+
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = subprocess.Popen(
+                [self.executable],
+                cwd=self.cwd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True,
+            )
+        return self._proc
+
+    def _restart(self) -> None:
+        if self._proc is not None:
+            try:
+                os.killpg(self._proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            self._proc.wait()
+            for pipe in (self._proc.stdin, self._proc.stdout, self._proc.stderr):
+                if pipe:
+                    try:
+                        pipe.close()
+                    except BrokenPipeError:
+                        pass  # stdin still held a script the dead shell never read
+        self._proc = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._restart()
+
+    def run(self, command: str, timeout: float = DEFAULT_TIMEOUT) -> str:
+        with self._lock:
+            return self._run(command, timeout)
+
+    def _run(self, command: str, timeout: float, retry: bool = True) -> str:
+        proc = self._ensure_started()
+        marker = f"__MINI_AGENT_DONE_{secrets.token_hex(8)}__".encode()
+        quoted = command.replace("'", "'\\''")
+        script = (
+            f"eval '{quoted}' < /dev/null\n"
+            f"__mini_agent_rc=$?; printf '\\n%s %s\\n' '{marker.decode()}' \"$__mini_agent_rc\"; "
+            f"printf '\\n%s\\n' '{marker.decode()}' >&2\n"
+        )
+        buffers = {"stdout": HeadTailBuffer(self.output_bytes), "stderr": HeadTailBuffer(self.output_bytes)}
+        pending = {"stdout": bytearray(), "stderr": bytearray()}
+        done: dict[str, bytes] = {}
+        try:
+            proc.stdin.write(script.encode())
+            proc.stdin.flush()
+        except BrokenPipeError:
+            self._restart()
+            if retry:
+                return self._run(command, timeout, retry=False)
+            # It died again right away: a broken shell or rc file, not a command that exited it.
+            return f"error: the persistent shell ({self.executable}) exits as soon as it starts"
+
+        selector = selectors.DefaultSelector()
+        selector.register(proc.stdout, selectors.EVENT_READ, "stdout")
+        selector.register(proc.stderr, selectors.EVENT_READ, "stderr")
+        deadline = time.monotonic() + timeout
+        hold = len(marker) + 32
+        try:
+            while len(done) < 2:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._restart()
+                    return self._format(f"timeout after {timeout:.0f}s (shell restarted)", buffers, pending)
+                events = selector.select(remaining)
+                for key, _ in events:
+                    name = key.data
+                    chunk = os.read(key.fileobj.fileno(), _READ_CHUNK)
+                    if not chunk:
+                        code = proc.wait()
+                        self._restart()
+                        status = f"{code} (shell exited and was restarted; cwd and environment were reset)"
+                        return self._format(status, buffers, pending)
+                    pending[name] += chunk
+                    index = pending[name].find(b"\n" + marker)
+                    if index >= 0:
+                        buffers[name].write(bytes(pending[name][:index]))
+                        done[name] = bytes(pending[name][index + len(marker) + 1 :])
+                        pending[name].clear()
+                        selector.unregister(key.fileobj)
+                    elif len(pending[name]) > hold:
+                        flush = len(pending[name]) - hold
+                        buffers[name].write(bytes(pending[name][:flush]))
+                        del pending[name][:flush]
+        finally:
+            selector.close()
+        status = done["stdout"].strip().decode(errors="replace") or "?"
+        return self._format(status, buffers, pending)
+
+    @staticmethod
+    def _format(exit_code: str, buffers: dict[str, HeadTailBuffer], pending: dict[str, bytearray]) -> str:
+        for name, rest in pending.items():
+            buffers[name].write(bytes(rest))
+        return f"exit_code: {exit_code}\nstdout:\n{buffers['stdout'].text()}\nstderr:\n{buffers['stderr'].text()}"
+
+
+SHELL = ShellRunner(int(os.getenv("AGENT_SHELL_OUTPUT_BYTES", str(DEFAULT_OUTPUT_BYTES))))
+PERSISTENT_SHELL = (
+    PersistentShell(Path.cwd(), SHELL.output_bytes)
+    if os.getenv("AGENT_PERSISTENT_SHELL", "").lower() in {"1", "true", "yes"}
+    else None
+)
@@ -2,18 +2,47 @@
 
 from __future__ import annotations
 
-import re
+import hashlib
+import json
+import os
+import threading
 from pathlib import Path
 
-from .skills import Skill
+from .skill_search import SkillIndex, body_terms
+from .skills import FRONTMATTER_RE, Skill
+
+INDEX_VERSION = 2
+
+
+def default_index_path(skills_dir: Path) -> Path:
+    """Per-skills-dir index file under the user cache directory."""
+    override = os.getenv("AGENT_SKILL_INDEX", "").strip()
+    if override:
+        return Path(override)
+    cache_root = Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache")) / "mini-agent"
+    digest = hashlib.sha1(str(skills_dir.resolve()).encode("utf-8")).hexdigest()[:16]
+    return cache_root / f"skills-{digest}.json"
 
 
 class SkillLoader:
-    """Load skills from `skills/**/SKILL.md` files."""
+    """Load skills from `skills/**/SKILL.md` files.
 
-    def __init__(self, skills_dir: str = "skills") -> None:
+    Name and description of every skill are kept in an on-disk index keyed by
+    path and (mtime_ns, size), so a rescan only re-parses files that changed.
+    Skill bodies are not read until `Skill.content` is first used.
+    """
+
+    def __init__(self, skills_dir: str = "skills", index_path: str | Path | None = None) -> None:
         self.skills_dir = Path(skills_dir)
+        self.index_path = Path(index_path) if index_path else default_index_path(self.skills_dir)
         self.loaded_skills: dict[str, Skill] = {}
+        # Bumped whenever a rescan changes the set of skills or their metadata.
+        self.version = 0
+        self._index: dict[str, dict] = self._read_index()
+        self._search_index: SkillIndex | None = None
+        self._search_version = -1
+        self._watcher: threading.Thread | None = None
+        self._stop_watching = threading.Event()
 
     def load_skill(self, skill_path: Path) -> Skill | None:
         """Load one SKILL.md file."""
@@ -22,7 +51,7 @@ class SkillLoader:
         except Exception:
             return None
 
-        match = re.match(r"^---\n(.*?)\n---\n(.*)$", raw, flags=re.DOTALL)
+        match = FRONTMATTER_RE.match(raw)
         if not match:
             return None
 
@@ -38,39 +67,159 @@ class SkillLoader:
         return Skill(
             name=name,
             description=description,
-            content=body,
             skill_path=skill_path,
+            body=body,
         )
 
     def discover_skills(self) -> list[Skill]:
         """Discover and load all skills under `skills_dir`."""
-        if not self.skills_dir.exists():
-            return []
-
-        skills: list[Skill] = []
-        for path in self.skills_dir.rglob("SKILL.md"):
-            skill = self.load_skill(path)
-            if not skill:
+        self.refresh()
+        return list(self.loaded_skills.values())
+
+    def refresh(self) -> bool:
+        """Rescan `skills_dir`, re-parsing only changed files. Return True if anything changed."""
+        skills: dict[str, Skill] = {}
+        index: dict[str, dict] = {}
+        dirty = False
+        for key in self._scan(self.skills_dir):
+            try:
+                st = os.stat(key)
+            except OSError:
                 continue
-            skills.append(skill)
-            self.loaded_skills[skill.name] = skill
-        return skills
+            path = Path(key)
+            entry = self._index.get(key)
+            dirty_file = not entry or entry["mtime_ns"] != st.st_mtime_ns or entry["size"] != st.st_size
+            if dirty_file:
+                parsed = self.load_skill(path)
+                entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+                if parsed:
+                    entry.update(name=parsed.name, description=parsed.description, terms=body_terms(parsed.content))
+                dirty = True
+            index[key] = entry
+            if "name" not in entry:
+                continue  # cached as not a valid skill
+            previous = self.loaded_skills.get(entry["name"])
+            if not dirty_file and previous and previous.skill_path == path and previous.description == entry["description"]:
+                skills[entry["name"]] = previous  # keeps a body that was already loaded
+            else:
+                # Drop the parsed body; it is re-read lazily by `Skill.content`.
+                skills[entry["name"]] = Skill(name=entry["name"], description=entry["description"], skill_path=path)
+        dirty = dirty or index.keys() != self._index.keys()
+        changed = dirty or skills.keys() != self.loaded_skills.keys()
+        self._index = index
+        self.loaded_skills = skills
+        if dirty:
+            self._write_index()
+        if changed:
+            self.version += 1
+        return changed
+
+    def watch(self, interval: float = 2.0) -> None:
+        """Poll `skills_dir` in a background thread and hot-reload changed skills."""
+        if self._watcher is not None:
+            return
+
+        def _loop() -> None:
+            while not self._stop_watching.wait(interval):
+                self.refresh()
+
+        self._watcher = threading.Thread(target=_loop, name="skill-watch", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop_watching.set()
 
     def get_skill(self, name: str) -> Skill | None:
         return self.loaded_skills.get(name)
 
-    def get_skills_metadata_prompt(self) -> str:
-        """Return metadata-only prompt text for all loaded skills."""
+    def search(self, query: str, limit: int = 10) -> list[tuple[Skill, float]]:
+        """Rank loaded skills against `query` with BM25 over name, description and body terms."""
+        index = self._search_index
+        if index is None or self._search_version != self.version:
+            index = SkillIndex()
+            terms_by_path = {key: entry.get("terms", {}) for key, entry in self._index.items()}
+            for skill in self.loaded_skills.values():
+                index.add(skill.name, skill.description, terms_by_path.get(str(skill.skill_path), {}))
+            self._search_index, self._search_version = index, self.version
+        return [
+            (self.loaded_skills[name], score)
+            for name, score in index.search(query, limit)
+            if name in self.loaded_skills
+        ]
+
+    def get_skills_metadata_prompt(self, top_k: int = 0) -> str:
+        """Return metadata-only prompt text for the loaded skills.
+
+        With `top_k` set and more skills than that, none are listed here: the
+        text depends only on the skill set, so it can sit in a cached system
+        prompt, and `get_relevant_skills_prompt` lists the relevant ones per turn.
+        """
         if not self.loaded_skills:
             return ""
         lines = [
             "## Available Skills",
             "You can load full skill guidance with `get_skill` when needed.",
         ]
-        for skill in self.loaded_skills.values():
-            lines.append(skill.metadata_line())
+        if top_k <= 0 or len(self.loaded_skills) <= top_k:
+            for skill in self.loaded_skills.values():
+                lines.append(skill.metadata_line())
+            return "\n".join(lines)
+        lines.append(
+            f"{len(self.loaded_skills)} skills are installed. Those most relevant to a request are listed "
+            "after it; use `search_skills` to find the others by topic."
+        )
         return "\n".join(lines)
 
+    def get_relevant_skills_prompt(self, query: str, top_k: int) -> str:
+        """The `top_k` skills most relevant to `query`, or "" when the system prompt lists them all."""
+        if top_k <= 0 or len(self.loaded_skills) <= top_k or not query:
+            return ""
+        relevant = [skill.metadata_line() for skill, _score in self.search(query, top_k)]
+        if not relevant:
+            return ""
+        return "\n".join(["[Skills relevant to this request]", *relevant])
+
+    @staticmethod
+    def _scan(root: Path) -> list[str]:
+        """Return every SKILL.md under `root` in a stable order."""
+        if not root.exists():
+            return []
+        found: list[str] = []
+        stack = [str(root)]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name == "SKILL.md":
+                            found.append(entry.path)
+            except OSError:
+                continue
+        found.sort()
+        return found
+
+    def _read_index(self) -> dict[str, dict]:
+        try:
+            data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return {}
+        # Any other shape is a corrupt or foreign file: rebuild the index rather than fail.
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return {}
+        entries = data.get("entries")
+        return entries if isinstance(entries, dict) else {}
+
+    def _write_index(self) -> None:
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"version": INDEX_VERSION, "entries": self._index}), encoding="utf-8")
+            tmp.replace(self.index_path)
+        except OSError:
+            pass  # the index is only a cache
+
     @staticmethod
     def _parse_frontmatter(text: str) -> dict[str, str]:
         """Parse simple `key: value` frontmatter."""
@@ -0,0 +1,63 @@
+"""BM25 ranking over skill name, description and body terms."""
+
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter, defaultdict
+
+# Terms kept per skill body in the on-disk skill index.
+MAX_BODY_TERMS = 64
+# Name and description say more about a skill than any body term.
+FIELD_WEIGHT = 3
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[一-鿿]")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "if", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "when", "with", "you", "your",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens; CJK text is split into single characters."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def body_terms(body: str) -> dict[str, int]:
+    """Most frequent body terms, small enough to store in the skill index."""
+    return dict(Counter(tokenize(body)).most_common(MAX_BODY_TERMS))
+
+
+class SkillIndex:
+    """Inverted index with Okapi BM25 scoring."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, list[tuple[str, int]]] = defaultdict(list)
+        self.lengths: dict[str, int] = {}
+
+    def add(self, name: str, description: str, terms: dict[str, int]) -> None:
+        counts = Counter(terms)
+        for token in tokenize(name.replace("-", " ").replace("_", " ")) + tokenize(description):
+            counts[token] += FIELD_WEIGHT
+        for token, tf in counts.items():
+            self.postings[token].append((name, tf))
+        self.lengths[name] = sum(counts.values())
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        if not self.lengths:
+            return []
+        total = len(self.lengths)
+        avg_length = sum(self.lengths.values()) / total
+        scores: dict[str, float] = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for name, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[name] / avg_length)
+                scores[name] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
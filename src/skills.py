@@ -2,18 +2,37 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import re
+from dataclasses import dataclass, field
+from functools import cached_property
 from pathlib import Path
 
+FRONTMATTER_RE = re.compile(r"^---\n(.*?)\n---\n(.*)$", flags=re.DOTALL)
+
 
 @dataclass(frozen=True)
 class Skill:
-    """Represents one loaded skill."""
+    """Represents one loaded skill.
+
+    The body is read from `skill_path` the first time `content` is used,
+    unless it was passed in as `body`.
+    """
 
     name: str
     description: str
-    content: str
     skill_path: Path
+    body: str | None = field(default=None, repr=False, compare=False)
+
+    @cached_property
+    def content(self) -> str:
+        if self.body is not None:
+            return self.body
+        try:
+            raw = self.skill_path.read_text(encoding="utf-8")
+        except OSError:
+            return ""
+        match = FRONTMATTER_RE.match(raw)
+        return match.group(2).strip() if match else ""
 
     def metadata_line(self) -> str:
         """Return one-line metadata used in system prompt injection."""
@@ -0,0 +1,99 @@
+"""Startup timing: init phases of `src.main` and the `--profile-startup` report."""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# Set in the child process: time every phase, print them, and exit before the first turn.
+PROFILE_ENV = "AGENT_PROFILE_STARTUP"
+PHASES_PREFIX = "startup-phases: "
+TOP_IMPORTS = 15
+
+
+class StartupTimer:
+    """Wall time and newly imported modules of each named init phase."""
+
+    def __init__(self) -> None:
+        self.phases: list[dict] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        modules = len(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append(
+                {"phase": name, "ms": round((time.perf_counter() - start) * 1000, 2), "modules": len(sys.modules) - modules}
+            )
+
+    def report(self) -> None:
+        print(PHASES_PREFIX + json.dumps(self.phases), file=sys.stderr, flush=True)
+
+
+STARTUP = StartupTimer()
+
+
+def profiling() -> bool:
+    return os.getenv(PROFILE_ENV, "") == "1"
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """(module, self_us, cumulative_us, depth) for every line of `-X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|", 2)
+        if not own.strip().isdigit():
+            continue  # the header line
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(own), int(cumulative), depth))
+    return rows
+
+
+def profile_startup(argv: list[str]) -> int:
+    """Run the CLI once in a child with `-X importtime` and print where startup time goes."""
+    import subprocess
+
+    env = {**os.environ, PROFILE_ENV: "1"}
+    env.setdefault("OPENROUTER_API_KEY", "profile-startup")  # no request is made
+    start = time.perf_counter()
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "src.main", *argv],
+        env=env,
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+    )
+    wall = (time.perf_counter() - start) * 1000
+    phases: list[dict] = []
+    other = []
+    for line in child.stderr.splitlines():
+        if line.startswith(PHASES_PREFIX):
+            phases = json.loads(line[len(PHASES_PREFIX) :])
+        elif not line.startswith("import time:"):
+            other.append(line)
+    if child.returncode != 0 or not phases:
+        print("\n".join(other) or f"startup exited with status {child.returncode}", file=sys.stderr)
+        return child.returncode or 1
+
+    imports = parse_importtime(child.stderr)
+    ours = [row for row in imports if row[3] == 0]
+    print(f"cold start to first turn: {wall:.1f} ms wall (interpreter included)")
+    print(f"  imports: {sum(row[2] for row in ours) / 1000:.1f} ms in {len(imports)} modules")
+    print("\ninit phases:")
+    for phase in phases:
+        print(f"  {phase['phase']:14s} {phase['ms']:8.1f} ms  (+{phase['modules']} modules)")
+    print("\nslowest top-level imports (cumulative):")
+    for name, _own, cumulative, _depth in sorted(ours, key=lambda row: -row[2])[:TOP_IMPORTS]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    print("\nslowest modules (self):")
+    for name, own, _cumulative, _depth in sorted(imports, key=lambda row: -row[1])[:TOP_IMPORTS]:
+        print(f"  {own / 1000:8.1f} ms  {name}")
+    return 0
@@ -0,0 +1,133 @@
+"""Fan-out of independent sub-tasks to child agents with their own short histories."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from .tool_registry import REGISTRY, ToolSpec
+from .tracing import TRACER
+
+# Tools a child may use: none of them change the workspace or ask for confirmation.
+SUBAGENT_TOOLS = frozenset(
+    {"read_file", "search_files", "glob_files", "calculator", "fetch_blob", "get_skill", "search_skills"}
+)
+MAX_TASKS = 32
+# Children running at once in this process, across every parent and session.
+CONCURRENCY = max(1, int(os.getenv("AGENT_SUBAGENT_CONCURRENCY", "4")))
+# Tokens (prompt + completion) all children of one spawn may use together.
+TOKEN_BUDGET = int(os.getenv("AGENT_SUBAGENT_TOKENS", "200000"))
+CHILD_CONTEXT_TOKENS = 30_000
+CHILD_MAX_ROUNDS = 8
+ANSWER_CHARS = 4000
+PREAMBLE = (
+    "You are a sub-agent handling one part of a larger task. Use tools as needed, then reply with a "
+    "short, self-contained final answer; it is the only thing passed back."
+)
+
+# Handled by `Agent.spawn_subagents`; children only read, so it is ordered like a workspace scan.
+SPAWN_SUBAGENTS_TOOL = REGISTRY.register(
+    ToolSpec(
+        name="spawn_subagents",
+        description=(
+            "Run independent sub-tasks in parallel, each as a separate agent with its own fresh history and "
+            "read-only tools, and get back only their final answers. Use it for work that splits into "
+            "self-contained parts (e.g. summarise each of several files); every task prompt must be self-contained."
+        ),
+        parameters={
+            "type": "object",
+            "properties": {
+                "tasks": {"type": "array", "items": {"type": "string"}, "description": f"Up to {MAX_TASKS} prompts."},
+                "tools": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": sorted(SUBAGENT_TOOLS)},
+                    "description": "Narrow the tools the sub-agents may use (default: all of them).",
+                },
+                "max_tokens": {
+                    "type": "integer",
+                    "description": f"Token budget shared by all sub-agents (default and maximum {TOKEN_BUDGET}).",
+                },
+            },
+            "required": ["tasks"],
+        },
+        access="scan",
+    )
+)
+
+
+class TokenBudget:
+    """Token allowance shared by the children of one spawn; charged after every model call."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def charge(self, tokens: int) -> None:
+        with self._lock:
+            self.used += max(0, tokens)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.used >= self.limit
+
+
+@dataclass(frozen=True)
+class SubagentResult:
+    task: str
+    answer: str
+    rounds: int
+    elapsed: float
+
+
+_POOL: ThreadPoolExecutor | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="subagent")
+        return _POOL
+
+
+def run_subagents(tasks: list[str], make_child: Callable[[], Any], budget: TokenBudget) -> list[SubagentResult]:
+    """Run every task in a fresh child agent, at most `CONCURRENCY` at a time, in task order."""
+
+    def run(index: int, task: str) -> SubagentResult:
+        start = time.perf_counter()
+        if budget.exhausted:
+            return SubagentResult(task, "skipped: sub-agent token budget exhausted", 0, 0.0)
+        child = make_child()
+        with TRACER.span("subagent", index=index, task_chars=len(task)) as span:
+            try:
+                result = child.run_turn(f"{PREAMBLE}\n\nTask: {task}")
+                answer, rounds = result.text, result.rounds
+            except Exception as exc:  # one failed child must not lose the others' answers
+                answer, rounds = f"error: {type(exc).__name__}: {exc}", 0
+            finally:
+                child.close()
+            span.set(rounds=rounds, answer_chars=len(answer))
+        return SubagentResult(task, answer, rounds, time.perf_counter() - start)
+
+    futures = [_pool().submit(run, index, task) for index, task in enumerate(tasks)]
+    return [future.result() for future in futures]
+
+
+def format_results(results: list[SubagentResult], budget: TokenBudget, elapsed: float) -> str:
+    parts = []
+    for index, result in enumerate(results, 1):
+        answer = result.answer.strip()
+        if len(answer) > ANSWER_CHARS:
+            answer = answer[:ANSWER_CHARS] + f"\n[... {len(answer) - ANSWER_CHARS} more chars cut ...]"
+        title = result.task if len(result.task) <= 80 else result.task[:77] + "..."
+        parts.append(f"## Task {index}: {title}\n{answer}")
+    parts.append(
+        f"[{len(results)} sub-agents, {elapsed:.1f}s wall, {budget.used} of {budget.limit} tokens used]"
+    )
+    return "\n\n".join(parts)
@@ -0,0 +1,491 @@
+"""Tool registry: dispatch by name, argument checks, per-tool limits and lazily imported plugins.
+
+Every tool is a `ToolSpec` registered once per process. Its parameter schema
+is compiled into a checking function at registration, and `ToolRegistry.call`
+is one dict lookup, that check, then the handler under the tool's own
+concurrency limit, timeout and result cap.
+
+Plugins come from the `mini_agent.tools` entry point group and from `*.py`
+files in the plugin directories. A plugin module declares its tools as a
+literal list of dicts, read from its source without importing it:
+
+    TOOLS = [
+        {
+            "name": "weather",
+            "description": "Current weather for a city.",
+            "parameters": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]},
+            "handler": "weather",  # function in this module: (arguments: dict) -> str
+            "access": "pure",  # optional: pure, read, scan, write or barrier (the default)
+            "timeout": 10,  # optional, seconds (default PLUGIN_TIMEOUT)
+            "max_concurrency": 2,  # optional
+            "max_result_chars": 20000,  # optional
+        },
+    ]
+
+The module itself is imported on the first call of one of its tools. The
+manifests are cached on disk, keyed by file mtime and by the mtimes of the
+`sys.path` directories, so a warm start does not even scan entry points.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+Handler = Callable[[dict], str]
+Check = Callable[[Any, str], "str | None"]
+
+ACCESS_KINDS = frozenset({"pure", "read", "scan", "write", "barrier"})
+MAX_RESULT_CHARS = int(os.getenv("AGENT_TOOL_MAX_RESULT_CHARS", "200000"))
+# Default timeout of plugin tools; built-in tools bound their own work.
+PLUGIN_TIMEOUT = float(os.getenv("AGENT_PLUGIN_TIMEOUT", "60"))
+ENTRY_POINT_GROUP = "mini_agent.tools"
+PLUGIN_INDEX_VERSION = 1
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    name: str
+    description: str
+    parameters: dict
+    # A function of the arguments, or "module:function" / "path/to/plugin.py:function"
+    # imported on first call. None for tools an `Agent` provides per session.
+    handler: Handler | str | None = None
+    # How the scheduler orders the tool against other calls in the same round.
+    access: str = "barrier"
+    timeout: float | None = None
+    max_concurrency: int | None = None
+    max_result_chars: int = MAX_RESULT_CHARS
+
+    def schema(self) -> dict:
+        return {
+            "type": "function",
+            "function": {"name": self.name, "description": self.description, "parameters": self.parameters},
+        }
+
+
+# -- argument checks ---------------------------------------------------
+
+
+def _is_number(value: Any, integer: bool) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return True
+    if isinstance(value, float):
+        return not integer or value.is_integer()
+    if isinstance(value, str):  # handlers convert numeric strings themselves
+        try:
+            int(value) if integer else float(value)
+        except ValueError:
+            return False
+        return True
+    return False
+
+
+_TYPE_CHECKS: dict[str, Callable[[Any], bool]] = {
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: _is_number(v, integer=True),
+    "number": lambda v: _is_number(v, integer=False),
+    "boolean": lambda v: isinstance(v, bool),
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+}
+
+
+def compile_schema(schema: dict) -> Check:
+    """Turn the JSON-schema subset used by tool parameters into one checking function.
+
+    The function returns an error message or None. Null values count as
+    absent and unknown properties are allowed, as the handlers expect.
+    """
+    checks: list[Check] = []
+    kind = schema.get("type")
+    if kind in _TYPE_CHECKS:
+        is_kind = _TYPE_CHECKS[kind]
+        checks.append(lambda value, where: None if is_kind(value) else f"{where} must be of type {kind}")
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+        checks.append(lambda value, where: None if value in allowed else f"{where} must be one of {allowed}")
+    if "anyOf" in schema:
+        options = [compile_schema(option) for option in schema["anyOf"]]
+
+        def any_of(value: Any, where: str) -> str | None:
+            errors = [option(value, where) for option in options]
+            return None if None in errors else errors[0]
+
+        checks.append(any_of)
+    if kind == "object":
+        properties = {key: compile_schema(sub) for key, sub in schema.get("properties", {}).items()}
+        required = tuple(schema.get("required", ()))
+        extra = schema.get("additionalProperties")
+        other = compile_schema(extra) if isinstance(extra, dict) else None
+
+        def check_object(value: dict, where: str) -> str | None:
+            for key in required:
+                if value.get(key) is None:
+                    return f"{where}.{key} is required"
+            for key, item in value.items():
+                check = properties.get(key, other)
+                if check is not None and item is not None:
+                    error = check(item, f"{where}.{key}")
+                    if error:
+                        return error
+            return None
+
+        checks.append(lambda value, where: check_object(value, where) if isinstance(value, dict) else None)
+    if kind == "array" and isinstance(schema.get("items"), dict):
+        item_check = compile_schema(schema["items"])
+
+        def check_array(value: list, where: str) -> str | None:
+            for i, item in enumerate(value):
+                error = item_check(item, f"{where}[{i}]")
+                if error:
+                    return error
+            return None
+
+        checks.append(lambda value, where: check_array(value, where) if isinstance(value, list) else None)
+
+    def check(value: Any, where: str) -> str | None:
+        for one in checks:
+            error = one(value, where)
+            if error:
+                return error
+        return None
+
+    return check
+
+
+# -- registry ----------------------------------------------------------
+
+
+_TIMEOUT_POOL: ThreadPoolExecutor | None = None
+_TIMEOUT_POOL_LOCK = threading.Lock()
+
+
+def _timeout_pool() -> ThreadPoolExecutor:
+    global _TIMEOUT_POOL
+    with _TIMEOUT_POOL_LOCK:
+        if _TIMEOUT_POOL is None:
+            _TIMEOUT_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="tool-timeout")
+        return _TIMEOUT_POOL
+
+
+def _load_module(location: str) -> Any:
+    """A module by dotted name, or a plugin file by path (imported once, under a private name)."""
+    if not location.endswith(".py"):
+        return importlib.import_module(location)
+    name = "mini_agent_plugin_" + hashlib.sha1(location.encode("utf-8")).hexdigest()[:12]
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, location)
+        if spec is None or spec.loader is None:
+            raise ImportError(f"cannot load {location}")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[name] = module
+    return module
+
+
+def _import_handler(target: str) -> Handler:
+    location, _, attr = target.rpartition(":")
+    handler = getattr(_load_module(location), attr)
+    if not callable(handler):
+        raise TypeError(f"{target} is not callable")
+    return handler
+
+
+def _cap(result: str, limit: int) -> str:
+    if len(result) <= limit:
+        return result
+    return result[:limit] + f"\n[... {len(result) - limit} more chars cut ...]"
+
+
+@dataclass
+class _Entry:
+    spec: ToolSpec
+    check: Check
+    slots: threading.BoundedSemaphore | None
+    handler: Handler | None = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def resolve(self) -> Handler:
+        if self.handler is None:
+            with self.lock:
+                if self.handler is None:
+                    target = self.spec.handler
+                    self.handler = _import_handler(target) if isinstance(target, str) else target
+        return self.handler
+
+
+class ToolRegistry:
+    """Tools by name, each with its compiled argument check and limits."""
+
+    def __init__(self) -> None:
+        self._entries: dict[str, _Entry] = {}
+        self._schemas: list[dict] | None = None
+        self._lock = threading.Lock()
+
+    def register(self, spec: ToolSpec) -> ToolSpec:
+        if spec.access not in ACCESS_KINDS:
+            raise ValueError(f"{spec.name}: access must be one of {sorted(ACCESS_KINDS)}")
+        slots = threading.BoundedSemaphore(spec.max_concurrency) if spec.max_concurrency else None
+        entry = _Entry(spec, compile_schema(spec.parameters), slots)
+        with self._lock:
+            if spec.name in self._entries:
+                raise ValueError(f"tool already registered: {spec.name}")
+            self._entries[spec.name] = entry
+            self._schemas = None
+        return spec
+
+    def handler(self, spec: ToolSpec, **options: Any) -> Callable[[Handler], Handler]:
+        """Decorator registering the function as the handler of `spec`, with `options` overriding its fields."""
+
+        def decorate(function: Handler) -> Handler:
+            self.register(replace(spec, **options, handler=function))
+            return function
+
+        return decorate
+
+    def get(self, name: str) -> ToolSpec | None:
+        entry = self._entries.get(name)
+        return entry.spec if entry else None
+
+    def access(self, name: str) -> str:
+        entry = self._entries.get(name)
+        return entry.spec.access if entry else "barrier"
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def __iter__(self) -> Iterator[ToolSpec]:
+        return iter([entry.spec for entry in self._entries.values()])
+
+    def schemas(self) -> list[dict]:
+        """Function-calling schemas of every tool, rebuilt only after a registration."""
+        schemas = self._schemas
+        if schemas is None:
+            with self._lock:
+                schemas = self._schemas = [entry.spec.schema() for entry in self._entries.values()]
+        return schemas
+
+    def call(self, name: str, arguments: dict, handler: Handler | None = None) -> str:
+        """Run one tool call; `handler` replaces the registered one (an `Agent`'s own tools)."""
+        entry = self._entries.get(name)
+        if entry is None:
+            return "error: unknown tool"
+        error = entry.check(arguments, "arguments")
+        if error:
+            return f"error: invalid arguments for {name}: {error}"
+        if handler is None:
+            if entry.spec.handler is None:
+                return f"error: tool not available here: {name}"
+            try:
+                handler = entry.resolve()
+            except Exception as exc:
+                return f"error: cannot load tool {name}: {type(exc).__name__}: {exc}"
+        if entry.slots is None:
+            result = self._run(entry.spec, handler, arguments)
+        else:
+            with entry.slots:
+                result = self._run(entry.spec, handler, arguments)
+        return _cap(result if isinstance(result, str) else str(result), entry.spec.max_result_chars)
+
+    @staticmethod
+    def _run(spec: ToolSpec, handler: Handler, arguments: dict) -> Any:
+        if spec.timeout is None:
+            return handler(arguments)
+        # The handler keeps running after a timeout (threads cannot be stopped); only the caller moves on.
+        context = contextvars.copy_context()
+        future = _timeout_pool().submit(context.run, handler, arguments)
+        try:
+            return future.result(timeout=spec.timeout)
+        except FutureTimeoutError:
+            return f"error: {spec.name} timed out after {spec.timeout:g}s"
+
+
+REGISTRY = ToolRegistry()
+
+
+# -- plugins -----------------------------------------------------------
+
+
+def default_plugin_dirs() -> list[Path]:
+    override = os.getenv("AGENT_PLUGIN_DIRS", "").strip()
+    if override:
+        return [Path(part) for part in override.split(os.pathsep) if part]
+    return [Path(os.getenv("XDG_CONFIG_HOME", Path.home() / ".config")) / "mini-agent" / "plugins"]
+
+
+def default_plugin_index_path() -> Path:
+    override = os.getenv("AGENT_PLUGIN_INDEX", "").strip()
+    if override:
+        return Path(override)
+    return Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache")) / "mini-agent" / "plugins.json"
+
+
+def _literal_tools(source: str) -> list[dict] | None:
+    """The module's `TOOLS = [...]`, if it is a literal; the module is not executed."""
+    import ast
+
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == "TOOLS" for t in node.targets):
+            try:
+                tools = ast.literal_eval(node.value)
+            except ValueError:
+                return None
+            return tools if isinstance(tools, list) else None
+    return None
+
+
+def _manifests(tools: list[dict], location: str) -> list[dict]:
+    manifests = []
+    for tool in tools:
+        if not isinstance(tool, dict) or not all(isinstance(tool.get(key), str) for key in ("name", "description", "handler")):
+            raise ValueError("every entry of TOOLS needs name, description and handler strings")
+        manifests.append({**tool, "handler": f"{location}:{tool['handler']}"})
+    return manifests
+
+
+def _file_manifests(path: Path) -> list[dict]:
+    tools = _literal_tools(path.read_text(encoding="utf-8"))
+    if tools is None:
+        tools = _load_module(str(path)).TOOLS  # not a literal: import the file to read it
+    return _manifests(tools, str(path))
+
+
+def _module_manifests(module_name: str) -> list[dict]:
+    spec = importlib.util.find_spec(module_name)
+    tools = None
+    if spec is not None and spec.origin and spec.origin.endswith(".py"):
+        tools = _literal_tools(Path(spec.origin).read_text(encoding="utf-8"))
+    if tools is None:
+        tools = importlib.import_module(module_name).TOOLS
+    return _manifests(tools, module_name)
+
+
+def _sys_path_fingerprint() -> list[list]:
+    """Installing or removing a distribution changes the mtime of its site directory.
+
+    The first entry is skipped unless `-P` is in effect: it is the script's
+    directory or the working directory, which change often and hold no installs.
+    """
+    fingerprint = []
+    for entry in sys.path if sys.flags.safe_path else sys.path[1:]:
+        try:
+            fingerprint.append([entry, os.stat(entry or ".").st_mtime_ns])
+        except OSError:
+            continue
+    return fingerprint
+
+
+def _warn(message: str) -> None:
+    print(f"warning: {message}", file=sys.stderr)
+
+
+class PluginLoader:
+    """Find plugin tool manifests, through the on-disk index when nothing changed."""
+
+    def __init__(self, directories: list[Path] | None = None, index_path: Path | None = None) -> None:
+        self.directories = default_plugin_dirs() if directories is None else directories
+        self.index_path = index_path or default_plugin_index_path()
+
+    def discover(self) -> list[dict]:
+        index = self._read_index()
+        manifests: list[dict] = []
+        files: dict[str, dict] = {}
+        for directory in self.directories:
+            for path in sorted(directory.glob("*.py")) if directory.is_dir() else []:
+                if path.name.startswith("_"):
+                    continue
+                key = str(path.resolve())
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                entry = index["files"].get(key)
+                if not entry or entry["mtime_ns"] != st.st_mtime_ns or entry["size"] != st.st_size:
+                    entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "tools": []}
+                    try:
+                        entry["tools"] = _file_manifests(Path(key))
+                    except Exception as exc:  # a broken plugin must not stop the agent
+                        entry["error"] = f"{type(exc).__name__}: {exc}"
+                if entry.get("error"):
+                    _warn(f"skipping plugin {path}: {entry['error']}")
+                files[key] = entry
+                manifests += entry["tools"]
+
+        fingerprint = _sys_path_fingerprint()
+        entry_points = index["entry_points"]
+        if entry_points.get("fingerprint") != fingerprint:
+            entry_points = {"fingerprint": fingerprint, "tools": self._entry_point_manifests()}
+        manifests += entry_points["tools"]
+
+        if files != index["files"] or entry_points is not index["entry_points"]:
+            self._write_index({"files": files, "entry_points": entry_points})
+        return manifests
+
+    @staticmethod
+    def _entry_point_manifests() -> list[dict]:
+        from importlib.metadata import entry_points
+
+        manifests: list[dict] = []
+        for point in entry_points(group=ENTRY_POINT_GROUP):
+            try:
+                manifests += _module_manifests(point.module)
+            except Exception as exc:
+                _warn(f"skipping plugin entry point {point.name}: {type(exc).__name__}: {exc}")
+        return manifests
+
+    def _read_index(self) -> dict:
+        empty: dict = {"files": {}, "entry_points": {}}
+        try:
+            data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return empty
+        if not isinstance(data, dict) or data.get("version") != PLUGIN_INDEX_VERSION:
+            return empty
+        return {name: data[name] if isinstance(data.get(name), dict) else value for name, value in empty.items()}
+
+    def _write_index(self, index: dict) -> None:
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"version": PLUGIN_INDEX_VERSION, **index}), encoding="utf-8")
+            tmp.replace(self.index_path)
+        except OSError:
+            pass  # the index is only a cache
+
+
+def register_plugins(registry: ToolRegistry, loader: PluginLoader | None = None) -> list[str]:
+    """Register every plugin tool (handlers stay unimported); returns their names."""
+    names = []
+    for manifest in (loader or PluginLoader()).discover():
+        try:
+            spec = ToolSpec(
+                name=manifest["name"],
+                description=manifest["description"],
+                parameters=manifest.get("parameters") or {"type": "object", "properties": {}},
+                handler=manifest["handler"],
+                access=manifest.get("access", "barrier"),
+                timeout=float(manifest.get("timeout") or PLUGIN_TIMEOUT),
+                max_concurrency=manifest.get("max_concurrency"),
+                max_result_chars=int(manifest.get("max_result_chars") or MAX_RESULT_CHARS),
+            )
+            registry.register(spec)
+        except (ValueError, TypeError) as exc:
+            _warn(f"skipping plugin tool {manifest.get('name')}: {exc}")
+            continue
+        names.append(spec.name)
+    return names
@@ -1,68 +1,84 @@
-"""Tool definitions and registry."""
+"""Built-in tool definitions and their handlers, registered in `REGISTRY`."""
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import functools
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-import difflib
-import subprocess
-import ast
-import operator
+from typing import Iterator
+import mmap
 
+from .blob_store import BLOB_STORE
+from .file_cache import FILE_CACHE
+from .patch import FileChange, PatchError, plan_patch, preview_patch, region_diff
+from .shell import DEFAULT_TIMEOUT, MAX_TIMEOUT, PERSISTENT_SHELL, SHELL, ShellJob
+from .tool_registry import REGISTRY, ToolSpec, register_plugins
+from .workspace_index import DEFAULT_GLOB_RESULTS, DEFAULT_SEARCH_RESULTS, MAX_RESULTS, workspace_index
 
-@dataclass(frozen=True)
-class ToolSpec:
-    name: str
-    description: str
-    parameters: dict
 
+# Root directory that file and shell tools are confined to; the process working
+# directory unless a session set its own with `use_workspace()`.
+_WORKSPACE: ContextVar[Path | None] = ContextVar("workspace", default=None)
 
-_OPS: dict[type[ast.AST], object] = {
-    ast.Add: operator.add,
-    ast.Sub: operator.sub,
-    ast.Mult: operator.mul,
-    ast.Div: operator.truediv,
-    ast.Mod: operator.mod,
-    ast.Pow: operator.pow,
-}
 
+@functools.lru_cache(maxsize=16)
+def _resolved_cwd(cwd: str) -> Path:
+    return Path(cwd).resolve()
 
-def eval_math_expr(expr: str) -> float:
-    node = ast.parse(expr, mode="eval")
 
-    def _eval(n: ast.AST) -> float:
-        if isinstance(n, ast.Expression):
-            return _eval(n.body)
-        if isinstance(n, ast.Constant) and isinstance(n.value, (int, float)):
-            return float(n.value)
-        if isinstance(n, ast.UnaryOp) and isinstance(n.op, (ast.UAdd, ast.USub)):
-            val = _eval(n.operand)
-            return val if isinstance(n.op, ast.UAdd) else -val
-        if isinstance(n, ast.BinOp) and type(n.op) in _OPS:
-            left = _eval(n.left)
-            right = _eval(n.right)
-            return _OPS[type(n.op)](left, right)  # type: ignore[operator]
-        raise ValueError("Unsupported expression")
+def workspace_root() -> Path:
+    # Resolving walks every path component; cache it per working directory.
+    return _WORKSPACE.get() or _resolved_cwd(os.getcwd())
 
-    return _eval(node)
+
+@contextmanager
+def use_workspace(root: Path | None) -> Iterator[None]:
+    """Confine tools called in this context (thread or task) to `root`."""
+    token = _WORKSPACE.set(root.resolve() if root else None)
+    try:
+        yield
+    finally:
+        _WORKSPACE.reset(token)
 
 
 CALCULATOR = ToolSpec(
     name="calculator",
-    description="Evaluate a basic math expression (numbers and + - * / % ** with parentheses).",
+    description=(
+        "Evaluate math expressions: numbers, + - * / // % ** and parentheses, pi/e/tau, and "
+        "sqrt exp log log2 log10 sin cos tan asin acos atan atan2 sinh cosh tanh hypot floor ceil round abs min max. "
+        "Pass `expressions` to evaluate many at once, and `variables` for named values; "
+        "array values evaluate the expression for every position in one call."
+    ),
     parameters={
         "type": "object",
-        "properties": {"expression": {"type": "string"}},
-        "required": ["expression"],
+        "properties": {
+            "expression": {"type": "string"},
+            "expressions": {"type": "array", "items": {"type": "string"}},
+            "variables": {
+                "type": "object",
+                "description": "Name -> number, or name -> array of numbers (arrays must have equal length).",
+                "additionalProperties": {"anyOf": [{"type": "number"}, {"type": "array", "items": {"type": "number"}}]},
+            },
+        },
     },
 )
 
 READ_FILE = ToolSpec(
     name="read_file",
-    description="Read a text file from the project workspace by relative path.",
+    description=(
+        "Read a text file from the project workspace by relative path. "
+        "Large outputs are truncated; use offset/limit (1-based lines by default, or bytes) to read more."
+    ),
     parameters={
         "type": "object",
-        "properties": {"path": {"type": "string"}},
+        "properties": {
+            "path": {"type": "string"},
+            "offset": {"type": "integer", "description": "First line (1-based) or byte offset (0-based) to read."},
+            "limit": {"type": "integer", "description": "Number of lines or bytes to read."},
+            "unit": {"type": "string", "enum": ["lines", "bytes"]},
+        },
         "required": ["path"],
     },
 )
@@ -97,101 +113,429 @@ EDIT_FILE = ToolSpec(
     },
 )
 
+APPLY_PATCH = ToolSpec(
+    name="apply_patch",
+    description=(
+        "Change several places in one or more files at once, either as a list of edits "
+        "(path/target/replacement; each target must be unique unless replace_all=true) or as a unified diff "
+        "('--- a/path' / '+++ b/path' headers, /dev/null to create or delete). Everything is checked first, "
+        "shown as one diff for a single confirmation, and written all-or-nothing."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "edits": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "path": {"type": "string"},
+                        "target": {"type": "string"},
+                        "replacement": {"type": "string"},
+                        "replace_all": {"type": "boolean"},
+                    },
+                    "required": ["path", "target", "replacement"],
+                },
+            },
+            "patch": {"type": "string", "description": "Unified diff to apply."},
+        },
+    },
+)
+
 RUN_SHELL = ToolSpec(
     name="run_shell",
-    description="Run a shell command in the project root and return stdout/stderr.",
+    description=(
+        "Run a shell command in the project root and return stdout/stderr. "
+        "Long output keeps only its beginning and end. "
+        "Set background=true for long-running commands to get a job_id back immediately."
+    ),
     parameters={
         "type": "object",
         "properties": {
             "command": {"type": "string"},
+            "timeout": {
+                "type": "number",
+                "description": (
+                    f"Seconds before the command is killed (default {DEFAULT_TIMEOUT:.0f}; "
+                    "background jobs run until they finish unless this is given)."
+                ),
+            },
+            "background": {"type": "boolean"},
         },
         "required": ["command"],
     },
 )
 
+FETCH_BLOB_CHARS = 20_000
+
+JOB_STATUS = ToolSpec(
+    name="job_status",
+    description="Show the state, exit code and runtime of a background run_shell job.",
+    parameters={
+        "type": "object",
+        "properties": {"job_id": {"type": "string"}},
+        "required": ["job_id"],
+    },
+)
+
+JOB_OUTPUT = ToolSpec(
+    name="job_output",
+    description="Return the last bytes of stdout/stderr of a background run_shell job.",
+    parameters={
+        "type": "object",
+        "properties": {
+            "job_id": {"type": "string"},
+            "tail_bytes": {"type": "integer", "description": "How many trailing bytes per stream (default 4000)."},
+        },
+        "required": ["job_id"],
+    },
+)
+
+JOB_KILL = ToolSpec(
+    name="job_kill",
+    description="Stop a running background run_shell job.",
+    parameters={
+        "type": "object",
+        "properties": {"job_id": {"type": "string"}},
+        "required": ["job_id"],
+    },
+)
 
-TOOLS: dict[str, ToolSpec] = {
-    CALCULATOR.name: CALCULATOR,
-    READ_FILE.name: READ_FILE,
-    WRITE_FILE.name: WRITE_FILE,
-    EDIT_FILE.name: EDIT_FILE,
-    RUN_SHELL.name: RUN_SHELL,
-}
+FETCH_BLOB = ToolSpec(
+    name="fetch_blob",
+    description=(
+        "Read a tool output that was moved out of the conversation to save context. "
+        "Use the blob:<id> handle quoted in the shortened message."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "handle": {"type": "string"},
+            "offset": {"type": "integer", "description": "First character to return (default 0)."},
+            "limit": {"type": "integer", "description": f"Maximum characters to return (default {FETCH_BLOB_CHARS})."},
+        },
+        "required": ["handle"],
+    },
+)
+
+SEARCH_FILES = ToolSpec(
+    name="search_files",
+    description=(
+        "Search file contents in the workspace (indexed, respects .gitignore). "
+        "Returns path:line: text for matching lines, best files first, capped. Prefer this over grep in run_shell."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "pattern": {"type": "string", "description": "Text to find (a regex when regex=true)."},
+            "path": {"type": "string", "description": "Limit to this directory or file."},
+            "glob": {"type": "string", "description": "Only files matching this glob, e.g. *.py or src/**/*.ts."},
+            "regex": {"type": "boolean"},
+            "case_sensitive": {"type": "boolean"},
+            "max_results": {"type": "integer", "description": f"Maximum lines returned (default {DEFAULT_SEARCH_RESULTS})."},
+        },
+        "required": ["pattern"],
+    },
+)
+
+GLOB_FILES = ToolSpec(
+    name="glob_files",
+    description=(
+        "List workspace files matching a glob such as *.py or src/**/test_*.py (respects .gitignore), "
+        "most recently modified first, capped. Prefer this over find in run_shell."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "pattern": {"type": "string"},
+            "path": {"type": "string", "description": "Directory to search under."},
+            "max_results": {"type": "integer", "description": f"Maximum paths returned (default {DEFAULT_GLOB_RESULTS})."},
+        },
+        "required": ["pattern"],
+    },
+)
+
+
+_PLUGINS_LOADED = False
 
 
 def tool_specs() -> list[dict]:
-    return [
-        {
-            "type": "function",
-            "function": {
-                "name": tool.name,
-                "description": tool.description,
-                "parameters": tool.parameters,
-            },
-        }
-        for tool in TOOLS.values()
-    ]
+    """Function-calling schemas of every registered tool; plugins are discovered on the first call."""
+    global _PLUGINS_LOADED
+    if not _PLUGINS_LOADED:
+        _PLUGINS_LOADED = True
+        if os.getenv("AGENT_PLUGINS", "1").strip().lower() not in {"0", "false", "no"}:
+            register_plugins(REGISTRY)
+    return REGISTRY.schemas()
 
 
 def execute_tool(name: str, arguments: dict) -> str:
-    base_dir = Path.cwd().resolve()
+    return REGISTRY.call(name, arguments)
 
-    def _resolve_path(path_str: str) -> Path | None:
-        if not path_str:
-            return None
-        path = Path(path_str)
-        full = (base_dir / path).resolve() if not path.is_absolute() else path.resolve()
-        if base_dir not in full.parents and full != base_dir:
-            return None
-        return full
 
-    if name == "calculator":
-        expr = str(arguments.get("expression", ""))
+@REGISTRY.handler(CALCULATOR, access="pure")
+def _calculator(arguments: dict) -> str:
+    from .calculator import run_calculator
+
+    return run_calculator(arguments)
+
+
+@REGISTRY.handler(READ_FILE, access="read")
+def _read_file(arguments: dict) -> str:
+    path = resolve_path(str(arguments.get("path", "")))
+    if not path or not path.exists() or not path.is_file():
+        return "error: file not found or invalid path"
+    unit = str(arguments.get("unit") or "lines")
+    try:
+        offset = int(arguments["offset"]) if arguments.get("offset") is not None else None
+        limit = int(arguments["limit"]) if arguments.get("limit") is not None else None
+    except (TypeError, ValueError):
+        return "error: offset and limit must be integers"
+    return read_file_range(path, offset=offset, limit=limit, unit=unit)
+
+
+@REGISTRY.handler(WRITE_FILE, access="write")
+def _write_file(arguments: dict) -> str:
+    path = resolve_path(str(arguments.get("path", "")))
+    content = str(arguments.get("content", ""))
+    if not path:
+        return "error: invalid path"
+    if not path.parent.exists():
+        return "error: parent directory does not exist"
+    path.write_text(content, encoding="utf-8")
+    FILE_CACHE.store(path, content)
+    return "ok"
+
+
+@REGISTRY.handler(EDIT_FILE, access="write")
+def _edit_file(arguments: dict) -> str:
+    # Without an agent to confirm, only the preview is returned.
+    target = str(arguments.get("target", ""))
+    replacement = str(arguments.get("replacement", ""))
+    preview = preview_edit(str(arguments.get("path", "")), target, replacement)
+    if not preview:
+        return "error: edit preview failed"
+    diff, _updated = preview
+    return f"preview:\n{diff}"
+
+
+@REGISTRY.handler(APPLY_PATCH)
+def _apply_patch(arguments: dict) -> str:
+    try:
+        changes = plan_patch_arguments(arguments)
+    except PatchError as exc:
+        return f"error: {exc}"
+    return f"preview:\n{preview_patch(changes)}"
+
+
+@REGISTRY.handler(RUN_SHELL)
+def _run_shell(arguments: dict) -> str:
+    command = str(arguments.get("command", "")).strip()
+    if not command:
+        return "error: command must be non-empty"
+    background = bool(arguments.get("background"))
+    timeout: float | None = None
+    if arguments.get("timeout") or not background:
         try:
-            result = eval_math_expr(expr)
-            return str(result)
-        except Exception:
-            return "error: unsupported expression"
-    if name == "read_file":
-        path = _resolve_path(str(arguments.get("path", "")))
-        if not path or not path.exists() or not path.is_file():
-            return "error: file not found or invalid path"
-        return path.read_text(encoding="utf-8")
-    if name == "write_file":
-        path = _resolve_path(str(arguments.get("path", "")))
-        content = str(arguments.get("content", ""))
-        if not path:
+            timeout = float(arguments.get("timeout") or DEFAULT_TIMEOUT)
+        except (TypeError, ValueError):
+            return "error: timeout must be a number"
+        timeout = min(max(timeout, 1.0), MAX_TIMEOUT)
+    FILE_CACHE.distrust_all()
+    if background:
+        job = SHELL.start(command, workspace_root(), timeout=timeout)
+        return f"started job_id: {job.job_id}"
+    if PERSISTENT_SHELL is not None and _WORKSPACE.get() is None:
+        return PERSISTENT_SHELL.run(command, timeout=timeout)
+    return SHELL.run(command, workspace_root(), timeout=timeout)
+
+
+@REGISTRY.handler(FETCH_BLOB, access="pure")
+def _fetch_blob(arguments: dict) -> str:
+    text = BLOB_STORE.get(str(arguments.get("handle", "")))
+    if text is None:
+        return "error: unknown blob handle"
+    try:
+        offset = max(0, int(arguments.get("offset") or 0))
+        limit = max(1, int(arguments.get("limit") or FETCH_BLOB_CHARS))
+    except (TypeError, ValueError):
+        return "error: offset and limit must be integers"
+    chunk = text[offset : offset + limit]
+    if offset + limit < len(text):
+        chunk += f"\n[... {len(text) - offset - limit} more chars; continue with offset={offset + limit} ...]"
+    return chunk
+
+
+def _index_query(arguments: dict, default: int) -> tuple[str, int] | str:
+    """Scope (relative to the workspace) and result cap of a search, or an error."""
+    if not str(arguments.get("pattern", "")):
+        return "error: pattern must be non-empty"
+    base_dir = workspace_root()
+    scope = ""
+    if arguments.get("path"):
+        scoped = resolve_path(str(arguments["path"]))
+        if not scoped or not scoped.exists():
             return "error: invalid path"
-        if not path.parent.exists():
-            return "error: parent directory does not exist"
-        path.write_text(content, encoding="utf-8")
-        return "ok"
-    if name == "edit_file":
-        target = str(arguments.get("target", ""))
-        replacement = str(arguments.get("replacement", ""))
-        preview = preview_edit(str(arguments.get("path", "")), target, replacement)
-        if not preview:
-            return "error: edit preview failed"
-        diff, _updated = preview
-        return f"preview:\n{diff}"
-    if name == "run_shell":
-        command = str(arguments.get("command", "")).strip()
-        if not command:
-            return "error: command must be non-empty"
-        proc = subprocess.run(
-            command,
-            shell=True,
-            cwd=Path.cwd(),
-            capture_output=True,
-            text=True,
-            timeout=30,
-        )
-        return f"exit_code: {proc.returncode}\nstdout:\n{proc.stdout}\nstderr:\n{proc.stderr}"
-    return "error: unknown tool"
+        scope = scoped.relative_to(base_dir).as_posix() if scoped != base_dir else ""
+    try:
+        max_results = min(max(1, int(arguments.get("max_results") or default)), MAX_RESULTS)
+    except (TypeError, ValueError):
+        return "error: max_results must be an integer"
+    return scope, max_results
+
+
+@REGISTRY.handler(SEARCH_FILES, access="scan")
+def _search_files(arguments: dict) -> str:
+    query = _index_query(arguments, DEFAULT_SEARCH_RESULTS)
+    if isinstance(query, str):
+        return query
+    scope, max_results = query
+    return workspace_index(workspace_root()).search(
+        str(arguments["pattern"]),
+        scope=scope,
+        glob=str(arguments.get("glob") or ""),
+        regex=bool(arguments.get("regex")),
+        case_sensitive=bool(arguments.get("case_sensitive")),
+        max_results=max_results,
+    )
+
+
+@REGISTRY.handler(GLOB_FILES, access="scan")
+def _glob_files(arguments: dict) -> str:
+    query = _index_query(arguments, DEFAULT_GLOB_RESULTS)
+    if isinstance(query, str):
+        return query
+    scope, max_results = query
+    return workspace_index(workspace_root()).glob(str(arguments["pattern"]), scope=scope, max_results=max_results)
+
+
+def _job(arguments: dict) -> ShellJob | None:
+    return SHELL.jobs.get(str(arguments.get("job_id", "")))
+
+
+@REGISTRY.handler(JOB_STATUS, access="pure")
+def _job_status(arguments: dict) -> str:
+    job = _job(arguments)
+    return job.status() if job else "error: unknown job_id"
+
+
+@REGISTRY.handler(JOB_OUTPUT, access="pure")
+def _job_output(arguments: dict) -> str:
+    job = _job(arguments)
+    if not job:
+        return "error: unknown job_id"
+    try:
+        tail = int(arguments.get("tail_bytes") or 4000)
+    except (TypeError, ValueError):
+        return "error: tail_bytes must be an integer"
+    output = f"{job.status()}\nstdout (tail):\n{job.stdout.last(tail)}\nstderr (tail):\n{job.stderr.last(tail)}"
+    SHELL.forget(job.job_id)  # once it has finished, its output has now been read
+    return output
+
+
+@REGISTRY.handler(JOB_KILL)
+def _job_kill(arguments: dict) -> str:
+    job = _job(arguments)
+    if not job:
+        return "error: unknown job_id"
+    return "killed" if SHELL.kill(job.job_id) else "error: job is not running"
+
+
+READ_MAX_LINES = 2000
+READ_MAX_BYTES = 100_000
+_SNIFF_BYTES = 8192
+_COUNT_CHUNK = 16 * 1024 * 1024
+
+
+def _binary_summary(path: Path, head: bytes) -> str | None:
+    if b"\0" not in head:
+        try:
+            head.decode("utf-8")
+            return None
+        except UnicodeDecodeError as exc:
+            # A multi-byte character cut off at the sniff boundary is still text.
+            if exc.start >= len(head) - 3:
+                return None
+    return f"binary file: {path.name}, {path.stat().st_size} bytes, starts with {head[:16].hex(' ')}"
+
+
+def _count_newlines(mm: mmap.mmap, start: int) -> int:
+    count = 0
+    for pos in range(start, len(mm), _COUNT_CHUNK):
+        count += mm[pos : pos + _COUNT_CHUNK].count(b"\n")
+    return count
+
+
+def _truncation_marker(text: str, detail: str) -> str:
+    return ("" if text.endswith("\n") else "\n") + f"[truncated, {detail}]"
+
+
+def _cap_lines(text: str, first_line: int, more_lines: int) -> str:
+    lines = text.splitlines(keepends=True)
+    kept: list[str] = []
+    size = 0
+    for line in lines[:READ_MAX_LINES]:
+        size += len(line)
+        if size > READ_MAX_BYTES and kept:
+            break
+        kept.append(line)
+    remaining = len(lines) - len(kept) + more_lines
+    out = "".join(kept)
+    if remaining:
+        next_line = first_line + len(kept)
+        out += _truncation_marker(out, f"{remaining} more lines; continue with offset={next_line}")
+    return out
+
+
+def read_file_range(path: Path, offset: int | None = None, limit: int | None = None, unit: str = "lines") -> str:
+    """Read part of a file without decoding more of it than the output needs."""
+    size = path.stat().st_size
+    if size == 0:
+        return ""
+    with path.open("rb") as handle:
+        head = handle.read(_SNIFF_BYTES)
+    summary = _binary_summary(path, head)
+    if summary:
+        return summary
+    if offset is None and limit is None and size <= READ_MAX_BYTES:
+        try:
+            return _cap_lines(FILE_CACHE.read_text(path), 1, 0)
+        except UnicodeDecodeError:
+            pass  # invalid UTF-8 past the sniffed head: read it below, replacing bad bytes
+
+    with path.open("rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if unit == "bytes":
+            start = max(0, offset or 0)
+            length = min(limit if limit is not None else READ_MAX_BYTES, READ_MAX_BYTES)
+            end = min(size, start + max(0, length))
+            text = mm[start:end].decode("utf-8", errors="replace")
+            if end < size:
+                text += _truncation_marker(text, f"{size - end} more bytes; continue with offset={end} unit=bytes")
+            return text
+
+        first_line = max(1, offset or 1)
+        start = 0
+        for _ in range(first_line - 1):
+            newline = mm.find(b"\n", start)
+            if newline < 0:
+                return f"error: file has fewer than {first_line} lines"
+            start = newline + 1
+        wanted = min(limit if limit is not None else READ_MAX_LINES, READ_MAX_LINES)
+        end = start
+        for _ in range(max(0, wanted)):
+            if end >= size or end - start > READ_MAX_BYTES:
+                break
+            newline = mm.find(b"\n", end)
+            end = size if newline < 0 else newline + 1
+        text = mm[start:end].decode("utf-8", errors="replace")
+        more_lines = _count_newlines(mm, end)
+        if end < size and not mm[size - 1 : size] == b"\n":
+            more_lines += 1
+        return _cap_lines(text, first_line, more_lines)
 
 
 def resolve_path(path_str: str) -> Path | None:
-    base_dir = Path.cwd().resolve()
+    base_dir = workspace_root()
     if not path_str:
         return None
     path = Path(path_str)
@@ -207,20 +551,21 @@ def preview_edit(path_str: str, target: str, replacement: str) -> tuple[str, str
         return None
     if target == "":
         return None
-    text = path.read_text(encoding="utf-8")
+    text = FILE_CACHE.read_text(path)
     if target not in text:
         return None
     updated = text.replace(target, replacement, 1)
-    diff = "\n".join(
-        difflib.unified_diff(
-            text.splitlines(),
-            updated.splitlines(),
-            fromfile=str(path_str),
-            tofile=str(path_str),
-            lineterm="",
-        )
-    )
-    return diff, updated
+    return region_diff(text, updated, str(path_str)), updated
+
+
+def plan_patch_arguments(arguments: dict) -> list[FileChange]:
+    edits = arguments.get("edits") or []
+    patch = arguments.get("patch") or ""
+    if not isinstance(edits, list) or not isinstance(patch, str):
+        raise PatchError("edits must be a list and patch a string")
+    if not edits and not patch.strip():
+        raise PatchError("give edits or a patch")
+    return plan_patch(resolve_path, edits, patch)
 
 
 def apply_edit(path_str: str, updated: str) -> str:
@@ -228,4 +573,5 @@ def apply_edit(path_str: str, updated: str) -> str:
     if not path or not path.exists() or not path.is_file():
         return "error: file not found or invalid path"
     path.write_text(updated, encoding="utf-8")
+    FILE_CACHE.store(path, updated)
     return "ok"
@@ -0,0 +1,192 @@
+"""Lightweight spans for the agent loop, written as JSONL and Chrome trace events."""
+
+from __future__ import annotations
+
+import atexit
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Span:
+    """One timed operation; use as a context manager and attach attributes with `set()`."""
+
+    __slots__ = ("tracer", "kind", "attrs", "span_id", "parent_id", "start", "wall_start")
+
+    def __init__(self, tracer: Tracer, kind: str, attrs: dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.kind = kind
+        self.attrs = attrs
+        self.span_id = 0
+        self.parent_id: int | None = None
+        self.start = 0.0
+        self.wall_start = 0.0
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> Span:
+        self.tracer._push(self)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: object) -> None:
+        elapsed = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._pop(self, elapsed)
+
+
+class _NullSpan:
+    """Stand-in used when tracing is off, so call sites need no checks."""
+
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> _NullSpan:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collect spans for turns, model calls, tool calls, JSON parsing and confirmations.
+
+    Finished spans are appended to `jsonl_path` as they end; `chrome_path`
+    receives a Chrome trace-event file (open it in chrome://tracing or
+    Perfetto) on `close()`, which also prints a p50/p95 table per span kind.
+    """
+
+    def __init__(self, jsonl_path: str | Path | None = None, chrome_path: str | Path | None = None) -> None:
+        self.jsonl_path = Path(jsonl_path) if jsonl_path else None
+        self.chrome_path = Path(chrome_path) if chrome_path else None
+        self.enabled = bool(self.jsonl_path or self.chrome_path)
+        self.durations: dict[str, list[float]] = defaultdict(list)
+        self._events: list[dict[str, Any]] = []
+        self._thread_names: dict[int | None, str] = {}
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._file = None
+        self._closed = False
+        if self.jsonl_path:
+            self.jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self.jsonl_path.open("a", encoding="utf-8")
+
+    @classmethod
+    def from_env(cls) -> Tracer:
+        return cls(
+            os.getenv("AGENT_TRACE", "").strip() or None,
+            os.getenv("AGENT_TRACE_CHROME", "").strip() or None,
+        )
+
+    def span(self, kind: str, **attrs: Any) -> Span | _NullSpan:
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, kind, attrs)
+
+    def current(self) -> Span | _NullSpan:
+        """Innermost open span on this thread, for attaching attributes from deeper code."""
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else NULL_SPAN
+
+    def _push(self, span: Span) -> None:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        span.span_id = next(self._ids)
+        span.parent_id = stack[-1].span_id if stack else None
+        stack.append(span)
+
+    def _pop(self, span: Span, elapsed: float) -> None:
+        stack = self._local.stack
+        if stack and stack[-1] is span:
+            stack.pop()
+        thread = threading.current_thread()
+        record = {
+            "kind": span.kind,
+            "id": span.span_id,
+            "parent": span.parent_id,
+            "thread": thread.name,
+            "ts": round(span.wall_start, 6),
+            "duration_ms": round(elapsed * 1000, 3),
+            **span.attrs,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self.durations[span.kind].append(elapsed)
+            if self._file:
+                self._file.write(line + "\n")
+                self._file.flush()
+            if self.chrome_path:
+                self._thread_names[thread.ident] = thread.name
+                self._events.append(
+                    {
+                        "name": span.attrs.get("tool", span.kind),
+                        "cat": span.kind,
+                        "ph": "X",
+                        "ts": round((span.start - self._origin) * 1e6, 1),
+                        "dur": round(elapsed * 1e6, 1),
+                        "pid": os.getpid(),
+                        "tid": thread.ident,
+                        "args": {k: v for k, v in record.items() if k not in {"kind", "ts", "duration_ms"}},
+                    }
+                )
+
+    def summary(self) -> str:
+        lines = [f"{'span':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'total s':>10}"]
+        with self._lock:
+            items = sorted(self.durations.items())
+        for kind, values in items:
+            lines.append(
+                f"{kind:<14}{len(values):>7}{percentile(values, 50) * 1000:>10.1f}"
+                f"{percentile(values, 95) * 1000:>10.1f}{max(values) * 1000:>10.1f}{sum(values):>10.2f}"
+            )
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        if not self.enabled or self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            if self._file:
+                self._file.close()
+            if self.chrome_path:
+                pid = os.getpid()
+                meta = [
+                    {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                    for tid, name in self._thread_names.items()
+                ]
+                self.chrome_path.parent.mkdir(parents=True, exist_ok=True)
+                self.chrome_path.write_text(
+                    json.dumps({"traceEvents": meta + self._events, "displayTimeUnit": "ms"}, default=str),
+                    encoding="utf-8",
+                )
+        if self.durations:
+            print(self.summary(), file=sys.stderr)
+
+
+TRACER = Tracer.from_env()
+if TRACER.enabled:
+    atexit.register(TRACER.close)
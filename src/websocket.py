@@ -0,0 +1,191 @@
+"""Minimal RFC 6455 WebSocket framing over asyncio streams (text messages only)."""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+from typing import Any
+from urllib.parse import urlsplit
+
+_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_INVALID_DATA = 1007
+CLOSE_TOO_BIG = 1009
+
+
+class ProtocolError(ValueError):
+    """A frame or message the peer must not send; the connection is closed with `code`."""
+
+    def __init__(self, message: str, code: int = CLOSE_PROTOCOL_ERROR) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+def accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1((key + _GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def _mask(data: bytes, key: bytes) -> bytes:
+    if not data:
+        return data
+    repeated = (key * (len(data) // 4 + 1))[: len(data)]
+    return (int.from_bytes(data, "big") ^ int.from_bytes(repeated, "big")).to_bytes(len(data), "big")
+
+
+class WebSocket:
+    """One open WebSocket connection.
+
+    Clients must mask the frames they send and servers must not, so the
+    client side passes `client=True`.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, *, client: bool = False) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.client = client
+        self.closed = False
+
+    def _frame(self, opcode: int, payload: bytes) -> bytes:
+        length = len(payload)
+        mask_bit = 0x80 if self.client else 0
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, mask_bit | length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, mask_bit | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, mask_bit | 127, length)
+        if self.client:
+            key = os.urandom(4)
+            return header + key + _mask(payload, key)
+        return header + payload
+
+    async def _send(self, opcode: int, payload: bytes) -> None:
+        if self.closed:
+            raise ConnectionError("websocket is closed")
+        # One write per frame keeps frames from concurrent senders whole.
+        self.writer.write(self._frame(opcode, payload))
+        await self.writer.drain()
+
+    async def send(self, text: str) -> None:
+        await self._send(OP_TEXT, text.encode("utf-8"))
+
+    async def send_json(self, value: Any) -> None:
+        await self.send(json.dumps(value, ensure_ascii=False))
+
+    async def _read_frame(self) -> tuple[bool, int, bytes]:
+        first, second = await self.reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            (length,) = struct.unpack("!H", await self.reader.readexactly(2))
+        elif length == 127:
+            (length,) = struct.unpack("!Q", await self.reader.readexactly(8))
+        if length > MAX_MESSAGE_BYTES:
+            raise ProtocolError(f"websocket frame too large: {length} bytes", CLOSE_TOO_BIG)
+        masked = bool(second & 0x80)
+        if masked == self.client:
+            # Clients must mask every frame and servers must not (RFC 6455, section 5.1).
+            raise ProtocolError("masked frame from server" if self.client else "unmasked frame from client")
+        key = await self.reader.readexactly(4) if masked else b""
+        payload = await self.reader.readexactly(length)
+        return bool(first & 0x80), first & 0x0F, _mask(payload, key) if key else payload
+
+    async def receive(self) -> str | None:
+        """Next text message, or None once the connection is closed."""
+        parts: list[bytes] = []
+        size = 0
+        while not self.closed:
+            try:
+                fin, opcode, payload = await self._read_frame()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.closed = True
+                return None
+            except ProtocolError as exc:
+                await self.close(exc.code)
+                return None
+            if opcode == OP_PING:
+                await self._send(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                await self.close()
+                return None
+            size += len(payload)
+            if size > MAX_MESSAGE_BYTES:
+                await self.close(CLOSE_TOO_BIG)
+                return None
+            parts.append(payload)
+            if fin:
+                try:
+                    return b"".join(parts).decode("utf-8")
+                except UnicodeDecodeError:
+                    await self.close(CLOSE_INVALID_DATA)
+                    return None
+        return None
+
+    async def close(self, code: int = 1000) -> None:
+        if self.closed:
+            return
+        try:
+            self.writer.write(self._frame(OP_CLOSE, struct.pack("!H", code)))
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        self.closed = True
+        self.writer.close()
+
+
+def handshake_response(headers: dict[str, str]) -> bytes | None:
+    """The `101 Switching Protocols` reply for an upgrade request, or None if it is not one."""
+    if headers.get("upgrade", "").lower() != "websocket" or "sec-websocket-key" not in headers:
+        return None
+    return (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}\r\n\r\n"
+    ).encode("ascii")
+
+
+async def connect(url: str, headers: dict[str, str] | None = None) -> WebSocket:
+    """Open a client connection to a `ws://` URL."""
+    parts = urlsplit(url)
+    if parts.scheme != "ws":
+        raise ValueError(f"only ws:// URLs are supported: {url}")
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    lines = [
+        f"GET {path} HTTP/1.1",
+        f"Host: {parts.netloc}",
+        "Upgrade: websocket",
+        "Connection: Upgrade",
+        f"Sec-WebSocket-Key: {key}",
+        "Sec-WebSocket-Version: 13",
+        *(f"{name}: {value}" for name, value in (headers or {}).items()),
+    ]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("ascii"))
+    await writer.drain()
+    status = (await reader.readline()).decode("latin-1").strip()
+    response_headers: dict[str, str] = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        response_headers[name.strip().lower()] = value.strip()
+    if " 101 " not in f"{status} " or response_headers.get("sec-websocket-accept") != accept_key(key):
+        writer.close()
+        raise ConnectionError(f"websocket handshake failed: {status}")
+    return WebSocket(reader, writer, client=True)
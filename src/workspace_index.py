@@ -0,0 +1,404 @@
+"""Trigram index of workspace files behind the `search_files` and `glob_files` tools."""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from .file_cache import FILE_CACHE
+
+try:  # Python 3.11+
+    import re._parser as _sre_parse
+except ImportError:  # pragma: no cover - older Pythons
+    import sre_parse as _sre_parse  # type: ignore[no-redef]
+
+INDEX_VERSION = 1
+MAX_FILE_BYTES = int(os.getenv("AGENT_SEARCH_MAX_FILE_BYTES", str(1024 * 1024)))
+# Seconds between rescans when nothing we know of has written to the workspace.
+REFRESH_INTERVAL = float(os.getenv("AGENT_SEARCH_REFRESH", "2"))
+SAVE_INTERVAL = 30.0
+MAX_LINE_CHARS = 200
+MATCHES_PER_FILE = 10
+DEFAULT_SEARCH_RESULTS = 50
+DEFAULT_GLOB_RESULTS = 100
+MAX_RESULTS = 500
+ALWAYS_SKIP = {".git", ".hg", ".svn"}
+
+
+def default_index_path(root: Path) -> Path:
+    """Per-workspace index file under the user cache directory."""
+    override = os.getenv("AGENT_SEARCH_INDEX_DIR", "").strip()
+    cache_root = Path(override) if override else Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache")) / "mini-agent"
+    digest = hashlib.sha1(str(root).encode("utf-8")).hexdigest()[:16]
+    return cache_root / f"search-{digest}.json"
+
+
+def glob_to_regex(pattern: str) -> str:
+    """Translate a gitignore-style glob (`*`, `?`, `[...]`, `**`) to a regex over `/`-separated paths."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+                i = end + 1
+                continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+@dataclass(frozen=True)
+class _IgnoreRule:
+    base: str  # directory of the .gitignore, relative to the root ("" for the root)
+    regex: re.Pattern[str]
+    negate: bool
+    dir_only: bool
+    anchored: bool
+
+    def matches(self, rel: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.base:
+            if not rel.startswith(self.base + "/"):
+                return False
+            rel = rel[len(self.base) + 1 :]
+        return bool(self.regex.fullmatch(rel if self.anchored else name))
+
+
+def parse_gitignore(text: str, base: str) -> list[_IgnoreRule]:
+    rules = []
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        line = line.removeprefix("\\")
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if not line:
+            continue
+        rules.append(_IgnoreRule(base, re.compile(glob_to_regex(line)), negate, dir_only, anchored))
+    return rules
+
+
+def _ignored(rules: list[_IgnoreRule], rel: str, name: str, is_dir: bool) -> bool:
+    ignored = False
+    for rule in rules:
+        if rule.negate == ignored and rule.matches(rel, name, is_dir):
+            ignored = not rule.negate
+    return ignored
+
+
+def trigrams(text: str) -> set[str]:
+    text = text.lower()
+    return set(map("".join, zip(text, text[1:], text[2:])))
+
+
+def required_literals(pattern: str, flags: int = 0) -> list[str]:
+    """Literal runs every match of `pattern` must contain (top level of the regex only)."""
+    try:
+        parsed = _sre_parse.parse(pattern, flags)
+    except re.error:
+        return []
+    runs: list[str] = []
+    current: list[str] = []
+    for op, value in parsed:
+        if op is _sre_parse.LITERAL:
+            current.append(chr(value))
+            continue
+        if current:
+            runs.append("".join(current))
+            current = []
+    if current:
+        runs.append("".join(current))
+    return runs
+
+
+class WorkspaceIndex:
+    """File list and content trigrams of one workspace, kept current by (mtime_ns, size).
+
+    A refresh stats every file but only re-reads the ones that changed, and is
+    skipped entirely within `REFRESH_INTERVAL` unless `FILE_CACHE` saw a write.
+    Directories and files matched by `.gitignore` (at any level) are left out.
+    """
+
+    def __init__(self, root: Path, index_path: Path | None = None) -> None:
+        self.root = root
+        self.index_path = index_path or default_index_path(root)
+        self._files: dict[str, dict] = self._read_index()
+        self._postings: dict[str, set[str]] = {}
+        for rel, entry in self._files.items():
+            self._post(rel, entry.get("tri"))
+        self._lock = threading.Lock()
+        self._refreshed_at = float("-inf")
+        self._generation = -1
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    # -- maintenance ---------------------------------------------------
+
+    def refresh(self, force: bool = False) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if not force and FILE_CACHE.generation == self._generation and now - self._refreshed_at < REFRESH_INTERVAL:
+                return
+            self._generation = FILE_CACHE.generation
+            seen: set[str] = set()
+            for rel, st in self._scan():
+                seen.add(rel)
+                entry = self._files.get(rel)
+                if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                    continue
+                if entry:
+                    self._unpost(rel, entry.get("tri"))
+                entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "tri": self._file_trigrams(rel, st.st_size)}
+                self._files[rel] = entry
+                self._post(rel, entry["tri"])
+                self._dirty = True
+            for rel in self._files.keys() - seen:
+                self._unpost(rel, self._files.pop(rel).get("tri"))
+                self._dirty = True
+            self._refreshed_at = time.monotonic()
+            if self._dirty and self._refreshed_at - self._saved_at >= SAVE_INTERVAL:
+                self._write_index()
+
+    def save(self) -> None:
+        with self._lock:
+            if self._dirty:
+                self._write_index()
+
+    def _scan(self) -> Iterator[tuple[str, os.stat_result]]:
+        stack: list[tuple[str, str, list[_IgnoreRule]]] = [(str(self.root), "", [])]
+        while stack:
+            current, rel_dir, rules = stack.pop()
+            try:
+                gitignore = Path(current, ".gitignore").read_text(encoding="utf-8", errors="replace")
+            except OSError:
+                pass
+            else:
+                rules = rules + parse_gitignore(gitignore, rel_dir)
+            try:
+                with os.scandir(current) as entries:
+                    listing = list(entries)
+            except OSError:
+                continue
+            for entry in listing:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if not is_dir and not entry.is_file(follow_symlinks=False):
+                        continue
+                except OSError:
+                    continue
+                if is_dir and entry.name in ALWAYS_SKIP:
+                    continue
+                if rules and _ignored(rules, rel, entry.name, is_dir):
+                    continue
+                if is_dir:
+                    stack.append((entry.path, rel, rules))
+                    continue
+                try:
+                    yield rel, entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+    def _file_trigrams(self, rel: str, size: int) -> str | None:
+        """Sorted trigrams concatenated into one string, or None for binary and oversized files."""
+        if size > MAX_FILE_BYTES:
+            return None
+        try:
+            data = (self.root / rel).read_bytes()
+        except OSError:
+            return None
+        if b"\0" in data[:8192]:
+            return None
+        return "".join(sorted(trigrams(data.decode("utf-8", errors="replace"))))
+
+    def _post(self, rel: str, tri: str | None) -> None:
+        if tri is None:
+            return
+        for i in range(0, len(tri), 3):
+            self._postings.setdefault(tri[i : i + 3], set()).add(rel)
+
+    def _unpost(self, rel: str, tri: str | None) -> None:
+        if tri is None:
+            return
+        for i in range(0, len(tri), 3):
+            posting = self._postings.get(tri[i : i + 3])
+            if posting is not None:
+                posting.discard(rel)
+                if not posting:
+                    del self._postings[tri[i : i + 3]]
+
+    def _read_index(self) -> dict[str, dict]:
+        try:
+            data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if data.get("version") != INDEX_VERSION or data.get("root") != str(self.root):
+            return {}
+        return data.get("files", {})
+
+    def _write_index(self) -> None:
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_suffix(".tmp")
+            payload = {"version": INDEX_VERSION, "root": str(self.root), "files": self._files}
+            tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(self.index_path)
+        except OSError:
+            pass  # the index is only a cache
+
+    # -- queries -------------------------------------------------------
+
+    def _in_scope(self, rel: str, scope: str, glob: re.Pattern[str] | None) -> bool:
+        if scope and not rel.startswith(scope + "/") and rel != scope:
+            return False
+        if glob is None:
+            return True
+        return bool(glob.fullmatch(rel) or glob.fullmatch(rel.rsplit("/", 1)[-1]))
+
+    def candidates(self, literals: list[str]) -> list[str]:
+        """Content-indexed files that contain every trigram of every literal."""
+        needed = set()
+        for literal in literals:
+            needed |= trigrams(literal)
+        with self._lock:
+            if not needed:
+                return [rel for rel, entry in self._files.items() if entry.get("tri") is not None]
+            postings = sorted((self._postings.get(t, set()) for t in needed), key=len)
+            result = set(postings[0])
+            for posting in postings[1:]:
+                result &= posting
+                if not result:
+                    break
+            return list(result)
+
+    def search(
+        self,
+        pattern: str,
+        *,
+        scope: str = "",
+        glob: str = "",
+        regex: bool = False,
+        case_sensitive: bool = False,
+        max_results: int = DEFAULT_SEARCH_RESULTS,
+    ) -> str:
+        self.refresh()
+        flags = 0 if case_sensitive else re.IGNORECASE
+        try:
+            compiled = re.compile(pattern if regex else re.escape(pattern), flags)
+        except re.error as exc:
+            return f"error: invalid regex: {exc}"
+        literals = required_literals(pattern, flags) if regex else [pattern]
+        glob_re = re.compile(glob_to_regex(glob)) if glob else None
+        lowered = pattern.lower()
+        hits: list[tuple[tuple, str, list[str]]] = []
+        total = 0
+        for rel in self.candidates(literals):
+            if not self._in_scope(rel, scope, glob_re):
+                continue
+            try:
+                text = FILE_CACHE.read_text(self.root / rel)
+            except (OSError, UnicodeDecodeError):
+                continue
+            lines = []
+            count = 0
+            for number, line in enumerate(text.splitlines(), 1):
+                if compiled.search(line):
+                    count += 1
+                    if len(lines) < MATCHES_PER_FILE:
+                        shown = line.strip()
+                        if len(shown) > MAX_LINE_CHARS:
+                            shown = shown[:MAX_LINE_CHARS] + "…"
+                        lines.append(f"{rel}:{number}: {shown}")
+            if not count:
+                continue
+            total += count
+            # Files whose path mentions the query first, then the densest, then the shallowest.
+            hits.append(((lowered not in rel.lower(), -count, rel.count("/"), rel), rel, lines))
+        if not hits:
+            return "no matches"
+        hits.sort(key=lambda hit: hit[0])
+        out: list[str] = []
+        for _key, _rel, lines in hits:
+            for line in lines:
+                if len(out) >= max_results:
+                    break
+                out.append(line)
+        if len(out) < total:
+            out.append(f"[{total} matches in {len(hits)} files, {len(out)} shown; narrow with path or glob]")
+        return "\n".join(out)
+
+    def glob(self, pattern: str, *, scope: str = "", max_results: int = DEFAULT_GLOB_RESULTS) -> str:
+        self.refresh()
+        compiled = re.compile(glob_to_regex(pattern))
+        with self._lock:
+            matched = []
+            for rel, entry in self._files.items():
+                if scope and not rel.startswith(scope + "/"):
+                    continue
+                local = rel[len(scope) + 1 :] if scope else rel
+                target = local if "/" in pattern else local.rsplit("/", 1)[-1]
+                if compiled.fullmatch(target):
+                    matched.append((entry["mtime_ns"], rel))
+        if not matched:
+            return "no files match"
+        matched.sort(key=lambda item: (-item[0], item[1]))  # most recently modified first
+        out = [rel for _mtime, rel in matched[:max_results]]
+        if len(matched) > max_results:
+            out.append(f"[{len(matched)} files match, {max_results} shown; narrow the pattern or path]")
+        return "\n".join(out)
+
+
+_INDEXES: dict[Path, WorkspaceIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def workspace_index(root: Path) -> WorkspaceIndex:
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(root)
+        if index is None:
+            index = _INDEXES[root] = WorkspaceIndex(root)
+        return index
+
+
+@atexit.register
+def _save_indexes() -> None:
+    for index in list(_INDEXES.values()):
+        index.save()